@@ -0,0 +1,217 @@
+import json
+import os
+import queue
+import shutil
+import threading
+from dwidgets.retakecanvas.serialize import (
+    ImageStore, data_to_model, images_directory, layer_to_data,
+    state_to_data)
+
+
+JOURNAL_EXTENSION = '.journal'
+STATE_KEYS = 'imagestack', 'imagestack_wipes', 'layers'
+# Worker commands.
+_STOP = 'stop'
+_RESET = 'reset'
+_DISCARD = 'discard'
+
+
+class Autosave:
+    """
+    Journal the model undo states in a background thread.
+    Each undo state appends one record to the journal with the document
+    settings and the layers which changed since the previous record. The
+    main thread only takes a shallow copy of the undo state (which is already
+    a snapshot), the serialization and the disk writes are done by the
+    worker. When several states are queued, only the last one is written.
+    The journal is compacted (rewritten as a single full record) every
+    COMPACT_RECORDS records. It is only created by the first change after
+    start() or reset(), an unchanged document leaves no journal.
+    The main thread never waits for the worker: stop(), reset() and
+    discard() are queued after the pending state.
+    RetakeCanvas.set_session_path starts it and offers the recovery. Without
+    the widget, the application drives it:
+        journal = journal_path(session_path)
+        model = recover(journal) or load_session(session_path)
+        autosave = Autosave(model, journal)
+        autosave.start()
+        ...
+        save_session(model, session_path)
+        autosave.reset()
+        ...
+        # Clean close.
+        autosave.discard()
+    """
+    COMPACT_RECORDS = 200
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self.store = ImageStore(images_directory(path))
+        self.queue = queue.Queue()
+        self.thread = None
+        self.records = 0
+        # Json of the layers written, by index.
+        self.written_layers = []
+
+    @property
+    def is_running(self):
+        return self.thread is not None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        # The first record replaces the existing journal.
+        self.records = self.COMPACT_RECORDS
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.model.state_callbacks.append(self.push)
+
+    def stop(self):
+        """
+        Stop journaling. The worker writes the pending state and exits, the
+        journal is kept.
+        """
+        if self.thread is None:
+            return
+        self.model.state_callbacks.remove(self.push)
+        self.queue.put(_STOP)
+        self.thread = None
+
+    def reset(self):
+        """
+        Remove the journal and its images, the next change starts a new
+        one. To call when the session is saved.
+        """
+        if self.thread is None:
+            self._remove()
+            return
+        self.queue.put(_RESET)
+
+    def discard(self):
+        """
+        Stop and remove the journal and its images. To call on a clean
+        close.
+        """
+        if self.thread is None:
+            self._remove()
+            return
+        self.model.state_callbacks.remove(self.push)
+        self.queue.put(_DISCARD)
+        self.thread = None
+
+    def _remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        shutil.rmtree(self.store.directory, ignore_errors=True)
+        # The images saved by the store don't exist anymore.
+        self.store = ImageStore(self.store.directory)
+        self.records = self.COMPACT_RECORDS
+        self.written_layers = []
+
+    def push(self, model):
+        if model.undostack:
+            state = dict(model.undostack[-1])
+        else:
+            state = model.default_state()
+        # Some lists of the current state are shared with the model.
+        for key in STATE_KEYS:
+            state[key] = list(state[key])
+        self.queue.put((state, model.baseimage, model.imagestack_layout))
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            while not self.queue.empty():
+                items.append(self.queue.get())
+            # Only the last state matters, the states queued before a reset
+            # are dropped.
+            state = None
+            for item in items:
+                if item in (_RESET, _DISCARD):
+                    state = None
+                    self._remove()
+                elif item != _STOP:
+                    state = item
+            if state is not None:
+                self._write(*state)
+            if _STOP in items or _DISCARD in items:
+                return
+
+    def _write(self, state, baseimage, layout):
+        data = state_to_data(state, baseimage, layout, self.store, False)
+        layers = [
+            layer_to_data(layer, self.store) for layer in state['layers']]
+        dumps = [json.dumps(layer) for layer in layers]
+        compact = (
+            self.records >= self.COMPACT_RECORDS or
+            not os.path.exists(self.path))
+        if compact:
+            record = {'type': 'full', 'state': data, 'layers': layers}
+            temp = self.path + '.tmp'
+            with open(temp, 'w') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+            self.records = 1
+        else:
+            changed = {
+                i: layer for i, (layer, dump) in enumerate(zip(layers, dumps))
+                if i >= len(self.written_layers) or
+                self.written_layers[i] != dump}
+            record = {'type': 'patch', 'state': data, 'layers': changed}
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.records += 1
+        self.written_layers = dumps
+
+
+def journal_path(session_path):
+    return session_path + JOURNAL_EXTENSION
+
+
+def has_journal(path):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def read_journal(path):
+    """
+    Replay the journal records and return the last document data. A record
+    truncated by a crash is ignored.
+    """
+    data = None
+    layers = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            state = record['state']
+            if record['type'] == 'full':
+                layers = list(record['layers'])
+            else:
+                count = state['layer_count']
+                layers = layers[:count] + [None] * (count - len(layers))
+                for index, layer in record['layers'].items():
+                    layers[int(index)] = layer
+            data = state
+    if data is None or None in layers:
+        return None
+    data['layers'] = layers
+    return data
+
+
+def recover(path, model=None):
+    """
+    Return a model restored from the journal or None.
+    """
+    if not has_journal(path):
+        return None
+    data = read_journal(path)
+    if data is None:
+        return None
+    return data_to_model(data, ImageStore(images_directory(path)), model)
@@ -0,0 +1,343 @@
+"""
+Benchmark the retake canvas on synthetic documents and write the results to
+json:
+    python -m dwidgets.retakecanvas.benchmark -o results.json
+    python -m dwidgets.retakecanvas.benchmark --baseline results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.canvas import render_model
+from dwidgets.retakecanvas.export import peak_memory
+from dwidgets.retakecanvas.model import UNDOLIMIT, RetakeCanvasModel
+from dwidgets.retakecanvas.qtutils import COLORS
+from dwidgets.retakecanvas.shapes import Bitmap, Stroke, Text
+from dwidgets.retakecanvas.tools.erasertool import (
+    erase_on_layer, filter_point_to_erase_from_line)
+from dwidgets.retakecanvas.tools.movetool import RectSelectionQuery
+
+
+LAYOUTS = {
+    'grid': RetakeCanvasModel.GRID,
+    'stacked': RetakeCanvasModel.STACKED,
+    'horizontal': RetakeCanvasModel.HORIZONTAL,
+    'vertical': RetakeCanvasModel.VERTICAL}
+IMAGE_SIZE = 1920, 1080
+VIEWPORT_SIZE = 1280, 720
+# A benchmark is reported as regression if slower than the baseline by more
+# than this ratio.
+THRESHOLD = 1.2
+_application = None
+
+
+def _initialize_application():
+    global _application
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    _application = (
+        QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([]))
+
+
+def synthetic_image(width, height, color):
+    image = QtGui.QImage(width, height, QtGui.QImage.Format_ARGB32)
+    gradient = QtGui.QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QtGui.QColor(color))
+    gradient.setColorAt(1, QtCore.Qt.black)
+    painter = QtGui.QPainter(image)
+    painter.fillRect(image.rect(), gradient)
+    painter.end()
+    return image
+
+
+def synthetic_stroke(rng, width, height, points):
+    """
+    Random walk stroke with a varying pressure size.
+    """
+    x, y = rng.uniform(0, width), rng.uniform(0, height)
+    stroke = Stroke(None, rng.choice(COLORS), None)
+    values = []
+    for _ in range(points):
+        x = min(max(x + rng.uniform(-8, 8), 0), width)
+        y = min(max(y + rng.uniform(-8, 8), 0), height)
+        values.append([QtCore.QPointF(x, y), rng.uniform(2, 12)])
+    stroke.points = values
+    return stroke
+
+
+def synthetic_model(
+        layers=5, strokes=200, points=50, bitmaps=2, texts=5, images=3,
+        layout=RetakeCanvasModel.GRID, seed=0):
+    """
+    Return a RetakeCanvasModel with a base image, comparing images and
+    layers of random strokes, bitmaps and texts.
+    """
+    rng = random.Random(seed)
+    width, height = IMAGE_SIZE
+    model = RetakeCanvasModel(synthetic_image(width, height, COLORS[0]))
+    for i in range(images):
+        color = COLORS[(i + 1) % len(COLORS)]
+        model.append_image(synthetic_image(width, height, color))
+    model.imagestack_layout = layout
+    for i in range(layers):
+        model.add_layer(undo=False, name=f'Layer {i}')
+        shapes = model.layerstack.current
+        shapes.extend(
+            synthetic_stroke(rng, width, height, points)
+            for _ in range(strokes))
+        for _ in range(bitmaps):
+            image = synthetic_image(256, 256, rng.choice(COLORS))
+            rect = QtCore.QRectF(
+                rng.uniform(0, width - 256), rng.uniform(0, height - 256),
+                256, 256)
+            shapes.append(Bitmap(image, rect))
+        for j in range(texts):
+            start = QtCore.QPointF(
+                rng.uniform(0, width - 300), rng.uniform(0, height - 100))
+            text = Text(
+                start, f'Retake note {j}', rng.choice(COLORS), COLORS[0],
+                128, 5, rng.random() > 0.5)
+            text.end = start + QtCore.QPointF(300, 100)
+            shapes.append(text)
+    model.add_undo_state()
+    return model
+
+
+def timings(function, repeat):
+    """
+    Call the function repeat times, return the durations stats in
+    milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'mean': statistics.mean(durations),
+        'max': max(durations),
+        'repeat': repeat}
+
+
+def fitted_viewportmapper(model):
+    viewportmapper = model.viewportmapper
+    viewportmapper.viewsize = QtCore.QSize(*VIEWPORT_SIZE)
+    viewportmapper.focus(model.images_layout().global_rect)
+    return viewportmapper
+
+
+def benchmark_paint(model, repeat):
+    """
+    Canvas paint at the viewport size with the scaled images cache kept
+    between the paints, as the Canvas does.
+    """
+    image = QtGui.QImage(*VIEWPORT_SIZE, QtGui.QImage.Format_RGB32)
+    viewportmapper = fitted_viewportmapper(model)
+    scaled_images = {}
+
+    def paint():
+        painter = QtGui.QPainter(image)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        try:
+            render_model(model, painter, viewportmapper, scaled_images)
+        finally:
+            painter.end()
+
+    return timings(paint, repeat)
+
+
+def benchmark_export(model, repeat):
+    return timings(lambda: render_model(model), repeat)
+
+
+def benchmark_undo(model, repeat):
+    """
+    The timings are limited to the undo stack size: past it, add_undo_state
+    drops the oldest states and undo would run out of states.
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    model.add_undo_state()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    state_memory = sum(
+        stat.size_diff for stat in after.compare_to(before, 'filename'))
+    repeat = min(repeat, UNDOLIMIT - 2)
+    results = {
+        'add_undo_state': timings(model.add_undo_state, repeat),
+        'undo': timings(model.undo, repeat),
+        'undo_state_bytes': state_memory}
+    # Leave the model in its initial state.
+    model.redostack = []
+    return results
+
+
+def random_points(model, count, seed=0):
+    rng = random.Random(seed)
+    rect = model.images_layout().baseimage_rect
+    return [
+        QtCore.QPointF(
+            rng.uniform(rect.left(), rect.right()),
+            rng.uniform(rect.top(), rect.bottom()))
+        for _ in range(count)]
+
+
+def benchmark_find_element(model, repeat):
+    points = iter(random_points(model, repeat))
+    return timings(
+        lambda: model.layerstack.find_element_at(next(points)), repeat)
+
+
+def benchmark_eraser(model, repeat, width=10):
+    """
+    Eraser drag segments on a copy of the current layer.
+    """
+    shapes = model.layerstack.current_layer.snapshot().shapes
+    points = random_points(model, repeat + 1, seed=1)
+    lines = iter(
+        QtCore.QLineF(start, end) for start, end in zip(points, points[1:]))
+
+    def erase():
+        line = next(lines)
+        points_to_erase = filter_point_to_erase_from_line(line, width, shapes)
+        erase_on_layer(points_to_erase, shapes)
+
+    return timings(erase, repeat)
+
+
+def benchmark_selection(model, repeat):
+    """
+    Updates of a rectangle selection growing over the current layer.
+    """
+    query = RectSelectionQuery(model.layerstack.current)
+    rect = model.images_layout().baseimage_rect
+    step = QtCore.QPointF(rect.width(), rect.height()) / repeat
+    rects = iter(
+        QtCore.QRectF(rect.topLeft(), rect.topLeft() + step * (i + 1))
+        for i in range(repeat))
+    return timings(lambda: query.update(next(rects)), repeat)
+
+
+def run_benchmarks(
+        layers=5, strokes=200, points=50, bitmaps=2, texts=5, images=3,
+        repeat=10, seed=0, log=print):
+    """
+    Run all the benchmarks on synthetic documents, one per images layout.
+    Return the results as a json compatible dict.
+    """
+    parameters = {
+        'layers': layers, 'strokes': strokes, 'points': points,
+        'bitmaps': bitmaps, 'texts': texts, 'images': images,
+        'repeat': repeat, 'seed': seed}
+    results = {}
+    for name, layout in LAYOUTS.items():
+        log(f'{name} layout...')
+        model = synthetic_model(
+            layers, strokes, points, bitmaps, texts, images, layout, seed)
+        results[name] = {
+            'paint': benchmark_paint(model, repeat),
+            'export': benchmark_export(model, max(1, repeat // 5))}
+        if name != 'grid':
+            continue
+        # The documents only differ by their images layout.
+        results['document'] = {
+            'find_element_at': benchmark_find_element(model, repeat),
+            'eraser': benchmark_eraser(model, repeat),
+            'selection': benchmark_selection(model, repeat),
+            **benchmark_undo(model, repeat)}
+    return {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'qt': QtCore.qVersion(),
+        'platform': platform.platform(),
+        'qpa_platform': QtGui.QGuiApplication.platformName(),
+        'parameters': parameters,
+        'results': results,
+        'peak_memory': peak_memory()}
+
+
+def flatten_timings(results, prefix=''):
+    """
+    Return {'layout/benchmark': median milliseconds}.
+    """
+    medians = {}
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        if 'median' in value:
+            medians[prefix + key] = value['median']
+        else:
+            medians.update(flatten_timings(value, f'{prefix}{key}/'))
+    return medians
+
+
+def regressions(baseline, current, threshold=THRESHOLD):
+    """
+    Return the (benchmark, baseline ms, current ms) slower than the baseline
+    by more than the threshold ratio.
+    """
+    baseline = flatten_timings(baseline['results'])
+    current = flatten_timings(current['results'])
+    return [
+        (name, baseline[name], median)
+        for name, median in sorted(current.items())
+        if name in baseline and median > baseline[name] * threshold]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m dwidgets.retakecanvas.benchmark',
+        description='Benchmark the retake canvas on synthetic documents.')
+    parser.add_argument('-o', '--output', help='Json results file.')
+    parser.add_argument(
+        '-b', '--baseline',
+        help='Json results to compare with. Exit with 1 on regression.')
+    parser.add_argument(
+        '--threshold', type=float, default=THRESHOLD,
+        help='Slowdown ratio reported as regression (default: 1.2).')
+    parser.add_argument('--layers', type=int, default=5)
+    parser.add_argument(
+        '--strokes', type=int, default=200, help='Strokes per layer.')
+    parser.add_argument(
+        '--points', type=int, default=50, help='Points per stroke.')
+    parser.add_argument(
+        '--bitmaps', type=int, default=2, help='Bitmaps per layer.')
+    parser.add_argument(
+        '--texts', type=int, default=5, help='Texts per layer.')
+    parser.add_argument(
+        '--images', type=int, default=3, help='Comparing images.')
+    parser.add_argument('-r', '--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args(argv)
+    _initialize_application()
+    report = run_benchmarks(
+        arguments.layers, arguments.strokes, arguments.points,
+        arguments.bitmaps, arguments.texts, arguments.images,
+        arguments.repeat, arguments.seed,
+        log=lambda message: print(message, file=sys.stderr))
+    text = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if not arguments.baseline:
+        return 0
+    with open(arguments.baseline) as f:
+        baseline = json.load(f)
+    slower = regressions(baseline, report, arguments.threshold)
+    for name, before, after in slower:
+        print(f'{name}: {before:.2f}ms -> {after:.2f}ms')
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import math
+import random
+from PySide2 import QtCore, QtGui
+
+
+# Maximum number of dab images kept by a brush.
+DAB_CACHE_SIZE = 256
+NOISE_SIZE = 128
+_noise = None
+
+
+def noise_texture():
+    """
+    Alpha noise tiled over the textured brush dabs. Generated once with a
+    fixed seed so the grain is the same from a session to another.
+    """
+    global _noise
+    if _noise is None:
+        generator = random.Random(0)
+        data = bytes(
+            generator.randrange(64, 256)
+            for _ in range(NOISE_SIZE * NOISE_SIZE))
+        image = QtGui.QImage(
+            data, NOISE_SIZE, NOISE_SIZE, NOISE_SIZE,
+            QtGui.QImage.Format_Alpha8)
+        # Detach from the python buffer.
+        _noise = image.copy()
+    return _noise
+
+
+class Brush:
+    """
+    Raster brush settings and dab images.
+    hardness: fraction of the radius painted at full opacity.
+    spacing: distance between two dabs as a fraction of the dab size.
+    flow: opacity of a dab at full pressure. The dabs accumulate, so the
+        airbrush builds up the color while it is painted over.
+    """
+    SOFT = 0
+    TEXTURED = 1
+    AIRBRUSH = 2
+    NAMES = {SOFT: 'Soft round', TEXTURED: 'Textured', AIRBRUSH: 'Airbrush'}
+    # style: (hardness, spacing, flow)
+    PRESETS = {
+        SOFT: (0.5, 0.15, 1.0),
+        TEXTURED: (0.8, 0.25, 0.8),
+        AIRBRUSH: (0.0, 0.05, 0.08)}
+
+    def __init__(self, style=SOFT):
+        self.dabs = {}
+        self.set_style(style)
+
+    def set_style(self, style):
+        self.style = style
+        self.hardness, self.spacing, self.flow = self.PRESETS[style]
+        self.dabs = {}
+
+    @property
+    def pressure_size(self):
+        """
+        The airbrush pressure only drives the flow.
+        """
+        return self.style != self.AIRBRUSH
+
+    def dab(self, size, color, opacity):
+        """
+        Return the dab image (QImage) for a size in units, a color and an
+        opacity (0-1). The images are cached per pixel size and alpha level.
+        """
+        size = max(1, round(size))
+        alpha = max(1, min(255, round(opacity * 255)))
+        color = QtGui.QColor(color)
+        key = size, color.rgb(), alpha
+        image = self.dabs.get(key)
+        if image is None:
+            if len(self.dabs) >= DAB_CACHE_SIZE:
+                self.dabs = {}
+            image = self.render_dab(size, color, alpha)
+            self.dabs[key] = image
+        return image
+
+    def render_dab(self, size, color, alpha):
+        image = QtGui.QImage(
+            size, size, QtGui.QImage.Format_ARGB32_Premultiplied)
+        image.fill(QtCore.Qt.transparent)
+        radius = size / 2
+        opaque, transparent = QtGui.QColor(color), QtGui.QColor(color)
+        opaque.setAlpha(alpha)
+        transparent.setAlpha(0)
+        gradient = QtGui.QRadialGradient(radius, radius, radius)
+        gradient.setColorAt(0, opaque)
+        gradient.setColorAt(self.hardness, opaque)
+        gradient.setColorAt(1, transparent)
+        painter = QtGui.QPainter(image)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(QtCore.Qt.NoPen)
+        painter.setBrush(gradient)
+        painter.drawEllipse(QtCore.QRectF(0, 0, size, size))
+        if self.style == self.TEXTURED:
+            mode = QtGui.QPainter.CompositionMode_DestinationIn
+            painter.setCompositionMode(mode)
+            painter.fillRect(image.rect(), QtGui.QBrush(noise_texture()))
+        painter.end()
+        return image
+
+
+class BrushStroke:
+    """
+    Stamp the dabs of a brush along the pointer path on a Raster. The dabs
+    are evenly spaced whatever the events rate, the distance left since
+    the last dab is carried from a segment to the next.
+    """
+
+    def __init__(self, brush, raster, color, size):
+        self.brush = brush
+        self.raster = raster
+        self.color = color
+        self.size = size
+        self.last = None
+        self.remainder = 0.0
+
+    def add_points(self, points, pressures):
+        """
+        Add the points (units) and stamp all their dabs in one pass.
+        """
+        dabs = []
+        for point, pressure in zip(points, pressures):
+            dabs.extend(self.dabs(point, pressure))
+        if dabs:
+            self.raster.stamp(dabs)
+
+    def add_point(self, point, pressure=1):
+        self.add_points([point], [pressure])
+
+    def dabs(self, point, pressure):
+        size = self.size * pressure if self.brush.pressure_size else self.size
+        image = self.brush.dab(size, self.color, self.brush.flow * pressure)
+        if self.last is None:
+            self.last = point
+            return [(image, point)]
+        vector = point - self.last
+        length = math.hypot(vector.x(), vector.y())
+        step = max(1.0, size * self.brush.spacing)
+        # Distance along the segment of the next dab.
+        position = step - self.remainder
+        dabs = []
+        while position <= length:
+            dabs.append((image, self.last + vector * (position / length)))
+            position += step
+        self.remainder = length - (position - step)
+        self.last = point
+        return dabs
@@ -1,5 +1,6 @@
 from PySide2 import QtWidgets, QtCore, QtGui
 from dwidgets.retakecanvas.qtutils import pixmap, COLORS
+from dwidgets.retakecanvas.thumbnails import thumbnail_cache
 
 
 class ComparingMediaTable(QtWidgets.QWidget):
@@ -9,7 +10,10 @@ class ComparingMediaTable(QtWidgets.QWidget):
     def __init__(self, model, parent=None):
         super().__init__(parent=parent)
         self.model = model
+        self.hovered_index = None
         self.setMouseTracking(True)
+        self.thumbnails = thumbnail_cache()
+        self.thumbnails.thumbnailReady.connect(self.update)
 
     def set_model(self, model):
         self.model = model
@@ -59,8 +63,21 @@ class ComparingMediaTable(QtWidgets.QWidget):
                 drag.setHotSpot(event.pos())
                 drag.exec_(QtCore.Qt.CopyAction)
 
-    def mouseMoveEvent(self, _):
-        self.repaint()
+    def index_at(self, point):
+        for i, rect in enumerate(self.rects()):
+            if rect.contains(point):
+                return i
+
+    def mouseMoveEvent(self, event):
+        index = self.index_at(event.pos())
+        if index != self.hovered_index:
+            self.hovered_index = index
+            self.update()
+
+    def leaveEvent(self, _):
+        if self.hovered_index is not None:
+            self.hovered_index = None
+            self.update()
 
     def paintEvent(self, event):
         painter = QtGui.QPainter(self)
@@ -71,21 +88,19 @@ class ComparingMediaTable(QtWidgets.QWidget):
         painter.setBrush(color)
         painter.drawRoundedRect(event.rect(), self.PADDING, self.PADDING)
         painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
-        for rect, image in zip(self.rects(), self.model.imagestack):
-            image = image.scaled(
-                self.WIDTH,
-                self.WIDTH,
-                QtCore.Qt.KeepAspectRatio,
-                QtCore.Qt.SmoothTransformation)
-            image_rect = QtCore.QRect(
-                0, 0, image.size().width(), image.size().height())
-            image_rect.moveCenter(rect.center())
+        iterator = enumerate(zip(self.rects(), self.model.imagestack))
+        for i, (rect, image) in iterator:
             painter.setPen(QtCore.Qt.transparent)
             painter.setBrush(QtCore.Qt.black)
             painter.drawRect(rect)
-            painter.drawImage(image_rect, image)
-            cursor = self.mapFromGlobal(QtGui.QCursor.pos())
-            if rect.contains(cursor):
+            # Thumbnail is None until it is generated in background.
+            image = self.thumbnails.image(image, self.WIDTH)
+            if image is not None:
+                image_rect = QtCore.QRect(
+                    0, 0, image.size().width(), image.size().height())
+                image_rect.moveCenter(rect.center())
+                painter.drawImage(image_rect, image)
+            if i == self.hovered_index:
                 painter.setPen(QtCore.Qt.yellow)
                 color = QtGui.QColor(QtCore.Qt.white)
                 color.setAlpha(50)
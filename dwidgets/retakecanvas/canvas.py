@@ -1,16 +1,24 @@
+import math
 import os
 import time
 from PySide2 import QtCore, QtWidgets, QtGui
 from dwidgets.retakecanvas.geometry import (
-    combined_rect, get_global_rect, get_images_rects, get_shape_rect)
+    combined_rect, get_shape_rect, shape_bounds)
+from dwidgets.retakecanvas.imageloader import mapped_frame
 from dwidgets.retakecanvas.model import RetakeCanvasModel
 from dwidgets.retakecanvas.tools import NavigationTool
-from dwidgets.retakecanvas.selection import selection_rect, Selection
+from dwidgets.retakecanvas.selection import Selection
 from dwidgets.retakecanvas.shapes import (
-    Circle, Rectangle, Arrow, Stroke, Bitmap, Text, Line)
+    Circle, Rectangle, Arrow, Stroke, Bitmap, Raster, Text, Line,
+    shape_function)
+from dwidgets.retakecanvas.tabletinput import TabletInput
 from dwidgets.retakecanvas.viewport import ViewportMapper, set_zoom
 
 
+# Text layouts are cached for zoom steps of 2 ** (1 / TEXT_ZOOM_BUCKETS).
+TEXT_ZOOM_BUCKETS = 4
+
+
 def disable_if_model_locked(method):
     def decorator(self, *args, **kwargs):
         if self.model.locked:
@@ -32,13 +40,17 @@ class Canvas(QtWidgets.QWidget):
         self.last_repaint_evaluation_time = 0
         self.last_repaint_call_time = time.time()
         self.captime = .1
+        self.scaled_images = {}
+        # OnionSkin drawn under the layers, set by the application.
+        self.onionskin = None
 
         self.model = model
         self.selection = model.selection
         self.tool = NavigationTool(canvas=self, model=self.model)
+        self.tablet_input = TabletInput()
         self.timer = QtCore.QTimer(self)
         self.timer.start(300)
-        self.timer.timeout.connect(self.repaint)
+        self.timer.timeout.connect(self.next_frame)
 
     def set_model(self, model):
         self.model = model
@@ -58,10 +70,8 @@ class Canvas(QtWidgets.QWidget):
             for url in event.mimeData().urls()]
         if not paths:
             self.add_image_layer(paths)
-        images = [QtGui.QImage(p) for p in paths]
-        images = [image for image in images if not image.isNull()]
-        for image in images:
-            self.model.append_image(image)
+        for path in paths:
+            self.model.append_image_path(path)
         self.model.add_undo_state()
         self.repaint()
         self.isUpdated.emit()
@@ -82,10 +92,7 @@ class Canvas(QtWidgets.QWidget):
         if not self.model.baseimage:
             return
         self.model.viewportmapper.viewsize = self.size()
-        rect = get_global_rect(
-            self.model.baseimage,
-            self.model.imagestack,
-            self.model.imagestack_layout)
+        rect = self.model.images_layout().global_rect
         self.model.viewportmapper.focus(rect)
         self.zoomChanged.emit()
         self.repaint()
@@ -146,13 +153,27 @@ class Canvas(QtWidgets.QWidget):
             event.accept()
             return
         if event.type() == QtGui.QTabletEvent.TabletRelease:
+            self.flush_tablet_input()
+            self.tablet_input.clear()
             self.is_using_tablet = False
             self.timer.setInterval(300)
             event.accept()
             return
-        self.tool.tabletMoveEvent(event)
+        # Move events are batched and sent to the tool once per frame.
+        self.tablet_input.push(event)
+        event.accept()
+
+    def flush_tablet_input(self):
+        batch = self.tablet_input.flush(self.model.viewportmapper)
+        if batch is None:
+            return
+        self.tool.tabletBatchEvent(batch)
         self.update_cursor()
 
+    def next_frame(self):
+        self.flush_tablet_input()
+        self.repaint()
+
     def cap_repaint(self):
         now = time.time()
         delta = now - self.last_repaint_call_time
@@ -177,6 +198,7 @@ class Canvas(QtWidgets.QWidget):
 
     @disable_if_model_locked
     def set_tool(self, tool):
+        self.flush_tablet_input()
         if self.tool.is_dirty:
             self.model.add_undo_state()
         self.tool = tool
@@ -207,53 +229,15 @@ class Canvas(QtWidgets.QWidget):
             model: RetakeCanvasModel=None,
             viewportmapper: ViewportMapper=None):
         model = model or self.model
-        viewportmapper = viewportmapper or ViewportMapper()
-        baseimage = model.baseimage
-
-        if not baseimage:
+        if not model.baseimage:
             self.draw_empty(painter)
             return
+        return render_model(
+            model, painter, viewportmapper, self.scaled_images,
+            self.onionskin)
 
-        size = model.baseimage.size()
-        baseimage_rect = QtCore.QRectF(0, 0, size.width(), size.height())
-        rects = get_images_rects(
-            model.baseimage,
-            model.imagestack,
-            layout=model.imagestack_layout) + [baseimage_rect]
-
-        if not painter:
-            layer_rects = [
-                get_shape_rect(shape, viewportmapper)
-                for layer in model.layerstack.layers for shape in layer]
-            output_rect = combined_rect(rects + layer_rects)
-            viewportmapper.origin = output_rect.topLeft()
-            w, h = int(output_rect.width()), int(output_rect.height())
-            image = QtGui.QImage(w, h, QtGui.QImage.Format_RGB32)
-            painter = QtGui.QPainter(image)
-        else:
-            image = None
-
-        self.draw_images(painter, rects, viewportmapper, model=model)
-
-        if model.wash_opacity:
-            painter.setPen(QtCore.Qt.transparent)
-            color = QtGui.QColor(model.wash_color)
-            color.setAlpha(model.wash_opacity)
-            painter.setBrush(color)
-            painter.drawRect(viewportmapper.to_viewport_rect(baseimage_rect))
-
-        if model.layerstack.solo is not None:
-            layer, _, blend_mode, _, visible, opacity = model.layerstack[
-                model.layerstack.solo]
-            draw_layer(painter, layer, blend_mode, opacity, viewportmapper)
-            return image
-
-        for layer, _, blend_mode, _, visible, opacity in model.layerstack:
-            if not visible:
-                continue
-            draw_layer(painter, layer, blend_mode, opacity, viewportmapper)
-
-        return image
+    def render_document(self, layer=None):
+        return render_document(self.model, layer)
 
     def paintEvent(self, event):
         if not self.model.baseimage:
@@ -285,54 +269,238 @@ class Canvas(QtWidgets.QWidget):
         painter.setPen(pen)
         painter.drawRect(self.rect())
 
-    def draw_images(
-            self, painter, rects, viewportmapper, model=None):
-        model = model or self.model
-        if model.imagestack_layout != RetakeCanvasModel.STACKED:
-            images = self.model.imagestack + [model.baseimage]
-            for image, rect in zip(images, rects):
-                rect = viewportmapper.to_viewport_rect(rect)
-                image = image.scaled(
-                    rect.size().toSize(),
-                    QtCore.Qt.KeepAspectRatio,
-                    QtCore.Qt.SmoothTransformation)
-                painter.drawImage(rect, image)
+
+def render_rect(model):
+    """
+    Rect (units) containing the images and the shapes.
+    """
+    rects = model.images_layout().rects()
+    rects.extend(
+        shape_bounds(shape) for layer in model.layerstack.layers
+        for shape in layer.shapes)
+    return combined_rect([rect for rect in rects if rect is not None])
+
+
+def render_model(
+        model, painter=None, viewportmapper=None, scaled_images=None,
+        onionskin=None, layer_shapes=None):
+    """
+    Draw the images and the visible layers of the model.
+    If no painter is given, the whole document is rendered at scale 1 in a
+    new image which is returned.
+    scaled_images: dict used to cache the scaled images between calls.
+    onionskin: OnionSkin drawn between the images and the layers. It is
+        display only and isn't drawn in the rendered document image.
+    layer_shapes: function returning the shapes of a layer to draw (e.g.
+        the shapes crossing a render tile). All the shapes by default.
+    """
+    viewportmapper = viewportmapper or ViewportMapper()
+    if painter is None:
+        output_rect = render_rect(model)
+        viewportmapper.origin = output_rect.topLeft()
+        w, h = int(output_rect.width()), int(output_rect.height())
+        image = QtGui.QImage(w, h, QtGui.QImage.Format_RGB32)
+        painter = QtGui.QPainter(image)
+        try:
+            render_model(model, painter, viewportmapper, scaled_images)
+        finally:
+            painter.end()
+        return image
+
+    layout = model.images_layout()
+    baseimage_rect = layout.baseimage_rect
+    rects = layout.rects()
+    draw_images(painter, model, rects, viewportmapper, scaled_images)
+
+    if model.wash_opacity:
+        painter.setPen(QtCore.Qt.transparent)
+        color = QtGui.QColor(model.wash_color)
+        color.setAlpha(model.wash_opacity)
+        painter.setBrush(color)
+        painter.drawRect(viewportmapper.to_viewport_rect(baseimage_rect))
+
+    if onionskin is not None:
+        onionskin.draw(painter, viewportmapper)
+
+    transform = model.selection.transform
+    if model.layerstack.solo is not None:
+        layers = [model.layerstack[model.layerstack.solo]]
+    else:
+        layers = [layer for layer in model.layerstack if layer.visible]
+    for layer in layers:
+        shapes = layer.shapes if layer_shapes is None else layer_shapes(layer)
+        draw_layer(
+            painter, shapes, layer.blend_mode, layer.opacity,
+            viewportmapper, transform)
+
+
+def render_document(model, layer=None):
+    """
+    Render the document at scale 1 and return the image with the units
+    position of its top left pixel.
+    layer: only render this layer, on a transparent image.
+    """
+    rect = render_rect(model)
+    if layer is None:
+        return render_model(model), rect.topLeft()
+    image = QtGui.QImage(
+        int(rect.width()), int(rect.height()),
+        QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.fill(QtCore.Qt.transparent)
+    viewportmapper = ViewportMapper()
+    viewportmapper.origin = rect.topLeft()
+    painter = QtGui.QPainter(image)
+    try:
+        draw_layer(
+            painter, layer.shapes, QtGui.QPainter.CompositionMode_SourceOver,
+            255, viewportmapper)
+    finally:
+        painter.end()
+    return image, rect.topLeft()
+
+
+def draw_images(painter, model, rects, viewportmapper, scaled_images=None):
+    scaled_images = {} if scaled_images is None else scaled_images
+    used_keys = set()
+    visible = painter_visible_rect(painter)
+    if model.imagestack_layout != RetakeCanvasModel.STACKED:
+        images = model.imagestack + [model.baseimage]
+        for image, rect in zip(images, rects):
+            rect = viewportmapper.to_viewport_rect(rect)
+            frame = mapped_frame(image)
+            if frame is not None and not visible.contains(rect):
+                draw_frame_region(
+                    painter, frame, rect, QtCore.QRectF(frame.rect), visible)
+                continue
+            image = scaled_image(
+                image, rect.size().toSize(), scaled_images, used_keys,
+                QtCore.Qt.SmoothTransformation)
+            painter.drawImage(rect, image)
+    else:
+        images = list(reversed(model.imagestack))
+        images += [model.baseimage]
+        wipes = model.imagestack_wipes[:]
+        wipes.append(model.baseimage_wipes)
+        for image, rect, wipe in zip(images, rects, wipes):
+            frame = mapped_frame(image)
+            if frame is not None and rect.width():
+                # The wipe is in units, the scaled image pixels.
+                source = QtCore.QRectF(wipe).intersected(rect)
+                target = viewportmapper.to_viewport_rect(source)
+                if source.isEmpty():
+                    continue
+                if not visible.contains(target):
+                    scale = frame.width / rect.width()
+                    source = QtCore.QRectF(
+                        source.left() * scale, source.top() * scale,
+                        source.width() * scale, source.height() * scale)
+                    draw_frame_region(
+                        painter, frame, target, source, visible)
+                    continue
+            image = scaled_image(
+                image, rect.size().toSize(), scaled_images, used_keys)
+            # Draw the wipe straight from the scaled image. The scaled
+            # image is in units so the source rect is the wipe itself.
+            source = QtCore.QRectF(wipe).intersected(
+                QtCore.QRectF(image.rect()))
+            if source.isEmpty():
+                continue
+            target = viewportmapper.to_viewport_rect(source)
+            painter.drawImage(target, image, source)
+    # Forget the images which are not displayed anymore.
+    for key in set(scaled_images) - used_keys:
+        del scaled_images[key]
+
+
+def painter_visible_rect(painter):
+    """
+    Part of the painter device visible in the painter coordinates.
+    """
+    transform, _ = painter.combinedTransform().inverted()
+    return transform.mapRect(QtCore.QRectF(painter.viewport()))
+
+
+def draw_frame_region(painter, frame, target, source, visible):
+    """
+    Draw the source rect (pixels) of a mapped frame in the target rect.
+    Only the region visible on the painter device is read in the mapped
+    file, e.g. a render tile or the zoomed part of a big plate.
+    """
+    visible = target.intersected(visible)
+    if visible.isEmpty() or target.isEmpty():
+        return
+    scale_x = source.width() / target.width()
+    scale_y = source.height() / target.height()
+    region = QtCore.QRectF(
+        source.left() + (visible.left() - target.left()) * scale_x,
+        source.top() + (visible.top() - target.top()) * scale_y,
+        visible.width() * scale_x, visible.height() * scale_y)
+    region = region.toAlignedRect().intersected(frame.rect)
+    image = frame.region(region)
+    if image.isNull():
+        return
+    target = QtCore.QRectF(
+        target.left() + (region.left() - source.left()) / scale_x,
+        target.top() + (region.top() - source.top()) / scale_y,
+        region.width() / scale_x, region.height() / scale_y)
+    painter.save()
+    painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+    painter.drawImage(target, image)
+    painter.restore()
+
+
+def scaled_image(
+        image, size, scaled_images, used_keys,
+        transformation=QtCore.Qt.FastTransformation):
+    """
+    Return the image scaled to fit in size. The scaled images are cached
+    until the image, the size or the transformation change.
+    """
+    key = image.cacheKey(), size.width(), size.height(), transformation
+    used_keys.add(key)
+    scaled = scaled_images.get(key)
+    if scaled is None:
+        if image.size() == size:
+            scaled = image
         else:
-            images = list(reversed(model.imagestack))
-            images += [model.baseimage]
-            wipes = model.imagestack_wipes[:]
-            wipes.append(model.baseimage_wipes)
-            for image, rect, wipe in zip(images, rects, wipes):
-                mode = QtCore.Qt.KeepAspectRatio
-                image = image.scaled(rect.size().toSize(), mode)
-                image = image.copy(wipe)
-                wipe = viewportmapper.to_viewport_rect(wipe)
-                painter.drawImage(wipe, image)
+            scaled = image.scaled(
+                size, QtCore.Qt.KeepAspectRatio, transformation)
+        scaled_images[key] = scaled
+    return scaled
 
 
 def draw_layer(
-        painter: QtGui.QPainter, layer, blend_mode, opacity, viewportmapper):
+        painter: QtGui.QPainter, layer, blend_mode, opacity, viewportmapper,
+        transform=None):
+    """
+    transform: SelectionTransform previewed on the selected shapes.
+    """
     painter.setOpacity(opacity / 255)
     painter.setCompositionMode(blend_mode)
+    world_transform = painter.worldTransform()
+    preview_transform = None
     for element in layer:
-        if isinstance(element, Stroke):
-            draw_stroke(painter, element, viewportmapper)
-        elif isinstance(element, Arrow):
-            draw_arrow(painter, element, viewportmapper)
-        elif isinstance(element, Circle):
-            draw_shape(painter, element, painter.drawEllipse, viewportmapper)
-        elif isinstance(element, Rectangle):
-            draw_shape(painter, element, painter.drawRect, viewportmapper)
-        elif isinstance(element, Bitmap):
-            draw_bitmap(painter, element, viewportmapper)
-        elif isinstance(element, Text):
-            draw_text(painter, element, viewportmapper)
-        elif isinstance(element, Line):
-            draw_line(painter, element, viewportmapper)
+        if transform is not None and id(element) in transform.shapes:
+            if transform.use_painter(element):
+                if preview_transform is None:
+                    preview_transform = transform.viewport_matrix(
+                        viewportmapper)
+                painter.setWorldTransform(preview_transform, True)
+                draw_shape_element(painter, element, viewportmapper)
+                painter.setWorldTransform(world_transform)
+                continue
+            element = transform.preview(element)
+        draw_shape_element(painter, element, viewportmapper)
     painter.setOpacity(1)
     painter.setCompositionMode(QtGui.QPainter.CompositionMode_SourceOver)
 
 
+def draw_shape_element(painter, element, viewportmapper):
+    function = shape_function(SHAPE_DRAWERS, element)
+    if function is not None:
+        function(painter, element, viewportmapper)
+
+
 def _get_text_alignment_flags(alignment):
     return [
         (QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop),
@@ -359,16 +527,72 @@ def draw_text(painter, text, viewportmapper):
         painter.setBrush(color)
         painter.drawRect(rect)
 
+    zoom = viewportmapper.zoom
+    # The text is laid out for the zoom bucket and scaled to the real zoom.
+    scale = zoom / text_zoom_bucket(zoom)
+    painter.save()
+    painter.translate(rect.topLeft())
+    painter.scale(scale, scale)
+    # The layout is prepared for the transform it is drawn with, without the
+    # translation which QStaticText handles itself.
+    matrix = painter.combinedTransform()
+    matrix = QtGui.QTransform(
+        matrix.m11(), matrix.m12(), matrix.m21(), matrix.m22(), 0, 0)
+    _, static_text, font = get_static_text(text, zoom, matrix)
+    height = rect.height() / scale
+    text_height = static_text.size().height()
+    if text.alignment in (Text.CENTER_LEFT, Text.CENTER, Text.CENTER_RIGHT):
+        top = (height - text_height) / 2
+    elif text.alignment >= Text.BOTTOM_LEFT:
+        top = height - text_height
+    else:
+        top = 0
     painter.setBrush(QtCore.Qt.transparent)
     painter.setPen(QtGui.QColor(text.color))
-    font = QtGui.QFont()
-    font.setPointSizeF(viewportmapper.to_viewport(text.text_size) * 10)
     painter.setFont(font)
-    alignment = _get_text_alignment_flags(text.alignment)
+    painter.drawStaticText(QtCore.QPointF(0, top), static_text)
+    painter.restore()
+
+
+def text_zoom_bucket(zoom):
+    return 2 ** (
+        round(math.log2(zoom) * TEXT_ZOOM_BUCKETS) / TEXT_ZOOM_BUCKETS)
+
+
+def get_static_text(text, zoom, matrix=None):
+    """
+    Return (zoom bucket, QStaticText, QFont) for the Text shape. The layout
+    is cached on the shape and is only rebuilt if the text, its size, its
+    rect or the zoom bucket change. It is prepared for the matrix (identity
+    by default) and only prepared again if the matrix changes.
+    """
+    if matrix is None:
+        matrix = QtGui.QTransform()
+    bucket_zoom = text_zoom_bucket(zoom)
+    rect = QtCore.QRectF(text.start, text.end).normalized()
+    key = (
+        text.text, text.text_size, text.alignment,
+        rect.width(), rect.height(), bucket_zoom)
+    cache = text.static_text
+    if cache is not None and cache[0] == key:
+        if cache[4] != matrix:
+            cache[2].prepare(matrix, cache[3])
+            text.static_text = *cache[:4], matrix
+        return cache[1:4]
+
+    font = QtGui.QFont()
+    font.setPointSizeF(text.text_size * bucket_zoom * 10)
     option = QtGui.QTextOption()
     option.setWrapMode(QtGui.QTextOption.WrapAtWordBoundaryOrAnywhere)
-    option.setAlignment(alignment)
-    painter.drawText(rect, text.text, option)
+    alignment = _get_text_alignment_flags(text.alignment)
+    option.setAlignment(alignment & QtCore.Qt.AlignHorizontal_Mask)
+    static_text = QtGui.QStaticText(text.text.replace('\n', '\u2028'))
+    static_text.setTextFormat(QtCore.Qt.PlainText)
+    static_text.setTextOption(option)
+    static_text.setTextWidth(rect.width() * bucket_zoom)
+    static_text.prepare(matrix, font)
+    text.static_text = key, bucket_zoom, static_text, font, matrix
+    return text.static_text[1:4]
 
 
 def draw_bitmap(painter, bitmap, viewportmapper):
@@ -378,6 +602,35 @@ def draw_bitmap(painter, bitmap, viewportmapper):
     painter.drawImage(rect, bitmap.image)
 
 
+def draw_raster(painter, raster, viewportmapper):
+    """
+    Draw the raster tiles intersecting the painted area. On screen the tiles
+    are drawn from pixmaps and only the tiles painted since the previous
+    frame are uploaded again. The other devices (images, pdf, threads) draw
+    the tiles images.
+    """
+    if not raster.tiles:
+        return
+    inverted, _ = painter.worldTransform().inverted()
+    area = inverted.mapRect(QtCore.QRectF(painter.window()))
+    keys = raster.tiles_in_rect(viewportmapper.to_units_rect(area))
+    if not isinstance(painter.device(), QtWidgets.QWidget):
+        for key in keys:
+            rect = viewportmapper.to_viewport_rect(raster.tile_rect(key))
+            painter.drawImage(rect, raster.tiles[key])
+        return
+    for key in raster.dirty:
+        raster.pixmaps.pop(key, None)
+    raster.dirty.clear()
+    for key in keys:
+        pixmap = raster.pixmaps.get(key)
+        if pixmap is None:
+            pixmap = QtGui.QPixmap.fromImage(raster.tiles[key])
+            raster.pixmaps[key] = pixmap
+        rect = viewportmapper.to_viewport_rect(raster.tile_rect(key))
+        painter.drawPixmap(rect, pixmap, QtCore.QRectF(pixmap.rect()))
+
+
 def draw_shape(painter, shape, drawer, viewportmapper):
     if not shape.is_valid:
         return
@@ -400,6 +653,14 @@ def draw_shape(painter, shape, drawer, viewportmapper):
     drawer(rect)
 
 
+def draw_rectangle(painter, rectangle, viewportmapper):
+    draw_shape(painter, rectangle, painter.drawRect, viewportmapper)
+
+
+def draw_circle(painter, circle, viewportmapper):
+    draw_shape(painter, circle, painter.drawEllipse, viewportmapper)
+
+
 def draw_line(painter, line, viewportmapper):
     if not line.is_valid:
         return
@@ -456,7 +717,8 @@ def draw_stroke(painter, stroke, viewportmapper):
     pen = QtGui.QPen(QtGui.QColor(stroke.color))
     pen.setCapStyle(QtCore.Qt.RoundCap)
     start = None
-    for point, size in stroke:
+    # At low zoom, skip the segments shorter than a pixel.
+    for point, size in stroke.lod(viewportmapper.zoom):
         if start is None:
             start = viewportmapper.to_viewport_coords(point)
             continue
@@ -467,6 +729,18 @@ def draw_stroke(painter, stroke, viewportmapper):
         start = end
 
 
+SHAPE_DRAWERS = {
+    Stroke: draw_stroke,
+    Arrow: draw_arrow,
+    Circle: draw_circle,
+    Rectangle: draw_rectangle,
+    Bitmap: draw_bitmap,
+    Raster: draw_raster,
+    Text: draw_text,
+    Line: draw_line,
+}
+
+
 def draw_selection(painter, selection, viewportmapper):
     if selection.type == Selection.SUBOBJECTS:
         draw_subobjects_selection(painter, selection, viewportmapper)
@@ -478,31 +752,42 @@ def draw_element_selection(painter, selection, viewportmapper):
     rect = get_shape_rect(selection.element, viewportmapper)
     if rect is None:
         return
+    frame = QtGui.QPolygonF(rect)
+    if selection.transform is not None:
+        matrix = selection.transform.viewport_matrix(viewportmapper)
+        frame = matrix.map(frame)
     painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
     painter.setPen(QtCore.Qt.yellow)
     painter.setBrush(QtCore.Qt.NoBrush)
-    painter.drawRect(rect)
+    painter.drawPolygon(frame)
     painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
 
 
 def draw_subobjects_selection(painter, selection, viewportmapper):
     painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
-    painter.setBrush(QtCore.Qt.yellow)
-    painter.setPen(QtCore.Qt.black)
-    for element in selection:
-        if isinstance(element, (QtCore.QPoint, QtCore.QPointF)):
-            point = viewportmapper.to_viewport_coords(element)
-            painter.drawRect(point.x() - 2, point.y() - 2, 4, 4)
+    transform = viewportmapper.to_viewport_transform()
+    if selection.transform is not None:
+        transform = selection.transform.matrix * transform
+    points = transform.map(selection.polygon())
+    pen = QtGui.QPen(QtCore.Qt.black)
+    pen.setCapStyle(QtCore.Qt.SquareCap)
+    pen.setWidth(6)
+    painter.setPen(pen)
+    painter.drawPoints(points)
+    pen.setColor(QtCore.Qt.yellow)
+    pen.setWidth(4)
+    painter.setPen(pen)
+    painter.drawPoints(points)
 
-    rect = viewportmapper.to_viewport_rect(selection_rect(selection))
+    frame = transform.map(QtGui.QPolygonF(selection.rect()))
     painter.setBrush(QtCore.Qt.transparent)
     painter.setPen(QtCore.Qt.black)
-    painter.drawRect(rect)
+    painter.drawPolygon(frame)
     pen = QtGui.QPen(QtCore.Qt.white)
     pen.setWidth(1)
     pen.setStyle(QtCore.Qt.DashLine)
     offset = round((time.time() * 10) % 10, 3)
     pen.setDashOffset(offset)
     painter.setPen(pen)
-    painter.drawRect(rect)
+    painter.drawPolygon(frame)
     painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
@@ -0,0 +1,238 @@
+import json
+import struct
+import sys
+from array import array
+from PySide2 import QtCore, QtGui, QtWidgets
+from dwidgets.retakecanvas.geometry import shape_points
+from dwidgets.retakecanvas.selection import Selection
+from dwidgets.retakecanvas.serialize import (
+    data_to_layer, data_to_shape, layer_to_data, shape_to_data)
+
+
+MIME_TYPE = 'application/x-retakecanvas'
+IMAGES_MIME_TYPE = 'application/x-retakecanvas-images'
+MAGIC = b'RTKC'
+VERSION = 1
+# Magic, version, json header size. The header is followed by the binary
+# data: the strokes points (float64) or the images pixels.
+HEADER = struct.Struct('<4sHI')
+SHAPES = 'shapes'
+LAYERS = 'layers'
+_release_connected = False
+
+
+class ClipboardStore:
+    """
+    serialize image store referencing the images instead of saving their
+    pixels. The keys are the QImage.cacheKey().
+    """
+
+    def __init__(self, images=None):
+        self.images = {} if images is None else images
+
+    def save(self, image):
+        if image is None or image.isNull():
+            return None
+        key = str(image.cacheKey())
+        self.images[key] = image
+        return key
+
+    def load(self, key):
+        if key is None:
+            return QtGui.QImage()
+        return self.images.get(key, QtGui.QImage())
+
+
+class ClipboardMimeData(QtCore.QMimeData):
+    """
+    Shapes or layers copied to the clipboard. The images are only referenced
+    in the payload. They are kept by this object, so a paste in the same
+    application instance reuses them. Their pixels are only encoded if
+    another instance asks for them.
+    """
+
+    def __init__(self, payload, images):
+        super().__init__()
+        self.images = images
+        self.setData(MIME_TYPE, QtCore.QByteArray(payload))
+
+    def formats(self):
+        formats = super().formats()
+        if self.images:
+            formats.append(IMAGES_MIME_TYPE)
+        return formats
+
+    def hasFormat(self, mime_type):
+        return mime_type in self.formats()
+
+    def retrieveData(self, mime_type, preferred_type):
+        if mime_type == IMAGES_MIME_TYPE and self.images:
+            return QtCore.QByteArray(encode_images(self.images))
+        return super().retrieveData(mime_type, preferred_type)
+
+
+def pack(header, data=b''):
+    text = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return HEADER.pack(MAGIC, VERSION, len(text)) + text + data
+
+
+def unpack(payload):
+    magic, version, size = HEADER.unpack_from(payload)
+    if magic != MAGIC or version > VERSION:
+        raise ValueError('Unsupported clipboard data')
+    start = HEADER.size
+    header = json.loads(bytes(payload[start:start + size]).decode('utf-8'))
+    return header, payload[start + size:]
+
+
+def encode(kind, items):
+    """
+    Return the payload of the shapes or the layers and the images they
+    reference ({key: QImage}).
+    The strokes points are packed in a single float64 array following the
+    json header, the strokes data only keep their offset and count.
+    """
+    store = ClipboardStore()
+    if kind == SHAPES:
+        data = [shape_to_data(shape, store) for shape in items]
+        shapes_data = data
+    else:
+        data = [layer_to_data(layer, store) for layer in items]
+        shapes_data = [shape for layer in data for shape in layer['shapes']]
+    points = array('d')
+    for shape_data in shapes_data:
+        if shape_data['type'] == 'stroke':
+            values = shape_data['points']
+            shape_data['points'] = [len(points), len(values)]
+            points.extend(values)
+    if sys.byteorder != 'little':
+        points.byteswap()
+    payload = pack({'kind': kind, 'items': data}, points.tobytes())
+    return payload, store.images
+
+
+def decode(payload, images):
+    """
+    Return (kind, items) from an encode payload. The items are new shapes or
+    layers (with new ids).
+    images: {key: QImage} referenced by the payload.
+    """
+    header, data = unpack(payload)
+    points = array('d')
+    points.frombytes(bytes(data))
+    if sys.byteorder != 'little':
+        points.byteswap()
+    kind, items = header['kind'], header['items']
+    if kind == SHAPES:
+        shapes_data = items
+    else:
+        shapes_data = [shape for layer in items for shape in layer['shapes']]
+    for shape_data in shapes_data:
+        if shape_data['type'] == 'stroke':
+            offset, count = shape_data['points']
+            shape_data['points'] = points[offset:offset + count]
+    store = ClipboardStore(images)
+    if kind == SHAPES:
+        return kind, [data_to_shape(shape, store) for shape in items]
+    return kind, [data_to_layer(layer, store) for layer in items]
+
+
+def encode_images(images):
+    """
+    Raw premultiplied ARGB32 pixels of the images after a json header
+    describing them.
+    """
+    entries, chunks, offset = {}, [], 0
+    for key, image in images.items():
+        image = image.convertToFormat(
+            QtGui.QImage.Format_ARGB32_Premultiplied)
+        size = image.bytesPerLine() * image.height()
+        pixels = bytes(memoryview(image.constBits())[:size])
+        entries[key] = [
+            image.width(), image.height(), image.bytesPerLine(), offset, size]
+        chunks.append(pixels)
+        offset += size
+    return pack(entries, b''.join(chunks))
+
+
+def decode_images(payload):
+    entries, data = unpack(payload)
+    images = {}
+    for key, (width, height, stride, offset, size) in entries.items():
+        pixels = bytes(data[offset:offset + size])
+        image = QtGui.QImage(
+            pixels, width, height, stride,
+            QtGui.QImage.Format_ARGB32_Premultiplied)
+        # Detach from the python buffer.
+        images[key] = image.copy()
+    return images
+
+
+def mime_data(kind, items):
+    payload, images = encode(kind, items)
+    return ClipboardMimeData(payload, images)
+
+
+def set_clipboard(kind, items):
+    global _release_connected
+    QtWidgets.QApplication.clipboard().setMimeData(mime_data(kind, items))
+    if not _release_connected:
+        application = QtWidgets.QApplication.instance()
+        application.aboutToQuit.connect(release_clipboard)
+        _release_connected = True
+
+
+def release_clipboard():
+    """
+    Replace the ClipboardMimeData by a plain copy with the images encoded,
+    the python object cannot serve the clipboard once the application quit.
+    """
+    clipboard = QtWidgets.QApplication.clipboard()
+    data = clipboard.mimeData()
+    if not isinstance(data, ClipboardMimeData):
+        return
+    plain = QtCore.QMimeData()
+    for mime_type in data.formats():
+        plain.setData(mime_type, data.data(mime_type))
+    clipboard.setMimeData(plain)
+
+
+def mime_data_content(mime_data):
+    """
+    Return the (kind, items) stored in the mime data or None.
+    """
+    if mime_data is None or not mime_data.hasFormat(MIME_TYPE):
+        return None
+    payload = bytes(mime_data.data(MIME_TYPE))
+    if isinstance(mime_data, ClipboardMimeData):
+        images = mime_data.images
+    elif mime_data.hasFormat(IMAGES_MIME_TYPE):
+        images = decode_images(bytes(mime_data.data(IMAGES_MIME_TYPE)))
+    else:
+        images = {}
+    try:
+        return decode(payload, images)
+    except (ValueError, KeyError, struct.error):
+        return None
+
+
+def selected_shapes(model):
+    """
+    Return the shapes of the current layer which are selected or own a
+    selected point, in the layer order.
+    """
+    layer = model.layerstack.current
+    selection = model.selection
+    if not layer or selection.type == Selection.NO:
+        return []
+    classes = QtCore.QPoint, QtCore.QPointF
+    if selection.type == Selection.ELEMENT:
+        element = selection.element
+        if not isinstance(element, classes):
+            return [shape for shape in layer if shape is element]
+        ids = {id(element)}
+    else:
+        ids = {id(point) for point in selection if isinstance(point, classes)}
+    return [
+        shape for shape in layer
+        if any(id(point) in ids for point in shape_points(shape))]
@@ -14,7 +14,7 @@ class OpacityDialog(QtWidgets.QWidget):
         self.slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
         self.slider.setMinimum(0)
         self.slider.setMaximum(255)
-        self.slider.setValue(layerstack.opacities[index])
+        self.slider.setValue(layerstack[index].opacity)
         self.slider.valueChanged.connect(self.change_opacity)
         self.setFixedWidth(self.WIDTH)
         layout = QtWidgets.QVBoxLayout(self)
@@ -33,7 +33,7 @@ class OpacityDialog(QtWidgets.QWidget):
         self.show()
 
     def change_opacity(self, value):
-        self.layerstack.opacities[self.index] = value
+        self.layerstack[self.index].opacity = value
         self.parent().repaint()
 
 
@@ -44,7 +44,7 @@ class RenameDialog(QtWidgets.QWidget):
         self.layerstack = layerstack
         self.setWindowFlag(QtCore.Qt.FramelessWindowHint)
         self.setWindowFlag(QtCore.Qt.Popup)
-        self.text = QtWidgets.QLineEdit(layerstack.names[index])
+        self.text = QtWidgets.QLineEdit(layerstack[index].name)
         self.text.focusOutEvent = self.focusOutEvent
         layout = QtWidgets.QHBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
@@ -52,8 +52,8 @@ class RenameDialog(QtWidgets.QWidget):
         self.text.returnPressed.connect(self.close)
 
     def closeEvent(self, _):
-        if self.layerstack.names[self.index] != self.text.text():
-            self.layerstack.names[self.index] = self.text.text()
+        if self.layerstack[self.index].name != self.text.text():
+            self.layerstack[self.index].name = self.text.text()
             self.parent().repaint()
 
     def exec_(self, point, size):
@@ -0,0 +1,151 @@
+"""
+Batch render retake sessions to images:
+    python -m dwidgets.retakecanvas.export sessions_directory output_directory
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PySide2 import QtGui
+from dwidgets.retakecanvas.canvas import render_model
+from dwidgets.retakecanvas.serialize import SESSION_EXTENSION, load_session
+from dwidgets.retakecanvas.tiledrender import TILE_SIZE, render_to_file
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+FORMATS = 'png', 'jpg', 'exr', 'ppm', 'raw'
+# Rendered by tiles and streamed to the disk.
+TILED_FORMATS = 'ppm', 'raw'
+_application = None
+
+
+def _initialize_worker():
+    global _application
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    _application = (
+        QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([]))
+
+
+def peak_memory():
+    """
+    Peak resident memory of the current process in bytes (None if unknown).
+    It is the peak since the process started: in a reused pool worker it
+    covers all the jobs the worker ran so far, not only the last one.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def check_format(image_format):
+    supported = [
+        bytes(f).decode().lower()
+        for f in QtGui.QImageWriter.supportedImageFormats()]
+    if image_format not in supported:
+        raise ValueError(
+            f'Format "{image_format}" is not supported by this Qt '
+            f'installation. An image format plugin (e.g. kimageformats for '
+            f'exr) is needed.')
+
+
+def render_session(
+        path, output, image_format='png', quality=-1, tile_size=TILE_SIZE):
+    """
+    Render the session and save it. Return (seconds, peak memory of the
+    process so far, see peak_memory).
+    """
+    start = time.perf_counter()
+    model = load_session(path)
+    if image_format in TILED_FORMATS:
+        render_to_file(model, output, tile_size)
+        return time.perf_counter() - start, peak_memory()
+    check_format(image_format)
+    image = render_model(model)
+    if not image.save(output, image_format, quality):
+        raise OSError(f'Cannot write {output}')
+    return time.perf_counter() - start, peak_memory()
+
+
+def output_path(path, directory, image_format):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(directory, f'{name}.{image_format}')
+
+
+def export_sessions(
+        paths, directory, image_format='png', workers=None, quality=-1,
+        tile_size=TILE_SIZE, log=print):
+    """
+    Render the sessions in a process pool. Return the failed paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    failed = []
+    start = time.perf_counter()
+    executor = ProcessPoolExecutor(
+        max_workers=workers, initializer=_initialize_worker)
+    with executor:
+        futures = {
+            executor.submit(
+                render_session, path,
+                output_path(path, directory, image_format),
+                image_format, quality, tile_size): path
+            for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            name = os.path.basename(path)
+            try:
+                seconds, memory = future.result()
+            except Exception as e:
+                failed.append(path)
+                log(f'{name}: FAILED ({e})')
+                continue
+            memory = (
+                '' if memory is None else
+                f', worker cumulative peak memory '
+                f'{memory / 1024 ** 2:.1f} MB')
+            log(f'{name}: {seconds:.2f}s{memory}')
+    count = len(paths) - len(failed)
+    log(
+        f'{count}/{len(paths)} {SESSION_EXTENSION} sessions exported in '
+        f'{time.perf_counter() - start:.2f}s')
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m dwidgets.retakecanvas.export',
+        description='Render the retake sessions of a directory to images.')
+    parser.add_argument('sessions', help='Directory of saved sessions.')
+    parser.add_argument('output', help='Output directory.')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='png')
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help='Worker processes (default: cpu count).')
+    parser.add_argument(
+        '-q', '--quality', type=int, default=-1,
+        help='Compression quality 0-100 (default: format default).')
+    parser.add_argument(
+        '-t', '--tile-size', type=int, default=TILE_SIZE,
+        help='Tile size of the streamed formats (ppm, raw).')
+    arguments = parser.parse_args(argv)
+    pattern = os.path.join(arguments.sessions, '*' + SESSION_EXTENSION)
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        print(f'No session found in {arguments.sessions}')
+        return 1
+    failed = export_sessions(
+        paths, arguments.output, arguments.format, arguments.workers,
+        arguments.quality, arguments.tile_size)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
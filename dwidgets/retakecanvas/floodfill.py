@@ -0,0 +1,166 @@
+import bisect
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.shapes import Bitmap
+
+try:
+    import numpy
+except ImportError:  # Optional, the rows are then scanned in python.
+    numpy = None
+
+
+# Formats read as is, four bytes per pixel.
+PIXEL_FORMATS = (
+    QtGui.QImage.Format_RGB32, QtGui.QImage.Format_ARGB32,
+    QtGui.QImage.Format_ARGB32_Premultiplied)
+
+
+def flood_fill(image, x, y, tolerance=0):
+    """
+    Scanline flood fill of the area connected to the seed pixel (x, y)
+    whose pixels differ from the seed color by at most the tolerance
+    (0-255) on each channel.
+    Return the filled spans as a list of (row, left, right), right
+    excluded, or an empty list if the seed is out of the image.
+    The fill works on runs of matching pixels: each run is visited once and
+    queues the runs overlapping it in the rows above and below. The runs of
+    a row are only searched when the fill reaches it.
+    """
+    width, height = image.width(), image.height()
+    if not (0 <= x < width and 0 <= y < height):
+        return []
+    if image.format() not in PIXEL_FORMATS:
+        image = image.convertToFormat(QtGui.QImage.Format_ARGB32)
+    if numpy is not None:
+        row_runs = numpy_row_runs(image, x, y, tolerance)
+    else:
+        row_runs = python_row_runs(image, x, y, tolerance)
+    runs = {}
+
+    def get_runs(row):
+        try:
+            return runs[row]
+        except KeyError:
+            runs[row] = row_runs(row)
+            return runs[row]
+
+    starts, _ = get_runs(y)
+    seed = y, bisect.bisect_right(starts, x) - 1
+    visited = {seed}
+    stack = [seed]
+    spans = []
+    while stack:
+        row, index = stack.pop()
+        starts, ends = get_runs(row)
+        left, right = starts[index], ends[index]
+        spans.append((row, left, right))
+        for other in (row - 1, row + 1):
+            if not 0 <= other < height:
+                continue
+            starts, ends = get_runs(other)
+            # Runs overlapping [left, right[ (4-connectivity).
+            first = bisect.bisect_right(ends, left)
+            last = bisect.bisect_left(starts, right)
+            for key in ((other, i) for i in range(first, last)):
+                if key not in visited:
+                    visited.add(key)
+                    stack.append(key)
+    return spans
+
+
+def color_bounds(pixel, tolerance):
+    return (
+        [max(0, value - tolerance) for value in pixel],
+        [min(255, value + tolerance) for value in pixel])
+
+
+def numpy_row_runs(image, x, y, tolerance):
+    """
+    Return a function giving the (starts, ends) of the matching runs of a
+    row. The image is read through a numpy view and the runs of all the
+    rows are found at once with vectorized operations.
+    """
+    width, height = image.width(), image.height()
+    buffer = numpy.frombuffer(memoryview(image.constBits()), numpy.uint8)
+    pixels = buffer[:height * image.bytesPerLine()].reshape(
+        height, image.bytesPerLine())[:, :width * 4]
+    start = x * 4
+    low, high = color_bounds(pixels[y, start:start + 4].tolist(), tolerance)
+    # low <= value <= high is tested as (value - low) <= (high - low) with
+    # the uint8 wrap around, then the four channels at once as an uint32.
+    # The bounds are repeated over a whole row to keep the operations on
+    # contiguous memory.
+    low = numpy.tile(numpy.array(low, numpy.uint8), width)
+    span = numpy.tile(numpy.array(high, numpy.uint8), width) - low
+    channels = pixels - low
+    match = numpy.less_equal(channels, span, out=channels.view(bool))
+    match = match.view(numpy.uint32) == numpy.frombuffer(
+        bytes([1, 1, 1, 1]), numpy.uint32)[0]
+    padded = numpy.zeros((height, width + 2), bool)
+    padded[:, 1:-1] = match
+    edges = numpy.flatnonzero(padded[:, 1:] != padded[:, :-1])
+    rows, columns = numpy.divmod(edges, width + 1)
+    # The edges alternate between run starts and ends in each row.
+    starts, ends = columns[0::2], columns[1::2]
+    limits = numpy.searchsorted(rows[0::2], numpy.arange(height + 1))
+
+    def row_runs(row):
+        first, last = limits[row], limits[row + 1]
+        return starts[first:last].tolist(), ends[first:last].tolist()
+
+    return row_runs
+
+
+def python_row_runs(image, x, y, tolerance):
+    """
+    Fallback of numpy_row_runs comparing the pixels one by one.
+    """
+    width = image.width()
+    stride = image.bytesPerLine()
+    bits = bytes(memoryview(image.constBits())[:stride * image.height()])
+    start = y * stride + x * 4
+    low, high = color_bounds(bits[start:start + 4], tolerance)
+    bounds = list(zip(low, high))
+
+    def row_runs(row):
+        data = bits[row * stride:row * stride + width * 4]
+        starts, ends = [], []
+        inside = False
+        for i in range(width):
+            pixel = data[i * 4:i * 4 + 4]
+            match = all(
+                minimum <= value <= maximum
+                for value, (minimum, maximum) in zip(pixel, bounds))
+            if match and not inside:
+                starts.append(i)
+            elif inside and not match:
+                ends.append(i)
+            inside = match
+        if inside:
+            ends.append(width)
+        return starts, ends
+
+    return row_runs
+
+
+def spans_to_bitmap(spans, color, origin):
+    """
+    Return a Bitmap of the spans painted with the color or None.
+    origin: units position of the sampled image top left pixel.
+    """
+    if not spans:
+        return None
+    left = min(span[1] for span in spans)
+    right = max(span[2] for span in spans)
+    top = min(span[0] for span in spans)
+    bottom = max(span[0] for span in spans) + 1
+    image = QtGui.QImage(
+        right - left, bottom - top, QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.fill(QtCore.Qt.transparent)
+    color = QtGui.QColor(color)
+    painter = QtGui.QPainter(image)
+    for row, start, end in spans:
+        painter.fillRect(start - left, row - top, end - start, 1, color)
+    painter.end()
+    rect = QtCore.QRectF(
+        origin.x() + left, origin.y() + top, right - left, bottom - top)
+    return Bitmap(image, rect)
@@ -2,7 +2,8 @@ import sys
 import math
 from PySide2 import QtCore
 from dwidgets.retakecanvas.shapes import (
-    Bitmap, Text, Rectangle, Circle, Arrow, Stroke, Line)
+    Bitmap, Raster, Text, Rectangle, Circle, Arrow, Stroke, Line,
+    shape_function)
 
 
 def get_images_rects(baseimage, stackimages, layout=0):
@@ -40,6 +41,54 @@ def get_global_rect(baseimage, stackimages, layout=0):
     return combined_rect(rects)
 
 
+class ImagesLayout:
+    """
+    Rects of the comparing images and the base image, computed once. See
+    RetakeCanvasModel.images_layout which memoizes it.
+    Indexes follow the drawing order: the comparing images, then the base
+    image (index -1 or len(imagestack)).
+    """
+
+    def __init__(self, baseimage, stackimages, layout=0):
+        size = baseimage.size()
+        self._stack_rects = get_images_rects(baseimage, stackimages, layout)
+        self._baseimage_rect = QtCore.QRectF(0, 0, size.width(), size.height())
+        self._rects = self._stack_rects + [self._baseimage_rect]
+        self._global_rect = combined_rect(self._rects)
+
+    def __len__(self):
+        return len(self._rects)
+
+    def rects(self):
+        """
+        Return copies of the comparing images rects and the base image rect.
+        """
+        return [QtCore.QRectF(rect) for rect in self._rects]
+
+    def stack_rects(self):
+        return [QtCore.QRectF(rect) for rect in self._stack_rects]
+
+    def rect(self, index=-1):
+        return QtCore.QRectF(self._rects[index])
+
+    @property
+    def baseimage_rect(self):
+        return QtCore.QRectF(self._baseimage_rect)
+
+    @property
+    def global_rect(self):
+        return QtCore.QRectF(self._global_rect)
+
+    def index_at(self, point):
+        """
+        Return the index of the image drawn on top at the given point (units)
+        or None.
+        """
+        for index in range(len(self._rects) - 1, -1, -1):
+            if self._rects[index].contains(point):
+                return index
+
+
 def combined_rect(rects):
     left, top = sys.maxsize, sys.maxsize
     right, bottom = -sys.maxsize, -sys.maxsize
@@ -79,17 +128,92 @@ def points_rect(points):
     return QtCore.QRectF(left, top, right - left, bottom - top)
 
 
+def shape_points(element):
+    """
+    Return the editable points of a shape (the ones which can be selected or
+    transformed). Bitmap doesn't expose any point.
+    """
+    function = shape_function(POINTS_FUNCTIONS, element)
+    return function(element) if function is not None else []
+
+
+def shape_bounds(element):
+    """
+    Return the shape bounding rect in units coordinates.
+    """
+    function = shape_function(BOUNDS_FUNCTIONS, element)
+    return function(element) if function is not None else None
+
+
+def stroke_points(stroke):
+    return [p for p, _ in stroke]
+
+
+def handles_points(shape):
+    return [shape.start, shape.end]
+
+
+def stroke_bounds(stroke):
+    return points_rect([p for p, _ in stroke])
+
+
+def handles_bounds(shape):
+    l = min((shape.start.x(), shape.end.x()))
+    t = min((shape.start.y(), shape.end.y()))
+    w = max((shape.start.x(), shape.end.x())) - l
+    h = max((shape.start.y(), shape.end.y())) - t
+    return QtCore.QRectF(l, t, w, h)
+
+
+def bitmap_bounds(bitmap):
+    return QtCore.QRectF(bitmap.rect)
+
+
+def raster_bounds(raster):
+    return QtCore.QRectF(raster.rect) if raster.rect is not None else None
+
+
+POINTS_FUNCTIONS = {
+    Stroke: stroke_points,
+    Arrow: handles_points,
+    Rectangle: handles_points,
+    Circle: handles_points,
+    Text: handles_points,
+    Line: handles_points,
+}
+BOUNDS_FUNCTIONS = {
+    Stroke: stroke_bounds,
+    Arrow: handles_bounds,
+    Rectangle: handles_bounds,
+    Circle: handles_bounds,
+    Text: handles_bounds,
+    Line: handles_bounds,
+    Bitmap: bitmap_bounds,
+    Raster: raster_bounds,
+}
+
+
+def rects_overlap(rect1, rect2):
+    """
+    Edge inclusive intersection test. Unlike QRectF.intersects, this works
+    with flat rects (horizontal or vertical lines).
+    """
+    return not (
+        rect1.right() < rect2.left() or rect2.right() < rect1.left() or
+        rect1.bottom() < rect2.top() or rect2.bottom() < rect1.top())
+
+
+def rect_contains_rect(rect1, rect2):
+    """
+    Edge inclusive version of QRectF.contains(QRectF).
+    """
+    return (
+        rect1.left() <= rect2.left() and rect2.right() <= rect1.right() and
+        rect1.top() <= rect2.top() and rect2.bottom() <= rect1.bottom())
+
+
 def get_shape_rect(element, viewportmapper):
-    if isinstance(element, Stroke):
-        points = [p for p, _ in element]
-        return viewportmapper.to_viewport_rect(points_rect(points))
-    elif isinstance(element, (Arrow, Rectangle, Circle, Text, Line)):
-        l = min((element.start.x(), element.end.x()))
-        t = min((element.start.y(), element.end.y()))
-        w = max((element.start.x(), element.end.x())) - l
-        h = max((element.start.y(), element.end.y())) - t
-        rect = QtCore.QRectF(l, t, w, h)
-        return viewportmapper.to_viewport_rect(rect)
-    elif isinstance(element, Bitmap):
-        rect = QtCore.QRectF(element.rect)
-        return viewportmapper.to_viewport_rect(rect)
+    rect = shape_bounds(element)
+    if rect is None:
+        return
+    return viewportmapper.to_viewport_rect(rect)
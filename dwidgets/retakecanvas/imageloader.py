@@ -0,0 +1,177 @@
+import json
+import mmap
+import os
+import weakref
+from PySide2 import QtCore, QtGui
+
+
+RAW_FORMATS = {
+    'RGB888': (QtGui.QImage.Format_RGB888, 3),
+    'RGBA8888': (QtGui.QImage.Format_RGBA8888, 4),
+    'RGBX8888': (QtGui.QImage.Format_RGBX8888, 4),
+    'ARGB32': (QtGui.QImage.Format_ARGB32, 4),
+    'RGB32': (QtGui.QImage.Format_RGB32, 4),
+}
+PPM_EXTENSIONS = '.ppm', '.pnm'
+RAW_EXTENSIONS = '.raw', '.rgb', '.rgba'
+SIDECAR_EXTENSION = '.json'
+# The frames are only referenced weakly here: the holders of their images
+# (image pool, undo states) keep them alive, the file is unmapped when the
+# last of them drops the frame.
+_frames = weakref.WeakValueDictionary()
+# QImage.cacheKey() -> MappedFrame of the images wrapping a mapped frame.
+_frame_images = weakref.WeakValueDictionary()
+
+
+class MappedFrame:
+    """
+    Frame file mapped in memory. The QImages returned share the mapped
+    memory: the frame must be referenced as long as they (or their copies)
+    are in use. The file is unmapped when the frame is garbage collected.
+    """
+
+    def __init__(self, path, width, height, image_format, offset, stride):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.format = image_format
+        self.offset = offset
+        self.stride = stride
+        with open(path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mapping) < offset + stride * height:
+            self.mapping.close()
+            raise ValueError(f'Frame file is truncated: {path}')
+        # Never handed out. The images returned share its data, so a
+        # painter opened on one of them detaches it (copies the pixels)
+        # instead of writing in the read only mapping.
+        self._image = self.region(self.rect)
+        _frame_images[self._image.cacheKey()] = self
+
+    @property
+    def size(self):
+        return QtCore.QSize(self.width, self.height)
+
+    @property
+    def bytes_per_pixel(self):
+        return next(
+            size for image_format, size in RAW_FORMATS.values()
+            if image_format == self.format)
+
+    @property
+    def rect(self):
+        return QtCore.QRect(0, 0, self.width, self.height)
+
+    def image(self):
+        return QtGui.QImage(self._image)
+
+    def region(self, rect):
+        """
+        Return the region of interest as QImage pointing in the mapped memory.
+        Only the pages covered by the region are read when it is drawn.
+        """
+        rect = rect.intersected(self.rect)
+        if rect.isEmpty():
+            return QtGui.QImage()
+        start = (
+            self.offset + rect.top() * self.stride +
+            rect.left() * self.bytes_per_pixel)
+        data = memoryview(self.mapping)[start:]
+        return QtGui.QImage(
+            data, rect.width(), rect.height(), self.stride, self.format)
+
+
+def read_ppm_header(path):
+    """
+    Return width, height and data offset of a binary 8 bits PPM file (P6).
+    """
+    with open(path, 'rb') as f:
+        header = f.read(512)
+    fields = []
+    index = 0
+    while len(fields) < 4:
+        while index < len(header) and header[index:index + 1].isspace():
+            index += 1
+        if header[index:index + 1] == b'#':
+            index = header.index(b'\n', index)
+            continue
+        end = index
+        while end < len(header) and not header[end:end + 1].isspace():
+            end += 1
+        if end == index:
+            raise ValueError(f'Invalid PPM header: {path}')
+        fields.append(header[index:end])
+        index = end
+    magic, width, height, maxval = fields
+    if magic != b'P6' or int(maxval) != 255:
+        raise ValueError(f'Only 8 bits binary PPM (P6) can be mapped: {path}')
+    # A single whitespace separates the header from the data.
+    return int(width), int(height), index + 1
+
+
+def read_raw_sidecar(path):
+    """
+    "frame.raw" is described by "frame.raw.json":
+        {"width": 1920, "height": 1080, "format": "RGBA8888",
+         "offset": 0, "stride": 7680}
+    offset and stride are optional.
+    """
+    with open(path + SIDECAR_EXTENSION, 'r') as f:
+        data = json.load(f)
+    image_format, bytes_per_pixel = RAW_FORMATS[data['format']]
+    width, height = data['width'], data['height']
+    stride = data.get('stride', width * bytes_per_pixel)
+    return width, height, image_format, data.get('offset', 0), stride
+
+
+def is_mappable(path):
+    extension = os.path.splitext(path)[-1].lower()
+    if extension in PPM_EXTENSIONS:
+        return True
+    return (
+        extension in RAW_EXTENSIONS and
+        os.path.exists(path + SIDECAR_EXTENSION))
+
+
+def open_frame(path):
+    """
+    Map the frame file or return the already opened frame.
+    """
+    path = os.path.normpath(path)
+    frame = _frames.get(path)
+    if frame is not None:
+        return frame
+    extension = os.path.splitext(path)[-1].lower()
+    if extension in PPM_EXTENSIONS:
+        width, height, offset = read_ppm_header(path)
+        frame = MappedFrame(
+            path, width, height, QtGui.QImage.Format_RGB888, offset,
+            width * 3)
+    else:
+        frame = MappedFrame(path, *read_raw_sidecar(path))
+    _frames[path] = frame
+    return frame
+
+
+def mapped_frame(image):
+    """
+    Return the MappedFrame wrapped by the image or None.
+    """
+    return _frame_images.get(image.cacheKey())
+
+
+def load_image(path):
+    """
+    Return (QImage, MappedFrame or None) for the given path. Uncompressed
+    frames (binary PPM, or raw buffers described by a json sidecar) are
+    memory mapped and wrapped without copy: the pages are only read from the
+    disk when they are drawn. The caller has to keep the frame as long as
+    the image is used. Other formats are decoded by Qt.
+    """
+    if not is_mappable(path):
+        return QtGui.QImage(path), None
+    try:
+        frame = open_frame(path)
+    except (OSError, ValueError, KeyError):
+        return QtGui.QImage(path), None
+    return frame.image(), frame
@@ -0,0 +1,145 @@
+import hashlib
+import os
+from PySide2 import QtGui
+from dwidgets.retakecanvas.imageloader import load_image, mapped_frame
+
+
+class ImagePool:
+    """
+    Reference counted images shared by all the models of the process. Images
+    loaded from the disk are deduplicated by file path, size and
+    modification time, other images by content hash. Several canvas opened
+    on the same plates keep a single decoded (or mapped) copy. QImage being
+    implicitly shared, the returned images don't copy the pixels.
+    """
+
+    def __init__(self):
+        self.images = {}
+        self.counts = {}
+        # Pool key -> MappedFrame of the mapped images. The frame stays
+        # mapped as long as it is referenced, here or by the undo states.
+        self.frames = {}
+        # QImage.cacheKey() -> pool key. Kept after the last release: an
+        # undo can give back a released image, it is then acquired again
+        # without hashing it.
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.images)
+
+    def acquire(self, image):
+        """
+        Return the pooled image having the same content as the given one.
+        """
+        if image.isNull():
+            return image
+        key = self.keys.get(image.cacheKey())
+        if key is None:
+            key = content_key(image)
+        return self._acquire_key(key, image)
+
+    def load(self, path):
+        """
+        Return the pooled image for the path or load it. The loaded image is
+        not referenced until it is acquired.
+        """
+        key = path_key(path)
+        if key is None:
+            return QtGui.QImage()
+        if key in self.images:
+            return self.images[key]
+        image, frame = load_image(key[1])
+        if not image.isNull():
+            self.keys[image.cacheKey()] = key
+        if frame is not None:
+            self.frames[key] = frame
+        return image
+
+    def acquire_path(self, path):
+        return self.acquire(self.load(path))
+
+    def _acquire_key(self, key, image=None):
+        if key not in self.images:
+            self.images[key] = image
+            self.counts[key] = 0
+        pooled = self.images[key]
+        self.keys[pooled.cacheKey()] = key
+        # An image given back by an undo state brings its frame back in.
+        frame = mapped_frame(pooled)
+        if frame is not None:
+            self.frames[key] = frame
+        self.counts[key] += 1
+        return pooled
+
+    def release(self, image):
+        """
+        Drop a reference. The image is removed from the pool with the last
+        reference (users holding a copy still share the data). Its mapped
+        frame is not closed here, it is unmapped once nothing references it.
+        """
+        if image is None or image.isNull():
+            return
+        key = self.keys.get(image.cacheKey())
+        if key is None or key not in self.counts:
+            return
+        self.counts[key] -= 1
+        if self.counts[key] > 0:
+            return
+        del self.counts[key]
+        del self.images[key]
+        self.frames.pop(key, None)
+
+    def count(self, image):
+        return self.counts.get(self.keys.get(image.cacheKey()), 0)
+
+
+PATH = 'path'
+CONTENT = 'content'
+
+
+def path_key(path):
+    """
+    Return the pool key of an image file or None if it doesn't exist.
+    """
+    path = os.path.normpath(os.path.abspath(path))
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return PATH, path, stat.st_size, stat.st_mtime_ns
+
+
+def content_digest(image):
+    """
+    Hash of the image pixels. Only the bytes of the pixels are read, not the
+    padding at the end of the scanlines which can differ between two
+    identical images.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    stride = image.bytesPerLine()
+    length = (image.width() * image.depth() + 7) // 8
+    bits = memoryview(image.constBits())
+    if length == stride:
+        digest.update(bits[:stride * image.height()])
+    else:
+        for row in range(image.height()):
+            start = row * stride
+            digest.update(bits[start:start + length])
+    return digest.hexdigest()
+
+
+def content_key(image):
+    size = image.size()
+    return (
+        CONTENT, content_digest(image), size.width(), size.height(),
+        image.format())
+
+
+_pool = None
+
+
+def image_pool():
+    global _pool
+    if _pool is None:
+        _pool = ImagePool()
+    return _pool
@@ -1,8 +1,10 @@
 
+import itertools
 from PySide2 import QtCore
 from PySide2.QtGui import QPainter
 from dwidgets.retakecanvas.shapes import (
-    Stroke, Arrow, Rectangle, Circle, Bitmap, Text, Line)
+    Stroke, Arrow, Rectangle, Bitmap, Text, Line, ShapeList,
+    shape_function)
 from dwidgets.retakecanvas.mathutils import distance_qline_qpoint
 
 UNDOLIMIT = 30
@@ -33,17 +35,66 @@ BLEND_MODE_NAMES = {
     QPainter.CompositionMode_Xor: 'Xor',
 }
 BLEND_MODE_FOR_NAMES = {v: k for k, v in BLEND_MODE_NAMES.items()}
+_layer_ids = itertools.count()
+_layer_revisions = itertools.count()
+
+
+class Layer:
+    """
+    Layer of shapes. The id is unique in the session and is kept by the undo
+    snapshots, so it can be used as cache key when the layer moves. The
+    revision changes with the shapes (see touch) and is kept by the
+    snapshots too: with the id, it identifies the layer content.
+    """
+    __slots__ = (
+        'id', 'revision', 'shapes', 'name', 'blend_mode', 'locked',
+        'visible', 'opacity')
+
+    def __init__(
+            self, name, shapes=None, blend_mode=None, locked=False,
+            visible=True, opacity=255, layer_id=None, revision=None):
+        self.id = next(_layer_ids) if layer_id is None else layer_id
+        self.revision = (
+            next(_layer_revisions) if revision is None else revision)
+        self.shapes = ShapeList(shapes or ())
+        self.name = name
+        self.blend_mode = blend_mode or QPainter.CompositionMode_SourceOver
+        self.locked = locked
+        self.visible = visible
+        self.opacity = opacity
+
+    def __repr__(self):
+        return f'Layer({self.id}, {self.name!r}, {len(self.shapes)} shapes)'
+
+    def snapshot(self):
+        """
+        Copy of the layer and its shapes with the same id.
+        """
+        return Layer(
+            self.name, [shape.copy() for shape in self.shapes],
+            self.blend_mode, self.locked, self.visible, self.opacity,
+            self.id, self.revision)
+
+    def touch(self):
+        """
+        Give a new revision to the layer after its shapes were edited.
+        """
+        self.revision = next(_layer_revisions)
+
+    def copy(self, name=None):
+        """
+        Copy of the layer and its shapes with a new id.
+        """
+        return Layer(
+            name or self.name, [shape.copy() for shape in self.shapes],
+            self.blend_mode, self.locked, self.visible, self.opacity)
 
 
 class LayerStack:
     def __init__(self):
         super().__init__()
         self.layers = []
-        self.locks = []
-        self.names = []
-        self.opacities = []
-        self.blend_modes = []
-        self.visibilities = []
+        self.ids = {}
         self.solo = None
 
         self.current_index = None
@@ -53,9 +104,16 @@ class LayerStack:
 
     @property
     def texts(self):
+        return [shape.text for shape in self.shapes_of_type(Text)]
+
+    def shapes_of_type(self, *classes):
         return [
-            shape.text for layer in self.layers for shape in layer
-            if isinstance(shape, Text)]
+            shape for layer in self.layers
+            for shape in layer.shapes.of_type(*classes)]
+
+    @property
+    def names(self):
+        return [layer.name for layer in self.layers]
 
     @property
     def current_index(self):
@@ -65,65 +123,86 @@ class LayerStack:
     def current_index(self, value):
         self._current_index = value
 
+    def layer(self, layer_id):
+        return self.ids.get(layer_id)
+
+    def index(self, layer_id):
+        return self.layers.index(self.ids[layer_id])
+
+    def snapshot(self):
+        return [layer.snapshot() for layer in self.layers]
+
+    def restore(self, layers, current_index=None):
+        """
+        Replace the layers by copies of the given ones (e.g. undo snapshot).
+        """
+        self.layers = [layer.snapshot() for layer in layers]
+        self.ids = {layer.id: layer for layer in self.layers}
+        self.current_index = current_index
+
     def add(
             self, name, blend_mode: QPainter.CompositionMode=None,
             locked=False, index=None):
-        blend_mode = blend_mode or QPainter.CompositionMode_SourceOver
         if index is None:
             index = len(self.layers)
-        self.layers.insert(index, [])
-        self.locks.insert(index, locked)
-        self.opacities.insert(index, 255)
-        self.blend_modes.insert(index, blend_mode)
-        self.names.insert(index, name)
-        self.visibilities.insert(index, True)
+        layer = Layer(name, blend_mode=blend_mode, locked=locked)
+        self.layers.insert(index, layer)
+        self.ids[layer.id] = layer
         self.current_index = len(self.layers) - 1
 
     def duplicate_current(self):
         if self.current is None:
             return
         index = self.current_index
-        new_layer = [shape.copy() for shape in self.current]
-        self.layers.insert(index, new_layer)
-        self.opacities.insert(index, self.opacities[index])
-        self.blend_modes.insert(index, self.blend_modes[index])
-        name = unique_layer_name(self.names[index], self.names)
-        self.names.insert(index, name)
-        self.visibilities.insert(index, self.visibilities[index])
-        self.locks.insert(index, self.locks[index])
+        layer = self.layers[index]
+        layer = layer.copy(unique_layer_name(layer.name, self.names))
+        self.layers.insert(index, layer)
+        self.ids[layer.id] = layer
+
+    def insert(self, layer, index=None):
+        """
+        Insert an existing layer (e.g. pasted) and make it current.
+        """
+        if index is None:
+            index = len(self.layers)
+        layer.name = unique_layer_name(layer.name, self.names)
+        self.layers.insert(index, layer)
+        self.ids[layer.id] = layer
+        self.current_index = index
 
     @property
     def current_blend_mode_name(self):
         if self.current_index is None:
             return BLEND_MODE_NAMES[QPainter.CompositionMode_SourceOver]
-        return BLEND_MODE_NAMES[self.blend_modes[self.current_index]]
+        return BLEND_MODE_NAMES[self.current_layer.blend_mode]
 
     def set_current_blend_mode_name(self, name):
         if not self.current_index:
             return
-        self.blend_modes[self.current_index] = BLEND_MODE_FOR_NAMES[name]
+        self.current_layer.blend_mode = BLEND_MODE_FOR_NAMES[name]
 
     @property
     def is_locked(self):
         if self.current_index is None:
             return False
-        return self.locks[self.current_index]
+        return self.current_layer.locked
 
     @property
-    def current(self):
+    def current_layer(self):
         if self.current_index is None:
             return
         return self.layers[self.current_index]
 
+    @property
+    def current(self):
+        if self.current_index is None:
+            return
+        return self.layers[self.current_index].shapes
+
     def move_layer(self, old_index, new_index):
         if new_index > old_index:
             new_index -= 1
         self.layers.insert(new_index, self.layers.pop(old_index))
-        self.locks.insert(new_index, self.locks.pop(old_index))
-        self.names.insert(new_index, self.names.pop(old_index))
-        self.blend_modes.insert(new_index, self.blend_modes.pop(old_index))
-        self.opacities.insert(new_index, self.opacities.pop(old_index))
-        self.visibilities.insert(new_index, self.visibilities.pop(old_index))
         self.current_index = new_index
 
     def remove(self, element):
@@ -132,17 +211,13 @@ class LayerStack:
 
     def delete(self, index=None):
         if not index and self.current:
-            index = self.layers.index(self.current)
+            index = self.current_index
         if index is None:
             return
         if index != self.current_index:
             return
-        self.layers.pop(index)
-        self.visibilities.pop(index)
-        self.opacities.pop(index)
-        self.blend_modes.pop(index)
-        self.locks.pop(index)
-        self.names.pop(index)
+        layer = self.layers.pop(index)
+        del self.ids[layer.id]
 
         if not self.layers:
             self.current_index = None
@@ -153,7 +228,7 @@ class LayerStack:
         if not self.current:
             return
         for layer in reversed(self.layers):
-            for element in reversed(layer):
+            for element in reversed(layer.shapes):
                 if isinstance(element, (Arrow, Rectangle, Text, Line)):
                     for p in (element.start, element.end):
                         if is_point_hover_element(p, point):
@@ -162,22 +237,10 @@ class LayerStack:
                     return element
 
     def __iter__(self):
-        return zip(
-            self.layers,
-            self.names,
-            self.blend_modes,
-            self.locks,
-            self.visibilities,
-            self.opacities).__iter__()
+        return iter(self.layers)
 
     def __getitem__(self, index):
-        return (
-            self.layers[index],
-            self.names[index],
-            self.blend_modes[index],
-            self.locks[index],
-            self.visibilities[index],
-            self.opacities[index])
+        return self.layers[index]
 
     def __len__(self):
         return len(self.layers)
@@ -186,40 +249,47 @@ class LayerStack:
 def is_point_hover_element(element, point):
     if isinstance(point, QtCore.QPointF):
         point = point.toPoint()
+    function = shape_function(HOVER_FUNCTIONS, element)
+    if function is None:
+        return
+    return function(element, point)
 
-    if isinstance(element, (QtCore.QPoint, QtCore.QPointF)):
-        rect = QtCore.QRectF(element.x() - 10, element.y() - 10, 20, 20)
-        return rect.contains(point)
-    elif isinstance(element, Stroke):
-        return is_point_hover_stroke(element, point)
-    elif isinstance(element, Arrow):
-        distance = distance_qline_qpoint(element.line, point)
-        return distance <= element.tailwidth
-    elif isinstance(element, Line):
-        distance = distance_qline_qpoint(element.line, point)
-        return distance <= element.linewidth
-    elif isinstance(element, Text):
-        rect = QtCore.QRectF(element.start, element.end)
+
+def is_point_hover_handle(point, position):
+    rect = QtCore.QRectF(point.x() - 10, point.y() - 10, 20, 20)
+    return rect.contains(position)
+
+
+def is_point_hover_arrow(arrow, point):
+    return distance_qline_qpoint(arrow.line, point) <= arrow.tailwidth
+
+
+def is_point_hover_line(line, point):
+    return distance_qline_qpoint(line.line, point) <= line.linewidth
+
+
+def is_point_hover_text(text, point):
+    return QtCore.QRectF(text.start, text.end).contains(point)
+
+
+def is_point_hover_rectangle(rectangle, point):
+    rect = QtCore.QRectF(rectangle.start, rectangle.end)
+    if rectangle.filled:
         return rect.contains(point)
-    elif isinstance(element, Rectangle):
-        rect = QtCore.QRectF(element.start, element.end)
-        if element.filled:
-            return rect.contains(point)
-        lines = (
-            (rect.topLeft(), rect.bottomLeft()),
-            (rect.topLeft(), rect.topRight()),
-            (rect.topRight(), rect.bottomRight()),
-            (rect.bottomLeft(), rect.bottomRight()))
-        for line in lines:
-            line = QtCore.QLineF(*line)
-            if distance_qline_qpoint(line, point) <= element.linewidth:
-                return True
-        return False
-    elif isinstance(element, Circle):
-        # TODO
-        return False
-    elif isinstance(element, Bitmap):
-        return element.rect.contains(point)
+    lines = (
+        (rect.topLeft(), rect.bottomLeft()),
+        (rect.topLeft(), rect.topRight()),
+        (rect.topRight(), rect.bottomRight()),
+        (rect.bottomLeft(), rect.bottomRight()))
+    for line in lines:
+        line = QtCore.QLineF(*line)
+        if distance_qline_qpoint(line, point) <= rectangle.linewidth:
+            return True
+    return False
+
+
+def is_point_hover_bitmap(bitmap, point):
+    return bitmap.rect.contains(point)
 
 
 def is_point_hover_stroke(stroke, point):
@@ -237,6 +307,19 @@ def is_point_hover_stroke(stroke, point):
     return False
 
 
+# Circle uses the Rectangle hit test.
+HOVER_FUNCTIONS = {
+    QtCore.QPoint: is_point_hover_handle,
+    QtCore.QPointF: is_point_hover_handle,
+    Stroke: is_point_hover_stroke,
+    Arrow: is_point_hover_arrow,
+    Line: is_point_hover_line,
+    Text: is_point_hover_text,
+    Rectangle: is_point_hover_rectangle,
+    Bitmap: is_point_hover_bitmap,
+}
+
+
 def unique_layer_name(name, names):
     if name not in names:
         return name
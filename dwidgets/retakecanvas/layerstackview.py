@@ -6,6 +6,7 @@ from dwidgets.qtutils import grow_rect
 from dwidgets.retakecanvas.dialog import OpacityDialog, RenameDialog
 from dwidgets.retakecanvas.qtutils import pixmap
 from dwidgets.retakecanvas.shapes import Bitmap
+from dwidgets.retakecanvas.thumbnails import thumbnail_cache
 
 
 class LayerStackView(QtWidgets.QWidget):
@@ -31,6 +32,8 @@ class LayerStackView(QtWidgets.QWidget):
         self.buffer_state = None
         self.dragging = False
 
+        self.thumbnails = thumbnail_cache()
+        self.thumbnails.thumbnailReady.connect(self.update)
         self.setAcceptDrops(True)
 
     def dragEnterEvent(self, event):
@@ -45,7 +48,7 @@ class LayerStackView(QtWidgets.QWidget):
             self.add_layers_from_paths(paths)
 
     def add_layers_from_paths(self, paths):
-        images = [QtGui.QImage(p.strip('/\\')) for p in paths]
+        images = [self.model.load_image(p.strip('/\\')) for p in paths]
         images = [image for image in images if not image.isNull()]
         for image in images:
             size = image.size()
@@ -82,11 +85,11 @@ class LayerStackView(QtWidgets.QWidget):
         self.handle_mode = mode
         self.handle_index = index
         if mode == 'visibility':
-            self.buffer_state = not self.layerstack.visibilities[index]
-            self.layerstack.visibilities[index] = self.buffer_state
+            self.buffer_state = not self.layerstack[index].visible
+            self.layerstack[index].visible = self.buffer_state
         elif mode == 'lock':
-            self.buffer_state = not self.layerstack.locks[index]
-            self.layerstack.locks[index] = self.buffer_state
+            self.buffer_state = not self.layerstack[index].locked
+            self.layerstack[index].locked = self.buffer_state
         elif mode == 'opacity':
             dialog = OpacityDialog(self.layerstack, index, self)
             row = self.row(index)
@@ -103,9 +106,9 @@ class LayerStackView(QtWidgets.QWidget):
     def mouseMoveEvent(self, event):
         mode, index = self.get_handle_infos(event.pos())
         if self.handle_mode == 'visibility' and mode == 'visibility':
-            self.layerstack.visibilities[index] = self.buffer_state
+            self.layerstack[index].visible = self.buffer_state
         elif self.handle_mode == 'lock' and mode == 'lock':
-            self.layerstack.locks[index] = self.buffer_state
+            self.layerstack[index].locked = self.buffer_state
         elif self.handle_mode == 'drag' and self.handle_index is not None:
             self.dragging = True
         self.repaint()
@@ -146,6 +149,8 @@ class LayerStackView(QtWidgets.QWidget):
                 return 'visibility', index
             if self.lock_rect(row).contains(pos):
                 return 'lock', index
+            if self.thumbnail_rect(row).contains(pos):
+                return 'drag', index
             if self.text_rect(row).contains(pos):
                 return 'drag', index
             if self.opacity_rect(row).contains(pos):
@@ -195,8 +200,11 @@ class LayerStackView(QtWidgets.QWidget):
     def opacity_rect(self, row):
         return self.button_rect(row, fromleft=False)
 
+    def thumbnail_rect(self, row):
+        return self.button_rect(row, 3)
+
     def text_rect(self, row):
-        rect_left = self.button_rect(row, 2)
+        rect_left = self.button_rect(row, 3)
         left = rect_left.right()
         top = rect_left.top()
         width = self.width() - left - self.ITEM_HEIGHT
@@ -242,7 +250,7 @@ class LayerStackView(QtWidgets.QWidget):
         color.setAlpha(25)
         painter.setBrush(color)
         painter.drawRoundedRect(event.rect(), self.PADDING, self.PADDING)
-        for i, (rect, (_, name, _, lock, visible, opacity)) in iterator:
+        for i, (rect, layer) in iterator:
             row = self.row(i)
             # Draw alternate row.
             if row % 2 == 0:
@@ -271,7 +279,7 @@ class LayerStackView(QtWidgets.QWidget):
             color.setAlpha(33)
             painter.setBrush(color)
             painter.drawRoundedRect(cellrect, 4, 4)
-            if visible:
+            if layer.visible:
                 cellrect = grow_rect(cellrect, -2).toRect()
                 painter.setPen(QtCore.Qt.transparent)
                 painter.setBrush(QtCore.Qt.transparent)
@@ -284,14 +292,27 @@ class LayerStackView(QtWidgets.QWidget):
             painter.setBrush(color)
             painter.drawRoundedRect(cellrect, 4, 4)
             painter.setPen(QtCore.Qt.black)
-            px = self.locker_closed_pixmap if lock else self.locker_open_pixmap
+            px = (
+                self.locker_closed_pixmap if layer.locked else
+                self.locker_open_pixmap)
             painter.drawPixmap(cellrect, px)
             # Draw opacity.
             cellrect = grow_rect(self.opacity_rect(row), -6).toRect()
             painter.drawPixmap(cellrect, self.opacity_bg_pixmap)
-            painter.setOpacity(opacity / 255)
+            painter.setOpacity(layer.opacity / 255)
             painter.drawPixmap(cellrect, self.opacity_fg_pixmap)
             painter.setOpacity(1)
+            # Draw thumbnail.
+            cellrect = grow_rect(self.thumbnail_rect(row), -2).toRect()
+            painter.setPen(QtCore.Qt.NoPen)
+            color = QtGui.QColor(QtCore.Qt.black)
+            color.setAlpha(33)
+            painter.setBrush(color)
+            painter.drawRect(cellrect)
+            thumbnail = self.thumbnails.layer(
+                self.model, layer.id, cellrect.width())
+            if thumbnail is not None:
+                painter.drawImage(cellrect.topLeft(), thumbnail)
             # Draw text
             oldmode = painter.compositionMode()
             mode = QtGui.QPainter.CompositionMode_Difference
@@ -302,7 +323,7 @@ class LayerStackView(QtWidgets.QWidget):
             option.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter)
             rect = self.text_rect(row)
             rect.setLeft(rect.left() + 5)
-            painter.drawText(rect, name, option)
+            painter.drawText(rect, layer.name, option)
             painter.setCompositionMode(oldmode)
             # Draw drag and drop
             if self.handle_mode == 'drag' and self.dragging:
@@ -1,5 +1,10 @@
 import math
 
+try:
+    import numpy
+except ImportError:  # Optional, used to vectorize the point tests.
+    numpy = None
+
 
 def distance(a, b):
     """ return distance between two points """
@@ -8,6 +13,26 @@ def distance(a, b):
     return math.sqrt(abs(x + y))
 
 
+def decimate_stroke_points(points, tolerance):
+    """
+    Drop the stroke points closer than tolerance from the last kept point.
+    points: list of [point, size]. The first and last points are kept.
+    """
+    if len(points) < 3:
+        return points
+    result = [points[0]]
+    x, y = points[0][0].x(), points[0][0].y()
+    squared_tolerance = tolerance ** 2
+    for data in points[1:-1]:
+        point = data[0]
+        if (point.x() - x) ** 2 + (point.y() - y) ** 2 < squared_tolerance:
+            continue
+        result.append(data)
+        x, y = point.x(), point.y()
+    result.append(points[-1])
+    return result
+
+
 def distance_qline_qpoint(line, point):
     return distance_point_segment(
         point.x(), point.y(),
@@ -44,3 +69,35 @@ def distance_point_segment(px, py, x1, y1, x2, y2):
         ix = x1 + u * (x2 - x1)
         iy = y1 + u * (y2 - y1)
         return line_magnitude(px, py, ix, iy)
+
+
+def points_in_polygon(coordinates, polygon):
+    """
+    Even-odd point in polygon test vectorized with numpy.
+    coordinates: numpy array of shape (n, 2).
+    polygon: list of (x, y) vertices.
+    Return a boolean numpy array of n values.
+    """
+    inside = numpy.zeros(len(coordinates), dtype=bool)
+    if len(polygon) < 3 or not len(coordinates):
+        return inside
+    vertices = numpy.asarray(polygon, dtype=float)
+    left, top = vertices.min(axis=0)
+    right, bottom = vertices.max(axis=0)
+    xs, ys = coordinates[:, 0], coordinates[:, 1]
+    candidates = numpy.flatnonzero(
+        (xs >= left) & (xs <= right) & (ys >= top) & (ys <= bottom))
+    xs, ys = xs[candidates], ys[candidates]
+    result = numpy.zeros(len(candidates), dtype=bool)
+    x1, y1 = vertices[-1]
+    for x2, y2 in vertices:
+        crossing = (y1 > ys) != (y2 > ys)
+        if crossing.any():
+            # Edge abscissa at the points height, only used where the edge
+            # crosses the horizontal ray, so y1 != y2.
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                x = x1 + (ys - y1) * (x2 - x1) / (y2 - y1)
+            result ^= crossing & (xs < x)
+        x1, y1 = x2, y2
+    inside[candidates] = result
+    return inside
@@ -1,15 +1,21 @@
+import itertools
 import os
 from PySide2 import QtGui, QtCore
 
+from dwidgets.retakecanvas.geometry import ImagesLayout
 from dwidgets.retakecanvas.layerstack import LayerStack, unique_layer_name
+from dwidgets.retakecanvas.imageloader import mapped_frame
+from dwidgets.retakecanvas.imagepool import image_pool
 from dwidgets.retakecanvas.qtutils import COLORS
 from dwidgets.retakecanvas.selection import Selection
+from dwidgets.retakecanvas.snapping import SnapIndex
 from dwidgets.retakecanvas.navigator import Navigator
 from dwidgets.retakecanvas.viewport import ViewportMapper
 from dwidgets.retakecanvas.shapes import Bitmap
 
 
 UNDOLIMIT = 50
+_model_uids = itertools.count()
 
 
 class DrawContext:
@@ -20,6 +26,7 @@ class DrawContext:
         self.filled = False
         self.size = 10
         self.text_size = 5
+        self.snapping = False
 
 
 class RetakeCanvasModel:
@@ -29,24 +36,37 @@ class RetakeCanvasModel:
     VERTICAL = 3
 
     def __init__(self, baseimage=None):
+        # Unique in the session, unlike id() which can be reused once the
+        # model is garbage collected. Used as cache key.
+        self.uid = next(_model_uids)
         self.locked = False
 
-        self.baseimage = baseimage or QtGui.QImage()
+        self.baseimage = (
+            image_pool().acquire(baseimage) if baseimage else QtGui.QImage())
         size = self.baseimage.size()
         self.baseimage_wipes = QtCore.QRect(0, 0, size.width(), size.height())
         self.imagestack = []
         self.imagestack_wipes = []
         self.imagestack_layout = self.GRID
+        # Pooled images loaded for the layers bitmaps.
+        self.layer_images = []
+        self._images_layout = None
+        self._images_layout_key = None
 
         self.drawcontext = DrawContext()
         self.layerstack = LayerStack()
         self.navigator = Navigator()
         self.viewportmapper = ViewportMapper()
         self.selection = Selection()
+        self.snapindex = SnapIndex()
 
         self.wash_color = '#FFFFFF'
         self.wash_opacity = 0
 
+        # Incremented each time the undo state changes. Used as cache key.
+        self.revision = 0
+        # Functions called with the model each time the undo state changes.
+        self.state_callbacks = []
         self.undostack = []
         self.redostack = []
         self.add_undo_state()
@@ -55,13 +75,44 @@ class RetakeCanvasModel:
     def texts(self):
         return self.layerstack.texts
 
+    def images_layout(self):
+        """
+        Return the ImagesLayout of the base image and the comparing images.
+        It is recomputed only if an image or the layout changed.
+        """
+        images = [self.baseimage] + self.imagestack
+        key = (
+            tuple(
+                (image.cacheKey(), image.width(), image.height())
+                for image in images),
+            self.imagestack_layout)
+        if key != self._images_layout_key:
+            self._images_layout = ImagesLayout(
+                self.baseimage, self.imagestack, self.imagestack_layout)
+            self._images_layout_key = key
+        return self._images_layout
+
     def append_image(self, image: QtGui.QImage):
+        self._append_pooled_image(image_pool().acquire(image))
+
+    def append_image_path(self, path):
+        """
+        Load and append a comparing image. Return False if it can't be read.
+        """
+        image = image_pool().acquire_path(path)
+        if image.isNull():
+            return False
+        self._append_pooled_image(image)
+        return True
+
+    def _append_pooled_image(self, image):
         self.imagestack.append(image)
         width, height = image.size().width(), image.size().height()
         self.imagestack_wipes.append(QtCore.QRect(0, 0, width, height))
         self.add_undo_state()
 
     def delete_image(self, index):
+        image_pool().release(self.imagestack[index])
         del self.imagestack[index]
         del self.imagestack_wipes[index]
         self.add_undo_state()
@@ -73,9 +124,13 @@ class RetakeCanvasModel:
         self.add_undo_state()
 
     def set_baseimage(self, image: QtGui.QImage):
+        image_pool().release(self.baseimage)
+        image = image_pool().acquire(image)
         self.baseimage = image
         width, height = image.size().width(), image.size().height()
         self.baseimage_wipes = QtCore.QRect(0, 0, width, height)
+        self.revision += 1
+        self.state_changed()
 
     def add_layer(
             self, undo=True, name=None, locked=False, blend_mode=None, index=None):
@@ -86,10 +141,25 @@ class RetakeCanvasModel:
         if undo:
             self.add_undo_state()
 
+    def load_image(self, path):
+        """
+        Return the pooled image of the path. It stays referenced until the
+        model is closed, as the undo states can still use it. Mapped frames
+        are returned as copies: the bitmaps can be pasted in other documents
+        which outlive this one.
+        """
+        image = image_pool().acquire_path(path)
+        if image.isNull():
+            return image
+        self.layer_images.append(image)
+        if mapped_frame(image) is not None:
+            return image.copy()
+        return image
+
     def add_layer_image(self, path, blend_mode=None, undo=True):
         name = os.path.splitext(os.path.basename(path))[0]
         self.add_layer(undo=undo, name=name, blend_mode=blend_mode)
-        image = QtGui.QImage(path)
+        image = self.load_image(path)
         rect = QtCore.QRect(0, 0, image.size().width(), image.size().height())
         shape = Bitmap(image, rect)
         self.add_shape(shape)
@@ -107,40 +177,54 @@ class RetakeCanvasModel:
         self.add_undo_state()
 
     def add_undo_state(self):
+        # The shapes are edited in the current layer.
+        layer = self.layerstack.current_layer
+        if layer is not None:
+            layer.touch()
         self.redostack = []
+        self.undostack.append(self.state())
+        self.undostack = self.undostack[-UNDOLIMIT:]
+        self.revision += 1
+        self.state_changed()
+
+    def state(self):
+        """
+        Snapshot of the document. The layers and their shapes are copied.
+        The state references the mapped frames of its images, they stay
+        mapped while it can be restored.
+        """
         wipes = [QtCore.QRectF(w) for w in self.imagestack_wipes]
-        layers = self.layerstack.layers
-        state = {
+        frames = [mapped_frame(image) for image in self.imagestack]
+        return {
             'baseimage_wipes': QtCore.QRectF(self.baseimage_wipes),
             'imagestack': [QtGui.QImage(img) for img in self.imagestack],
             'imagestack_wipes': wipes,
-            'layers': [[elt.copy() for elt in layer] for layer in layers],
-            'locks': self.layerstack.locks.copy(),
-            'opacities': self.layerstack.opacities.copy(),
-            'blend_modes': self.layerstack.blend_modes.copy(),
-            'names': self.layerstack.names.copy(),
-            'visibilities': self.layerstack.visibilities.copy(),
+            'layers': self.layerstack.snapshot(),
             'current': self.layerstack.current_index,
             'wash_color': self.wash_color,
-            'wash_opacity': self.wash_opacity
+            'wash_opacity': self.wash_opacity,
+            'frames': [frame for frame in frames if frame is not None]
         }
-        self.undostack.append(state)
-        self.undostack = self.undostack[-UNDOLIMIT:]
+
+    def state_changed(self):
+        for callback in self.state_callbacks:
+            callback(self)
 
     def restore_state(self, state):
-        layers = [[elt.copy() for elt in layer] for layer in state['layers']]
+        # The images of the restored state are acquired before the current
+        # ones are released, the images kept don't leave the pool.
+        pool = image_pool()
+        imagestack = [pool.acquire(image) for image in state['imagestack']]
+        for image in self.imagestack:
+            pool.release(image)
         self.baseimage_wipes = state['baseimage_wipes']
-        self.imagestack = state['imagestack']
+        self.imagestack = imagestack
         self.imagestack_wipes = state['imagestack_wipes']
-        self.layerstack.layers = layers
-        self.layerstack.locks = state['locks']
-        self.layerstack.opacities = state['opacities']
-        self.layerstack.names = state['names']
-        self.layerstack.blend_modes = state['blend_modes']
-        self.layerstack.visibilities = state['visibilities']
-        self.layerstack.current_index = state['current']
+        self.layerstack.restore(state['layers'], state['current'])
         self.wash_color = state['wash_color']
         self.wash_opacity = state['wash_opacity']
+        self.revision += 1
+        self.state_changed()
 
     def undo(self):
         if not self.undostack:
@@ -157,6 +241,19 @@ class RetakeCanvasModel:
         self.undostack.append(state)
         self.restore_state(state)
 
+    def close(self):
+        """
+        Release the pooled images. The model must not be used anymore.
+        """
+        pool = image_pool()
+        for image in [self.baseimage] + self.imagestack + self.layer_images:
+            pool.release(image)
+        self.baseimage = QtGui.QImage()
+        self.imagestack = []
+        self.layer_images = []
+        self.undostack = []
+        self.redostack = []
+
     def default_state(self):
         wipes = QtCore.QRectF(
             0, 0, self.baseimage.size().width(),
@@ -166,12 +263,7 @@ class RetakeCanvasModel:
             'baseimage_wipes': wipes,
             'imagestack': [],
             'imagestack_wipes': [],
-            'blend_modes': [],
             'layers': [],
-            'locks': [],
-            'names': [],
-            'opacities': [],
-            'visibilities': [],
             'current': None,
             'wash_color': '#FFFFFF',
             'wash_opacity': 0,
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.canvas import draw_layer
+from dwidgets.retakecanvas.geometry import combined_rect, shape_bounds
+from dwidgets.retakecanvas.viewport import ViewportMapper
+
+
+# Units added around the shapes bounds to include the strokes width.
+GHOST_MARGIN = 25
+
+
+def render_ghost(model, color=None):
+    """
+    Render the visible layers of the model at scale 1 on a transparent
+    image. Return (image, units rect) or (None, None) if nothing is drawn.
+    color: paint all the drawn pixels with this color.
+    """
+    layers = [layer for layer in model.layerstack if layer.visible]
+    rects = [
+        shape_bounds(shape) for layer in layers for shape in layer.shapes]
+    rects = [rect for rect in rects if rect is not None]
+    if not rects:
+        return None, None
+    margin = GHOST_MARGIN
+    rect = combined_rect(rects).adjusted(-margin, -margin, margin, margin)
+    rect = QtCore.QRectF(rect.toAlignedRect())
+    image = QtGui.QImage(
+        int(rect.width()), int(rect.height()),
+        QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.fill(QtCore.Qt.transparent)
+    viewportmapper = ViewportMapper()
+    viewportmapper.origin = rect.topLeft()
+    painter = QtGui.QPainter(image)
+    painter.setRenderHint(QtGui.QPainter.Antialiasing)
+    try:
+        for layer in layers:
+            draw_layer(
+                painter, layer.shapes, layer.blend_mode, layer.opacity,
+                viewportmapper)
+        if color is not None:
+            mode = QtGui.QPainter.CompositionMode_SourceIn
+            painter.setCompositionMode(mode)
+            painter.fillRect(image.rect(), QtGui.QColor(color))
+    finally:
+        painter.end()
+    return image, rect
+
+
+class OnionSkin:
+    """
+    Ghosts of the annotations of the neighbouring frames, drawn over the
+    images and under the layers of the current frame. The application gives
+    the models of the previous and following frames, closest first.
+    Each ghost is rendered once per frame model and revision and kept in a
+    least recently used cache, so toggling or scrubbing the frames only
+    draws the cached images.
+    opacity: opacity of the closest ghosts, divided by the frames distance.
+    tinted: paint the previous and following ghosts with a flat color.
+    """
+    CAPACITY = 8
+    PREVIOUS_COLOR = '#FF4040'
+    FOLLOWING_COLOR = '#40C0FF'
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity or self.CAPACITY
+        self.enabled = False
+        self.opacity = 0.5
+        self.tinted = True
+        self.previous = []
+        self.following = []
+        self.ghosts = OrderedDict()
+
+    def set_models(self, previous=(), following=()):
+        self.previous = list(previous)
+        self.following = list(following)
+
+    def ghost(self, model, color):
+        color = color if self.tinted else None
+        key = (
+            model.uid, model.revision, color,
+            tuple(
+                (layer.id, layer.visible, layer.opacity, layer.blend_mode)
+                for layer in model.layerstack))
+        ghost = self.ghosts.get(key)
+        if ghost is None:
+            ghost = render_ghost(model, color)
+            self.ghosts[key] = ghost
+            while len(self.ghosts) > self.capacity:
+                self.ghosts.popitem(last=False)
+        self.ghosts.move_to_end(key)
+        return ghost
+
+    def clear(self):
+        self.ghosts.clear()
+
+    def draw(self, painter, viewportmapper):
+        if not self.enabled:
+            return
+        frames = (
+            (self.previous, self.PREVIOUS_COLOR),
+            (self.following, self.FOLLOWING_COLOR))
+        for models, color in frames:
+            for distance, model in enumerate(models, 1):
+                image, rect = self.ghost(model, color)
+                if image is None:
+                    continue
+                painter.setOpacity(self.opacity / distance)
+                painter.drawImage(
+                    viewportmapper.to_viewport_rect(rect), image)
+        painter.setOpacity(1)
@@ -4,16 +4,22 @@ from PySide2 import QtWidgets, QtCore, QtGui
 from dwidgets.retakecanvas.button import (
     ColorAction, ComparingMediaTable, Garbage, ToolNameLabel)
 from dwidgets.retakecanvas import tools
+from dwidgets.retakecanvas.autosave import (
+    Autosave, has_journal, journal_path, recover)
 from dwidgets.retakecanvas.canvas import Canvas
+from dwidgets.retakecanvas.clipboard import (
+    LAYERS, SHAPES, mime_data_content, selected_shapes, set_clipboard)
 from dwidgets.retakecanvas.dialog import ColorSelection
 from dwidgets.retakecanvas.layerstack import BLEND_MODE_NAMES
 from dwidgets.retakecanvas.layerstackview import LayerStackView
 from dwidgets.retakecanvas.model import RetakeCanvasModel
+from dwidgets.retakecanvas.onionskin import OnionSkin
 from dwidgets.retakecanvas.qtutils import icon, set_shortcut
 from dwidgets.retakecanvas.settings import (
-    GeneralSettings, ArrowSettings, FillableShapeSettings, SmoothDrawSettings,
-    ShapeSettings)
+    BrushSettings, GeneralSettings, ArrowSettings, FillableShapeSettings,
+    FillSettings, SmoothDrawSettings, ShapeSettings)
 from dwidgets.retakecanvas.selection import Selection
+from dwidgets.retakecanvas.serialize import save_session
 from dwidgets.retakecanvas.shapes import Bitmap
 from dwidgets.retakecanvas.tools.erasertool import (
     erase_on_layer, get_point_to_erase)
@@ -295,16 +301,23 @@ class RetakeCanvas(QtWidgets.QWidget):
     def __init__(self, model=None, parent=None):
         super().__init__(parent=parent)
         self.model = model or RetakeCanvasModel()
+        # Model created by the widget, closed when it is replaced. The models
+        # given by the application are closed by the application.
+        self._own_model = None if model else self.model
         self.central_widget = QtWidgets.QWidget()
 
         self.fullscreen_window = None
+        self.session_path = None
+        self.autosave = None
 
         self.layerview = LayerView(self.model, parent=self)
         self.layerview.edited.connect(self.repaint)
         self.layerview.layoutChanged.connect(self.layout_changed)
         self.layerview.comparingRemoved.connect(self.remove_comparing)
 
+        self.onionskin = OnionSkin()
         self.canvas = Canvas(self.model)
+        self.canvas.onionskin = self.onionskin
         self.canvas.selectionChanged.connect(self.update_shape_settings_view)
         self.canvas.isUpdated.connect(self.layerview.sync_view)
         self.canvas.zoomChanged.connect(self.zoom_changed)
@@ -330,6 +343,10 @@ class RetakeCanvas(QtWidgets.QWidget):
         self.selection_a.setCheckable(True)
         self.selection_a.tool = tools.SelectionTool
         self.selection_a.triggered.connect(self.set_tool)
+        self.lasso = QtWidgets.QAction(icon('lasso.png'), '', self)
+        self.lasso.setCheckable(True)
+        self.lasso.tool = tools.LassoSelectionTool
+        self.lasso.triggered.connect(self.set_tool)
         self.freedraw = QtWidgets.QAction(icon('freehand.png'), '', self)
         self.freedraw.setCheckable(True)
         self.freedraw.tool = tools.DrawTool
@@ -338,6 +355,14 @@ class RetakeCanvas(QtWidgets.QWidget):
         self.smoothdraw.setCheckable(True)
         self.smoothdraw.tool = tools.SmoothDrawTool
         self.smoothdraw.triggered.connect(self.set_tool)
+        self.brush = QtWidgets.QAction(icon('brush.png'), '', self)
+        self.brush.setCheckable(True)
+        self.brush.tool = tools.RasterBrushTool
+        self.brush.triggered.connect(self.set_tool)
+        self.fill = QtWidgets.QAction(icon('fill.png'), '', self)
+        self.fill.setCheckable(True)
+        self.fill.tool = tools.FillTool
+        self.fill.triggered.connect(self.set_tool)
         self.eraser = QtWidgets.QAction(icon('eraser.png'), '', self)
         self.eraser.setCheckable(True)
         self.eraser.tool = tools.EraserTool
@@ -374,19 +399,25 @@ class RetakeCanvas(QtWidgets.QWidget):
         set_shortcut('CTRL+Z', self.central_widget, self.undo)
         set_shortcut('CTRL+Y', self.central_widget, self.redo)
         set_shortcut('F', self.central_widget, self.canvas.reset)
+        set_shortcut('CTRL+C', self.central_widget, self.copy)
+        set_shortcut('CTRL+X', self.central_widget, self.cut)
         set_shortcut('CTRL+V', self.central_widget, self.paste)
         set_shortcut('CTRL+D', self.central_widget, self.model.selection.clear)
         set_shortcut('DEL', self.central_widget, self.do_delete)
         set_shortcut('M', self.central_widget, self.move_a.trigger)
         set_shortcut('B', self.central_widget, self.freedraw.trigger)
+        set_shortcut('P', self.central_widget, self.brush.trigger)
+        set_shortcut('G', self.central_widget, self.fill.trigger)
         set_shortcut('E', self.central_widget, self.eraser.trigger)
         set_shortcut('S', self.central_widget, self.selection_a.trigger)
+        set_shortcut('SHIFT+S', self.central_widget, self.lasso.trigger)
         set_shortcut('L', self.central_widget, self.line.trigger)
         set_shortcut('R', self.central_widget, self.rectangle.trigger)
         set_shortcut('C', self.central_widget, self.circle.trigger)
         set_shortcut('T', self.central_widget, self.text.trigger)
         set_shortcut('A', self.central_widget, self.arrow.trigger)
         set_shortcut('Tab', self.central_widget, self.toggle_panel)
+        set_shortcut('O', self.central_widget, self.toggle_onion_skin)
         set_shortcut('F11', self.central_widget, self.switch_fullscreen)
         set_shortcut(
             QtCore.Qt.Key_Period | QtCore.Qt.KeypadModifier,
@@ -414,9 +445,12 @@ class RetakeCanvas(QtWidgets.QWidget):
             self.navigation: tools.NavigationTool(**kwargs),
             self.move_a: tools.MoveTool(**kwargs),
             self.selection_a: tools.SelectionTool(**kwargs),
+            self.lasso: tools.LassoSelectionTool(**kwargs),
             self.freedraw: tools.DrawTool(**kwargs),
             self.eraser: tools.EraserTool(**kwargs),
             self.smoothdraw: tools.SmoothDrawTool(**kwargs),
+            self.brush: tools.RasterBrushTool(**kwargs),
+            self.fill: tools.FillTool(**kwargs),
             self.line: tools.LineTool(**kwargs),
             self.transform: tools.TransformTool(**kwargs),
             self.rectangle: tools.RectangleTool(**kwargs),
@@ -430,8 +464,11 @@ class RetakeCanvas(QtWidgets.QWidget):
         self.tools_group.addAction(self.move_a)
         self.tools_group.addAction(self.transform)
         self.tools_group.addAction(self.selection_a)
+        self.tools_group.addAction(self.lasso)
         self.tools_group.addAction(self.freedraw)
         self.tools_group.addAction(self.smoothdraw)
+        self.tools_group.addAction(self.brush)
+        self.tools_group.addAction(self.fill)
         self.tools_group.addAction(self.eraser)
         self.tools_group.addAction(self.line)
         self.tools_group.addAction(self.rectangle)
@@ -448,7 +485,9 @@ class RetakeCanvas(QtWidgets.QWidget):
             self.rectangle: self.fillable_shape_settings,
             self.circle: self.fillable_shape_settings,
             self.arrow: ArrowSettings(self.tools[self.arrow]),
-            self.smoothdraw: SmoothDrawSettings(self.tools[self.smoothdraw])}
+            self.smoothdraw: SmoothDrawSettings(self.tools[self.smoothdraw]),
+            self.brush: BrushSettings(self.tools[self.brush]),
+            self.fill: FillSettings(self.tools[self.fill])}
 
         spacer = QtWidgets.QWidget()
         spacer.setSizePolicy(*[QtWidgets.QSizePolicy.Expanding] * 2)
@@ -472,6 +511,8 @@ class RetakeCanvas(QtWidgets.QWidget):
         settings_layout.addSpacing(default_spacing)
         settings_layout.addWidget(self.setting_widgets[self.arrow])
         settings_layout.addWidget(self.setting_widgets[self.smoothdraw])
+        settings_layout.addWidget(self.setting_widgets[self.brush])
+        settings_layout.addWidget(self.setting_widgets[self.fill])
         settings_layout.addWidget(self.fillable_shape_settings)
 
         self.shape_settings_label = ToolNameLabel('Shape Options')
@@ -556,11 +597,8 @@ class RetakeCanvas(QtWidgets.QWidget):
     def layer_names(self, include_hidden=True):
         if include_hidden:
             return self.model.layerstack.names
-        layerstack = self.model.layerstack
         return [
-            name for name, visible in
-            zip(layerstack.names, layerstack.visibilities)
-            if visible]
+            layer.name for layer in self.model.layerstack if layer.visible]
 
     def render(self, model):
         return self.canvas.render(model=model)
@@ -577,15 +615,73 @@ class RetakeCanvas(QtWidgets.QWidget):
         self.layerview.sync_view()
         self.canvas.repaint()
 
+    def copy(self):
+        """
+        Copy the selected shapes or, without selection, the current layer.
+        """
+        shapes = selected_shapes(self.model)
+        if shapes:
+            set_clipboard(SHAPES, shapes)
+        elif self.model.layerstack.current_layer is not None:
+            set_clipboard(LAYERS, [self.model.layerstack.current_layer])
+        else:
+            return False
+        return True
+
+    def cut(self):
+        if self.model.locked or self.model.layerstack.is_locked:
+            return
+        shapes = selected_shapes(self.model)
+        if not self.copy():
+            return
+        if shapes:
+            for shape in shapes:
+                self.model.layerstack.remove(shape)
+        else:
+            self.model.layerstack.delete(self.model.layerstack.current_index)
+        self.model.selection.clear()
+        self.model.add_undo_state()
+        self.layerview.sync_view()
+        self.canvas.repaint()
+
     def paste(self):
         if self.model.locked:
             return
+        content = mime_data_content(
+            QtWidgets.QApplication.clipboard().mimeData())
+        if content is not None:
+            return self.paste_content(*content)
         image = QtWidgets.QApplication.clipboard().image()
         if not image:
             return
         return self.add_layer_image(
             name="Pasted image", image=image, center_on_canvas=True)
 
+    def paste_content(self, kind, items):
+        """
+        Add shapes or layers decoded from the clipboard at their original
+        position.
+        """
+        if not items:
+            return
+        layerstack = self.model.layerstack
+        self.model.selection.clear()
+        if kind == LAYERS:
+            index = layerstack.current_index
+            index = len(layerstack.layers) if index is None else index + 1
+            for layer in items:
+                layerstack.insert(layer, index)
+                index += 1
+        else:
+            if layerstack.current is None:
+                self.model.add_layer(undo=False, name='Pasted shapes')
+            elif layerstack.is_locked:
+                return
+            layerstack.current.extend(items)
+        self.model.add_undo_state()
+        self.layerview.sync_view()
+        self.canvas.repaint()
+
     def current_index(self):
         if not self.model:
             return
@@ -632,7 +728,7 @@ class RetakeCanvas(QtWidgets.QWidget):
         """
         Clear current document.
         """
-        self.set_model(RetakeCanvasModel())
+        self.set_model(None)
 
     def layout_changed(self):
         state = self.model.imagestack_layout == RetakeCanvasModel.STACKED
@@ -691,7 +787,17 @@ class RetakeCanvas(QtWidgets.QWidget):
             widget.setVisible(widget == self.setting_widgets.get(action))
 
     def set_model(self, model):
-        model = model or RetakeCanvasModel()
+        """
+        Display another model. The autosave of the previous one is stopped,
+        its journal is kept.
+        """
+        if model is not self.model:
+            self.stop_autosave()
+        if self._own_model is not None and self._own_model is not model:
+            self._own_model.close()
+            self._own_model = None
+        if model is None:
+            model = self._own_model = RetakeCanvasModel()
         self.model = model
         self.zoom.set_model(model)
         self.layerview.set_model(model)
@@ -705,6 +811,74 @@ class RetakeCanvas(QtWidgets.QWidget):
         self.layerview.sync_view()
         self.canvas.repaint()
 
+    def set_session_path(self, path):
+        """
+        Autosave the document to a journal next to the session path. If a
+        journal was left by a crash, offer to recover it first. The journal
+        of the previous session is discarded.
+        """
+        self.discard_autosave()
+        self.session_path = path
+        if path is None:
+            return
+        journal = journal_path(path)
+        recovered = False
+        if has_journal(journal):
+            answer = QtWidgets.QMessageBox.question(
+                self, 'Recover document',
+                'Unsaved changes were found for this document.\n'
+                'Do you want to recover them?')
+            if answer == QtWidgets.QMessageBox.Yes:
+                recovered = recover(journal, self.model) is not None
+                if recovered:
+                    self.set_model(self.model)
+        self.autosave = Autosave(self.model, journal)
+        if not recovered:
+            self.autosave.reset()
+        self.autosave.start()
+        if recovered:
+            # The recovered changes are not saved yet, keep them journaled.
+            self.autosave.push(self.model)
+
+    def save_session(self, path=None):
+        """
+        Save the document. Saved to the session path, its journal is reset
+        and restarts with the next change.
+        """
+        path = path or self.session_path
+        if path is None:
+            raise ValueError('No session path to save the document.')
+        save_session(self.model, path)
+        if self.autosave is not None and path == self.session_path:
+            self.autosave.reset()
+
+    def stop_autosave(self):
+        if self.autosave is not None:
+            self.autosave.stop()
+            self.autosave = None
+
+    def discard_autosave(self):
+        if self.autosave is not None:
+            self.autosave.discard()
+            self.autosave = None
+
+    def closeEvent(self, event):
+        # Clean close, the journal is only kept after a crash.
+        self.discard_autosave()
+        super().closeEvent(event)
+
+    def set_onion_skin_models(self, previous=(), following=()):
+        """
+        Set the models of the frames ghosted by the onion skin, the closest
+        frames first.
+        """
+        self.onionskin.set_models(previous, following)
+        self.canvas.repaint()
+
+    def toggle_onion_skin(self):
+        self.onionskin.enabled = not self.onionskin.enabled
+        self.canvas.repaint()
+
     def toggle_panel(self):
         self.left_scroll.setVisible(not self.left_scroll.isVisible())
 
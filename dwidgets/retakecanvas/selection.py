@@ -1,26 +1,43 @@
-from PySide2 import QtCore
-from dwidgets.retakecanvas.geometry import points_rect
+import math
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.geometry import points_rect, shape_points
 from dwidgets.retakecanvas.shapes import (
     Arrow, Rectangle, Circle, Stroke, Bitmap, Text, Line)
 
 
 class Selection:
+    """
+    Sub elements are stored in a dict keyed by object id. This works as an
+    ordered set based on identity: two different points sharing the same
+    coordinates are two different elements.
+    The selection rect is cached and has to be invalidated if the selected
+    elements are edited outside this class (see Selection.invalidate).
+    """
     NO = 0
     SUBOBJECTS = 1
     ELEMENT = 2
 
     def __init__(self):
-        self.sub_elements = []
+        self._sub_elements = {}
+        self._rect = None
+        self._polygon = None
         self.element = None
         self.mode = 'replace'
+        # SelectionTransform currently previewed (set by transform tools).
+        self.transform = None
+
+    @property
+    def sub_elements(self):
+        return list(self._sub_elements.values())
 
     def set(self, elements):
         types = (
             QtCore.QPoint, QtCore.QPointF,
             Arrow, Rectangle, Circle, Stroke, Bitmap, Text, Line)
         if isinstance(elements, types):
-            self.elements = []
+            self._sub_elements = {}
             self.element = elements
+            self.invalidate()
             return
 
         if self.mode == 'add':
@@ -33,65 +50,243 @@ class Selection:
             if elements is None:
                 return
             for element in elements:
-                if element in self.sub_elements:
+                if element in self:
                     self.remove(element)
 
     @property
     def type(self):
         if self.element is not None:
             return self.ELEMENT
-        return self.SUBOBJECTS if self.sub_elements else self.NO
+        return self.SUBOBJECTS if self._sub_elements else self.NO
 
     def replace(self, elements):
-        self.sub_elements = elements
+        self._sub_elements = {id(element): element for element in elements}
+        self.invalidate()
 
     def add(self, elements):
-        self.sub_elements.extend([s for s in elements if s not in self])
+        for element in elements:
+            self._sub_elements.setdefault(id(element), element)
+        self.invalidate()
 
     def remove(self, shape):
-        self.sub_elements.remove(shape)
+        del self._sub_elements[id(shape)]
+        self.invalidate()
 
     def invert(self, elements):
         for element in elements:
-            if element not in self.sub_elements:
-                self.add([element])
-            else:
-                self.remove(element)
+            if self._sub_elements.pop(id(element), None) is None:
+                self._sub_elements[id(element)] = element
+        self.invalidate()
 
     def clear(self):
-        self.sub_elements = []
+        self._sub_elements = {}
         self.element = None
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Has to be called when the selected elements are moved.
+        """
+        self._rect = None
+        self._polygon = None
+
+    def rect(self):
+        if self.type != self.SUBOBJECTS:
+            return
+        if self._rect is None:
+            points = []
+            for element in self:
+                if isinstance(element, (QtCore.QPoint, QtCore.QPointF)):
+                    points.append(element)
+                else:
+                    points.extend(shape_points(element))
+            self._rect = points_rect(points)
+        return QtCore.QRectF(self._rect)
+
+    def polygon(self):
+        """
+        Selected points packed in a QPolygonF (units coordinates).
+        """
+        if self._polygon is None:
+            classes = QtCore.QPoint, QtCore.QPointF
+            self._polygon = QtGui.QPolygonF(
+                [e for e in self if isinstance(e, classes)])
+        return self._polygon
 
     def __bool__(self):
-        return bool(self.sub_elements) or bool(self.element)
+        return bool(self._sub_elements) or bool(self.element)
 
     __nonzero__ = __bool__
 
+    def __contains__(self, element):
+        return id(element) in self._sub_elements
+
     def __len__(self):
-        return len(self.sub_elements)
+        return len(self._sub_elements)
 
     def __getitem__(self, i):
         return self.sub_elements[i]
 
     def __iter__(self):
-        return self.sub_elements.__iter__()
+        return iter(self._sub_elements.values())
 
 
 def selection_rect(selection):
-    if selection.type != selection.SUBOBJECTS:
-        return
-    points = []
-    for element in selection:
-        if isinstance(element, (QtCore.QPoint, QtCore.QPointF)):
-            points.append(element)
-        elif isinstance(element, Stroke):
-            points.extend(point for point, _ in element)
-        elif isinstance(element, (Arrow, Rectangle, Circle, Text, Line)):
-            points.extend((element.start, element.end))
-        # elif isinstance(element, Bitmap):
-        # TODO:
-        #     points.extend((element.rect.topLeft(), element.bottomRight()))
-        #     draw_bitmap(painter, element, viewportmapper)
-    return points_rect(points)
+    return selection.rect()
 
 
+class SelectionTransform:
+    """
+    Affine transform applied on a selection while a tool drags it.
+    The transformed points are packed in a QPolygonF once, when the transform
+    starts. Each drag step only changes the matrix, the whole polygon is
+    mapped in a single call when it is drawn and the shapes are edited only
+    once, when the transform is baked.
+    Shapes which are entirely transformed are drawn untouched through the
+    painter world transform when it gives the same result as the baked
+    shape. Only the partially selected shapes need a transformed copy.
+    """
+
+    def __init__(self, selection, layer=None):
+        self.matrix = QtGui.QTransform()
+        self.points = []
+        self.bitmaps = []
+        self.shapes = {}
+        classes = QtCore.QPoint, QtCore.QPointF
+        if selection.type == Selection.ELEMENT:
+            element = selection.element
+            if isinstance(element, Bitmap):
+                self.bitmaps.append(element)
+                self.shapes[id(element)] = element
+            elif isinstance(element, classes):
+                self.points.append(element)
+            else:
+                self.points.extend(shape_points(element))
+                self.shapes[id(element)] = element
+        elif selection.type == Selection.SUBOBJECTS:
+            self.points.extend(e for e in selection if isinstance(e, classes))
+        self.indexes = {id(point): i for i, point in enumerate(self.points)}
+        # Shapes transformed as a whole.
+        self.whole = set(self.shapes)
+        # Collect the shapes owning the points to preview them.
+        for shape in layer or []:
+            if id(shape) in self.shapes:
+                continue
+            points = [id(p) in self.indexes for p in shape_points(shape)]
+            if not any(points):
+                continue
+            self.shapes[id(shape)] = shape
+            if all(points):
+                self.whole.add(id(shape))
+        self.polygon = QtGui.QPolygonF(self.points)
+        self.rects = [QtCore.QRectF(bitmap.rect) for bitmap in self.bitmaps]
+        self._mapped = None
+        self._previews = {}
+
+    def set_matrix(self, matrix):
+        self.matrix = matrix
+        self._mapped = None
+        self._previews = {}
+
+    @property
+    def is_identity(self):
+        return self.matrix.isIdentity()
+
+    @property
+    def is_translation(self):
+        types = QtGui.QTransform.TxNone, QtGui.QTransform.TxTranslate
+        return self.matrix.type() in types
+
+    @property
+    def is_rigid(self):
+        """
+        Translation and rotation only. Scale and shear must be baked in the
+        coordinates to keep the pens width untouched.
+        """
+        m = self.matrix
+        epsilon = 1e-6
+        return (
+            m.isAffine() and
+            abs(m.m11() ** 2 + m.m12() ** 2 - 1) < epsilon and
+            abs(m.m21() ** 2 + m.m22() ** 2 - 1) < epsilon and
+            abs(m.m11() * m.m21() + m.m12() * m.m22()) < epsilon)
+
+    def use_painter(self, shape):
+        """
+        Return True if the shape can be previewed with a painter transform.
+        Rectangles, circles, texts and bitmaps stay axis aligned once baked,
+        so they are only rigid with a translation.
+        """
+        if id(shape) not in self.whole:
+            return False
+        if self.is_translation:
+            return True
+        return self.is_rigid and isinstance(shape, (Stroke, Line, Arrow))
+
+    def viewport_matrix(self, viewportmapper):
+        """
+        Return the matrix in viewport space, to use as painter transform.
+        """
+        matrix = viewportmapper.to_viewport_transform()
+        inverted, _ = matrix.inverted()
+        return inverted * self.matrix * matrix
+
+    def mapped(self):
+        if self._mapped is None:
+            self._mapped = list(self.matrix.map(self.polygon))
+        return self._mapped
+
+    def map_point(self, point):
+        index = self.indexes.get(id(point))
+        return point if index is None else self.mapped()[index]
+
+    def map_bitmap_rect(self, rect):
+        """
+        Bitmaps stay axis aligned: their center follows the matrix and their
+        size is scaled by the matrix axes length. The rotation and the shear
+        are not applied on the image.
+        """
+        m = self.matrix
+        width = rect.width() * math.hypot(m.m11(), m.m12())
+        height = rect.height() * math.hypot(m.m21(), m.m22())
+        mapped = QtCore.QRectF(0, 0, width, height)
+        mapped.moveCenter(m.map(rect.center()))
+        return mapped
+
+    def preview(self, shape):
+        """
+        Return a transformed copy of the shape. The original is untouched.
+        """
+        try:
+            return self._previews[id(shape)]
+        except KeyError:
+            preview = self._preview_shape(shape)
+            self._previews[id(shape)] = preview
+            return preview
+
+    def _preview_shape(self, shape):
+        if isinstance(shape, Bitmap):
+            return Bitmap(shape.image, self.map_bitmap_rect(shape.rect))
+        if isinstance(shape, Stroke):
+            stroke = Stroke(None, shape.color, None)
+            stroke.points = [[self.map_point(p), size] for p, size in shape]
+            return stroke
+        copy = shape.copy()
+        copy.start = self.map_point(shape.start)
+        copy.end = self.map_point(shape.end)
+        return copy
+
+    def bake(self):
+        """
+        Apply the matrix on the selected shapes.
+        """
+        if self.is_identity:
+            return
+        for point, mapped in zip(self.points, self.mapped()):
+            point.setX(mapped.x())
+            point.setY(mapped.y())
+        for bitmap, rect in zip(self.bitmaps, self.rects):
+            bitmap.rect = self.map_bitmap_rect(rect)
+        for shape in self.shapes.values():
+            if isinstance(shape, Stroke):
+                shape.invalidate()
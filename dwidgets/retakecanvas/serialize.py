@@ -0,0 +1,246 @@
+import json
+import os
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.imagepool import content_digest, image_pool
+from dwidgets.retakecanvas.layerstack import (
+    BLEND_MODE_FOR_NAMES, BLEND_MODE_NAMES, Layer)
+from dwidgets.retakecanvas.model import RetakeCanvasModel
+from dwidgets.retakecanvas.shapes import (
+    Arrow, Bitmap, Circle, Line, Raster, Rectangle, Stroke, Text)
+
+
+SESSION_EXTENSION = '.retake'
+IMAGES_DIRECTORY_SUFFIX = '.images'
+VERSION = 1
+
+
+class ImageStore:
+    """
+    Images saved once by content hash as PNG files in a directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.digests = {}
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + '.png')
+
+    def save(self, image):
+        if image is None or image.isNull():
+            return None
+        digest = self.digests.get(image.cacheKey())
+        if digest is not None:
+            return digest
+        digest = content_digest(image)
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            image.save(path, 'PNG')
+        self.digests[image.cacheKey()] = digest
+        return digest
+
+    def load(self, digest):
+        if digest is None:
+            return QtGui.QImage()
+        return image_pool().load(self.path(digest))
+
+
+def point_to_data(point):
+    return [point.x(), point.y()] if point is not None else None
+
+
+def data_to_point(data):
+    return QtCore.QPointF(*data) if data is not None else None
+
+
+def rect_to_data(rect):
+    return [rect.x(), rect.y(), rect.width(), rect.height()]
+
+
+def color_to_data(color):
+    if isinstance(color, str):
+        return color
+    return QtGui.QColor(color).name(QtGui.QColor.HexArgb)
+
+
+def shape_to_data(shape, store):
+    if isinstance(shape, Stroke):
+        # Packed as flat list: x, y, size, x, y, size...
+        points = [
+            value for point, size in shape
+            for value in (point.x(), point.y(), size)]
+        return {
+            'type': 'stroke',
+            'color': color_to_data(shape.color),
+            'points': points}
+    if isinstance(shape, Bitmap):
+        return {
+            'type': 'bitmap',
+            'image': store.save(shape.image),
+            'rect': rect_to_data(shape.rect)}
+    if isinstance(shape, Raster):
+        return {
+            'type': 'raster',
+            'tile_size': shape.tile_size,
+            'rect': rect_to_data(shape.rect) if shape.rect else None,
+            'tiles': [
+                [column, row, store.save(tile)]
+                for (column, row), tile in shape.tiles.items()]}
+    data = {
+        'start': point_to_data(shape.start),
+        'end': point_to_data(shape.end),
+        'color': color_to_data(shape.color)}
+    if isinstance(shape, (Rectangle, Text)):
+        data.update({
+            'bgcolor': color_to_data(shape.bgcolor),
+            'bgopacity': shape.bgopacity,
+            'filled': shape.filled})
+    if isinstance(shape, Text):
+        data.update({
+            'type': 'text',
+            'text': shape.text,
+            'text_size': shape.text_size,
+            'alignment': shape.alignment})
+    elif isinstance(shape, Circle):
+        data.update({'type': 'circle', 'linewidth': shape.linewidth})
+    elif isinstance(shape, Rectangle):
+        data.update({'type': 'rectangle', 'linewidth': shape.linewidth})
+    elif isinstance(shape, Line):
+        data.update({'type': 'line', 'linewidth': shape.linewidth})
+    elif isinstance(shape, Arrow):
+        data.update({
+            'type': 'arrow',
+            'linewidth': shape.tailwidth,
+            'headsize': shape.headsize})
+    else:
+        raise TypeError(f'Cannot serialize shape: {shape}')
+    return data
+
+
+def data_to_shape(data, store):
+    shape_type = data['type']
+    if shape_type == 'stroke':
+        values = data['points']
+        stroke = Stroke(None, data['color'], None)
+        stroke.points = [
+            [QtCore.QPointF(values[i], values[i + 1]), values[i + 2]]
+            for i in range(0, len(values), 3)]
+        return stroke
+    if shape_type == 'bitmap':
+        return Bitmap(store.load(data['image']), QtCore.QRectF(*data['rect']))
+    if shape_type == 'raster':
+        raster = Raster(data['tile_size'])
+        raster.tiles = {
+            (column, row): store.load(digest).convertToFormat(
+                QtGui.QImage.Format_ARGB32_Premultiplied)
+            for column, row, digest in data['tiles']}
+        raster.rect = QtCore.QRectF(*data['rect']) if data['rect'] else None
+        return raster
+    start = data_to_point(data['start'])
+    if shape_type == 'text':
+        shape = Text(
+            start, data['text'], data['color'], data['bgcolor'],
+            data['bgopacity'], data['text_size'], data['filled'])
+        shape.alignment = data['alignment']
+    elif shape_type in ('rectangle', 'circle'):
+        cls = Circle if shape_type == 'circle' else Rectangle
+        shape = cls(
+            start, data['color'], data['bgcolor'], data['bgopacity'],
+            data['linewidth'], data['filled'])
+    elif shape_type == 'line':
+        shape = Line(start, data['color'], data['linewidth'])
+    elif shape_type == 'arrow':
+        shape = Arrow(start, data['color'], data['linewidth'])
+        shape.headsize = data['headsize']
+    else:
+        raise ValueError(f'Unknown shape type: {shape_type}')
+    shape.end = data_to_point(data['end'])
+    return shape
+
+
+def layer_to_data(layer, store):
+    return {
+        'name': layer.name,
+        'blend_mode': BLEND_MODE_NAMES[layer.blend_mode],
+        'opacity': layer.opacity,
+        'visible': layer.visible,
+        'locked': layer.locked,
+        'shapes': [shape_to_data(shape, store) for shape in layer.shapes]}
+
+
+def data_to_layer(data, store):
+    return Layer(
+        data['name'],
+        [data_to_shape(shape, store) for shape in data['shapes']],
+        BLEND_MODE_FOR_NAMES[data['blend_mode']], data['locked'],
+        data['visible'], data['opacity'])
+
+
+def state_to_data(state, baseimage, layout, store, layers=True):
+    """
+    state: RetakeCanvasModel.state() or undo state.
+    layers: serialize the layers. If False, only the layer count is saved.
+    """
+    data = {
+        'version': VERSION,
+        'baseimage': store.save(baseimage),
+        'baseimage_wipes': rect_to_data(state['baseimage_wipes']),
+        'imagestack': [store.save(image) for image in state['imagestack']],
+        'imagestack_wipes': [
+            rect_to_data(wipe) for wipe in state['imagestack_wipes']],
+        'imagestack_layout': layout,
+        'current': state['current'],
+        'wash_color': color_to_data(state['wash_color']),
+        'wash_opacity': state['wash_opacity'],
+        'layer_count': len(state['layers'])}
+    if layers:
+        data['layers'] = [
+            layer_to_data(layer, store) for layer in state['layers']]
+    return data
+
+
+def data_to_state(data, store):
+    return {
+        'baseimage_wipes': QtCore.QRectF(*data['baseimage_wipes']),
+        'imagestack': [store.load(digest) for digest in data['imagestack']],
+        'imagestack_wipes': [
+            QtCore.QRectF(*wipe) for wipe in data['imagestack_wipes']],
+        'layers': [data_to_layer(layer, store) for layer in data['layers']],
+        'current': data['current'],
+        'wash_color': data['wash_color'],
+        'wash_opacity': data['wash_opacity']}
+
+
+def data_to_model(data, store, model=None):
+    model = model or RetakeCanvasModel()
+    state = data_to_state(data, store)
+    model.set_baseimage(store.load(data['baseimage']))
+    model.imagestack_layout = data['imagestack_layout']
+    model.restore_state(state)
+    model.undostack = []
+    model.redostack = []
+    model.add_undo_state()
+    return model
+
+
+def images_directory(path):
+    return path + IMAGES_DIRECTORY_SUFFIX
+
+
+def save_session(model, path):
+    """
+    Save the model as json. The images are saved next to the session, in
+    the "<session>.images" directory.
+    """
+    store = ImageStore(images_directory(path))
+    data = state_to_data(
+        model.state(), model.baseimage, model.imagestack_layout, store)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def load_session(path, model=None):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return data_to_model(data, ImageStore(images_directory(path)), model)
@@ -1,5 +1,6 @@
 
 from PySide2 import QtWidgets, QtCore
+from dwidgets.retakecanvas.brush import Brush
 from dwidgets.retakecanvas.button import ColorAction
 from dwidgets.retakecanvas.dialog import ColorSelection
 from dwidgets.retakecanvas.shapes import (
@@ -305,15 +306,22 @@ class GeneralSettings(QtWidgets.QWidget):
         self.linewidth.setMaximum(60)
         self.linewidth.setValue(self.model.drawcontext.size)
         self.linewidth.valueChanged.connect(self.set_linewidth)
+        self.snapping = QtWidgets.QCheckBox(
+            'Snapping', checked=self.model.drawcontext.snapping)
+        self.snapping.toggled.connect(self.set_snapping)
         layout = QtWidgets.QFormLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
         layout.setSpacing(0)
         layout.addRow('Main color:', self.color)
         layout.addRow('Linewidth:', self.linewidth)
+        layout.addRow('', self.snapping)
 
     def set_linewidth(self, value):
         self.model.drawcontext.size = value
 
+    def set_snapping(self, state):
+        self.model.drawcontext.snapping = state
+
     def select_color(self):
         dialog = ColorSelection(self.color.color)
         dialog.move(self.mapToGlobal(self.color.pos()))
@@ -329,6 +337,9 @@ class GeneralSettings(QtWidgets.QWidget):
         self.linewidth.blockSignals(True)
         self.linewidth.setValue(model.drawcontext.size)
         self.linewidth.blockSignals(False)
+        self.snapping.blockSignals(True)
+        self.snapping.setChecked(model.drawcontext.snapping)
+        self.snapping.blockSignals(False)
         self.repaint()
 
 
@@ -349,6 +360,58 @@ class SmoothDrawSettings(QtWidgets.QWidget):
         self.tool.buffer_lenght = value
 
 
+class BrushSettings(QtWidgets.QWidget):
+    def __init__(self, tool, parent=None):
+        super().__init__(parent=parent)
+        self.tool = tool
+        self.style = QtWidgets.QComboBox()
+        for style, name in Brush.NAMES.items():
+            self.style.addItem(name, style)
+        self.style.currentIndexChanged.connect(self.style_changed)
+        self.flow = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.flow.setMinimum(1)
+        self.flow.setMaximum(100)
+        self.flow.setValue(round(tool.brush.flow * 100))
+        self.flow.valueChanged.connect(self.flow_changed)
+        form = QtWidgets.QFormLayout(self)
+        form.setSpacing(0)
+        form.addRow('Brush', self.style)
+        form.addRow('Flow', self.flow)
+
+    def style_changed(self, index):
+        self.tool.brush.set_style(self.style.itemData(index))
+        self.flow.blockSignals(True)
+        self.flow.setValue(round(self.tool.brush.flow * 100))
+        self.flow.blockSignals(False)
+
+    def flow_changed(self, value):
+        self.tool.brush.flow = value / 100
+
+
+class FillSettings(QtWidgets.QWidget):
+    def __init__(self, tool, parent=None):
+        super().__init__(parent=parent)
+        self.tool = tool
+        self.tolerance = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.tolerance.setMinimum(0)
+        self.tolerance.setMaximum(255)
+        self.tolerance.setValue(tool.tolerance)
+        self.tolerance.valueChanged.connect(self.tolerance_changed)
+        self.current_layer_only = QtWidgets.QCheckBox('Current layer only')
+        self.current_layer_only.setChecked(tool.current_layer_only)
+        self.current_layer_only.toggled.connect(self.current_layer_toggled)
+        form = QtWidgets.QFormLayout(self)
+        form.setSpacing(0)
+        form.addRow('Tolerance', self.tolerance)
+        form.addRow('', self.current_layer_only)
+
+    def tolerance_changed(self, value):
+        self.tool.tolerance = value
+
+    def current_layer_toggled(self, state):
+        self.tool.current_layer_only = state
+
+
 class ArrowSettings(QtWidgets.QWidget):
     def __init__(self, tool, parent=None):
         super().__init__(parent=parent)
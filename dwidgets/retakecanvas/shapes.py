@@ -1,5 +1,8 @@
+import math
+from collections import defaultdict
 from copy import deepcopy
 from PySide2 import QtGui, QtCore
+from dwidgets.retakecanvas.mathutils import decimate_stroke_points
 
 
 class Text:
@@ -24,6 +27,8 @@ class Text:
         self.bgopacity = bgopacity
         self.text_size = text_size
         self.alignment = self.TOP_LEFT
+        # Layout cache, see canvas.get_static_text.
+        self.static_text = None
 
     def handle(self, point):
         self.end = point
@@ -54,6 +59,107 @@ class Bitmap:
         return Bitmap(QtGui.QImage(self.image), QtCore.QRectF(self.rect))
 
 
+class Raster:
+    """
+    Tiled raster buffer painted by the brushes (see brush.py). The tiles are
+    created on demand when a dab touches them, so the memory and the
+    rendering cost only depend on the painted area.
+    tiles: {(column, row): QImage}, in units (one pixel per unit).
+    rect: bounds of the painted dabs or None.
+    dirty: tiles painted since their last upload for the screen (see
+        canvas.draw_raster).
+    """
+    TILE_SIZE = 256
+
+    def __init__(self, tile_size=None):
+        self.tile_size = tile_size or self.TILE_SIZE
+        self.tiles = {}
+        self.rect = None
+        self.dirty = set()
+        # Screen cache, see canvas.draw_raster.
+        self.pixmaps = {}
+
+    @property
+    def is_valid(self):
+        return bool(self.tiles)
+
+    def tile_rect(self, key):
+        size = self.tile_size
+        return QtCore.QRect(key[0] * size, key[1] * size, size, size)
+
+    def tile_keys(self, rect):
+        """
+        Return the keys of the tiles (existing or not) intersecting the rect.
+        """
+        size = self.tile_size
+        left = math.floor(rect.left() / size)
+        top = math.floor(rect.top() / size)
+        right = math.floor(rect.right() / size)
+        bottom = math.floor(rect.bottom() / size)
+        return [
+            (column, row)
+            for row in range(top, bottom + 1)
+            for column in range(left, right + 1)]
+
+    def tiles_in_rect(self, rect):
+        """
+        Return the keys of the existing tiles intersecting the rect.
+        """
+        keys = self.tile_keys(rect)
+        if len(keys) > len(self.tiles):
+            rect = QtCore.QRectF(rect)
+            return [
+                key for key in self.tiles
+                if rect.intersects(QtCore.QRectF(self.tile_rect(key)))]
+        return [key for key in keys if key in self.tiles]
+
+    def tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            size = self.tile_size
+            tile = QtGui.QImage(
+                size, size, QtGui.QImage.Format_ARGB32_Premultiplied)
+            tile.fill(QtCore.Qt.transparent)
+            self.tiles[key] = tile
+        return tile
+
+    def stamp(self, dabs):
+        """
+        Composite the dabs on the tiles.
+        dabs: list of (QImage, center in units).
+        The dabs are grouped by tile so each touched tile is opened by a
+        single painter.
+        """
+        dabs_per_tile = defaultdict(list)
+        for image, center in dabs:
+            rect = QtCore.QRectF(
+                center.x() - image.width() / 2,
+                center.y() - image.height() / 2,
+                image.width(), image.height())
+            self.rect = rect if self.rect is None else self.rect.united(rect)
+            for key in self.tile_keys(rect):
+                dabs_per_tile[key].append((image, rect.topLeft()))
+        for key, tile_dabs in dabs_per_tile.items():
+            # Painting detaches the tiles shared with the undo states.
+            painter = QtGui.QPainter(self.tile(key))
+            painter.translate(-QtCore.QPointF(self.tile_rect(key).topLeft()))
+            for image, position in tile_dabs:
+                painter.drawImage(position, image)
+            painter.end()
+            self.dirty.add(key)
+
+    def copy(self):
+        raster = Raster(self.tile_size)
+        # QImage is implicitly shared, the tiles pixels are only copied when
+        # painted.
+        raster.tiles = {
+            key: QtGui.QImage(tile) for key, tile in self.tiles.items()}
+        raster.rect = QtCore.QRectF(self.rect) if self.rect else None
+        raster.dirty = set(self.dirty)
+        raster.pixmaps = dict(self.pixmaps)
+        return raster
+
+
 class Rectangle:
     def __init__(self, start, color, bgcolor, bgopacity, linewidth, filled):
         self.start = start
@@ -142,12 +248,50 @@ class Arrow:
 
 
 class Stroke:
+    LOD_MAX_LEVEL = 10
+
     def __init__(self, start, color, size):
         self.points = [[start, size]]
         self.color = color
 
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Clear the cached levels of details. Has to be called when the points
+        are moved in place.
+        """
+        self._lods = {}
+
     def add_point(self, point, size):
         self.points.append([point, size])
+        self.invalidate()
+
+    def lod(self, zoom):
+        """
+        Return the points decimated to have segments spanning at least one
+        pixel at the given zoom. The levels are built lazily, each one from
+        the previous, and are cached until the stroke is edited.
+        """
+        if zoom >= 1 or len(self._points) < 3:
+            return self._points
+        level = min(math.ceil(math.log2(1 / zoom)), self.LOD_MAX_LEVEL)
+        return self._lod_level(level)
+
+    def _lod_level(self, level):
+        if level <= 0:
+            return self._points
+        if level not in self._lods:
+            points = self._lod_level(level - 1)
+            self._lods[level] = decimate_stroke_points(points, 2 ** level)
+        return self._lods[level]
 
     @property
     def is_valid(self):
@@ -161,6 +305,7 @@ class Stroke:
 
     def __setitem__(self, index, value):
         self.points[index] = value
+        self.invalidate()
 
     def __len__(self):
         return len(self.points)
@@ -170,3 +315,102 @@ class Stroke:
         stroke.points = deepcopy(self.points)
         stroke.color = self.color
         return stroke
+
+
+def shape_function(table, shape):
+    """
+    Return the function registered for the shape class in the table
+    ({class: function}) or None. A subclass uses the function of its closest
+    registered parent class and the result is stored in the table, so the
+    next calls are a single dict lookup.
+    """
+    cls = type(shape)
+    try:
+        return table[cls]
+    except KeyError:
+        pass
+    function = next((table[c] for c in cls.__mro__ if c in table), None)
+    table[cls] = function
+    return function
+
+
+class ShapeList(list):
+    """
+    List of shapes which indexes its shapes by class. The index is updated
+    by the list methods, so the class queries (e.g. all the texts) only cost
+    the number of shapes returned.
+    """
+
+    def __init__(self, shapes=()):
+        super().__init__(shapes)
+        self.types = {}
+        for shape in self:
+            self._index(shape)
+
+    def _index(self, shape):
+        self.types.setdefault(type(shape), {})[id(shape)] = shape
+
+    def _unindex(self, shape):
+        shapes = self.types.get(type(shape))
+        if shapes is not None:
+            shapes.pop(id(shape), None)
+
+    def of_type(self, *classes):
+        """
+        Return the shapes of the given classes (subclasses included). They
+        are grouped by class and are in the order they were indexed within a
+        class, which is not the list order after an insert or a slice
+        assignment.
+        """
+        return [
+            shape for cls, shapes in self.types.items()
+            if issubclass(cls, classes) for shape in shapes.values()]
+
+    def append(self, shape):
+        super().append(shape)
+        self._index(shape)
+
+    def extend(self, shapes):
+        shapes = list(shapes)
+        super().extend(shapes)
+        for shape in shapes:
+            self._index(shape)
+
+    def __iadd__(self, shapes):
+        self.extend(shapes)
+        return self
+
+    def insert(self, index, shape):
+        super().insert(index, shape)
+        self._index(shape)
+
+    def remove(self, shape):
+        super().remove(shape)
+        self._unindex(shape)
+
+    def pop(self, index=-1):
+        shape = super().pop(index)
+        self._unindex(shape)
+        return shape
+
+    def clear(self):
+        super().clear()
+        self.types.clear()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            removed, value = self[index], list(value)
+            added = value
+        else:
+            removed, added = [self[index]], [value]
+        super().__setitem__(index, value)
+        for shape in removed:
+            self._unindex(shape)
+        for shape in added:
+            self._index(shape)
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        for shape in removed:
+            self._unindex(shape)
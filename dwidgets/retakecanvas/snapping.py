@@ -0,0 +1,239 @@
+import bisect
+import itertools
+import math
+from collections import defaultdict
+from PySide2 import QtCore
+from dwidgets.retakecanvas.shapes import (
+    Arrow, Bitmap, Circle, Line, Rectangle, Stroke, Text, shape_function)
+
+
+# Snap distance in pixels.
+SNAP_TOLERANCE = 10
+IMAGES_KEY = 'images'
+
+
+class SnapIndex:
+    """
+    Snap candidates of the document (units coordinates):
+        - points: shape end points, rectangle corners and centers, image
+          corners.
+        - edges: horizontal and vertical sides of the rectangles, bitmaps,
+          images and wipes.
+    The points are stored in a uniform grid and the edges in two lists
+    sorted by position, so the queries only visit the candidates around the
+    point. The candidates are stored per source (shape or images) and sync
+    only replaces the sources which changed.
+    """
+    CELL_SIZE = 64
+
+    def __init__(self, cell_size=None):
+        self.cell_size = cell_size or self.CELL_SIZE
+        self.cells = defaultdict(dict)
+        # Sorted (x, n, top, bottom, key) and (y, n, left, right, key). The
+        # counter n keeps the tuples unique and avoids comparing the keys.
+        self.vertical = []
+        self.horizontal = []
+        # key: (candidates, point cells, vertical edges, horizontal edges)
+        self.entries = {}
+        self._counter = itertools.count()
+        self._sync_key = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def set(self, key, points, edges):
+        """
+        Set the candidates of a source.
+        points: list of (x, y).
+        edges: list of (vertical, position, start, end).
+        """
+        candidates = tuple(points), tuple(edges)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == candidates:
+            return
+        self.remove(key)
+        cells = []
+        for x, y in points:
+            cell = self.cell(x, y)
+            self.cells[cell][next(self._counter)] = x, y, key
+            cells.append(cell)
+        vertical, horizontal = [], []
+        for is_vertical, position, start, end in edges:
+            edge = position, next(self._counter), start, end, key
+            if is_vertical:
+                bisect.insort(self.vertical, edge)
+                vertical.append(edge)
+            else:
+                bisect.insort(self.horizontal, edge)
+                horizontal.append(edge)
+        self.entries[key] = candidates, cells, vertical, horizontal
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        _, cells, vertical, horizontal = entry
+        for cell in set(cells):
+            points = self.cells[cell]
+            for n in [n for n, point in points.items() if point[2] == key]:
+                del points[n]
+            if not points:
+                del self.cells[cell]
+        for edges, removed in ((self.vertical, vertical), (
+                self.horizontal, horizontal)):
+            for edge in removed:
+                del edges[bisect.bisect_left(edges, edge)]
+
+    def clear(self):
+        for key in list(self.entries):
+            self.remove(key)
+        self._sync_key = None
+
+    def sync(self, model):
+        """
+        Update the candidates from the model visible layers and images.
+        Nothing is done if the document didn't change since the last call.
+        """
+        layers = [layer for layer in model.layerstack if layer.visible]
+        sync_key = (
+            model.uid, model.revision, model.images_layout(),
+            tuple(layer.id for layer in layers))
+        if sync_key == self._sync_key:
+            return
+        self._sync_key = sync_key
+        keys = {IMAGES_KEY}
+        for layer in layers:
+            for shape in layer.shapes:
+                function = shape_function(SNAP_FUNCTIONS, shape)
+                if function is None:
+                    continue
+                keys.add(id(shape))
+                self.set(id(shape), *function(shape))
+        self.set(IMAGES_KEY, *images_candidates(model))
+        for key in set(self.entries) - keys:
+            self.remove(key)
+
+    def nearest_point(self, point, tolerance, exclude=()):
+        """
+        Return the closest point candidate (QPointF) within the tolerance or
+        None. exclude: source keys to ignore.
+        """
+        x, y = point.x(), point.y()
+        left, top = self.cell(x - tolerance, y - tolerance)
+        right, bottom = self.cell(x + tolerance, y + tolerance)
+        result, best = None, tolerance
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                for px, py, key in self.cells.get((cx, cy), {}).values():
+                    if key in exclude:
+                        continue
+                    distance = math.hypot(px - x, py - y)
+                    if distance <= best:
+                        result, best = (px, py), distance
+        return QtCore.QPointF(*result) if result else None
+
+    def nearest_edge(self, vertical, point, tolerance, exclude=()):
+        """
+        Return the position (x for the vertical edges, y for the horizontal
+        ones) of the closest edge within the tolerance or None.
+        """
+        edges = self.vertical if vertical else self.horizontal
+        value, other = (
+            (point.x(), point.y()) if vertical else (point.y(), point.x()))
+        index = bisect.bisect_left(edges, (value - tolerance,))
+        result, best = None, tolerance
+        for position, _, start, end, key in itertools.islice(
+                edges, index, None):
+            if position > value + tolerance:
+                break
+            if key in exclude or not start <= other <= end:
+                continue
+            if abs(position - value) <= best:
+                result, best = position, abs(position - value)
+        return result
+
+    def snap(self, point, tolerance, exclude=()):
+        """
+        Return the point snapped on the closest point candidate or, if there
+        is none, on the closest vertical and horizontal edges.
+        """
+        snapped = self.nearest_point(point, tolerance, exclude)
+        if snapped is not None:
+            return snapped
+        x = self.nearest_edge(True, point, tolerance, exclude)
+        y = self.nearest_edge(False, point, tolerance, exclude)
+        return QtCore.QPointF(
+            point.x() if x is None else x, point.y() if y is None else y)
+
+
+def rect_candidates(rect):
+    rect = QtCore.QRectF(rect).normalized()
+    left, top, right, bottom = (
+        rect.left(), rect.top(), rect.right(), rect.bottom())
+    center = rect.center()
+    points = [
+        (left, top), (right, top), (right, bottom), (left, bottom),
+        (center.x(), center.y())]
+    edges = [
+        (True, left, top, bottom), (True, right, top, bottom),
+        (False, top, left, right), (False, bottom, left, right)]
+    return points, edges
+
+
+def handles_candidates(shape):
+    points = [
+        (point.x(), point.y()) for point in (shape.start, shape.end)
+        if point is not None]
+    return points, []
+
+
+def box_candidates(shape):
+    if shape.end is None:
+        return handles_candidates(shape)
+    return rect_candidates(QtCore.QRectF(shape.start, shape.end))
+
+
+def circle_candidates(shape):
+    if shape.end is None:
+        return handles_candidates(shape)
+    center = QtCore.QRectF(shape.start, shape.end).center()
+    return [(center.x(), center.y())], []
+
+
+def stroke_candidates(stroke):
+    if not stroke.points:
+        return [], []
+    points = stroke.points[0][0], stroke.points[-1][0]
+    return [(p.x(), p.y()) for p in points], []
+
+
+def bitmap_candidates(bitmap):
+    return rect_candidates(bitmap.rect)
+
+
+def images_candidates(model):
+    points, edges = [], []
+    rects = list(model.images_layout().rects())
+    if model.imagestack_layout == model.STACKED:
+        rects += [model.baseimage_wipes] + model.imagestack_wipes
+    for rect in rects:
+        if rect is None or rect.isEmpty():
+            continue
+        rect_points, rect_edges = rect_candidates(rect)
+        points.extend(rect_points)
+        edges.extend(rect_edges)
+    return points, edges
+
+
+SNAP_FUNCTIONS = {
+    Stroke: stroke_candidates,
+    Line: handles_candidates,
+    Arrow: handles_candidates,
+    Rectangle: box_candidates,
+    Text: box_candidates,
+    Circle: circle_candidates,
+    Bitmap: bitmap_candidates,
+}
@@ -0,0 +1,93 @@
+import itertools
+import math
+from collections import defaultdict
+from PySide2 import QtCore
+from dwidgets.retakecanvas.geometry import (
+    combined_rect, rects_overlap, shape_bounds)
+
+
+class ShapeIndex:
+    """
+    Uniform grid storing shapes by their bounding rect (units coordinates).
+    The bounds are computed once when the shape is inserted. If a shape is
+    edited, it has to be removed and inserted again.
+    """
+    CELL_SIZE = 256
+
+    def __init__(self, shapes=None, cell_size=None):
+        self.cell_size = cell_size or self.CELL_SIZE
+        self.bounds = {}
+        self.shapes = {}
+        self.order = {}
+        self._counter = itertools.count()
+        self.cells = defaultdict(dict)
+        self.extent = None
+        for shape in shapes or []:
+            self.insert(shape)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __contains__(self, shape):
+        return id(shape) in self.shapes
+
+    def cells_for_rect(self, rect):
+        if self.extent is None:
+            return
+        # Clamp on the extent to avoid iterating over empty cells when the
+        # query rect is huge. (QRectF.intersected doesn't support flat rects)
+        rect = rect.normalized()
+        size = self.cell_size
+        left = math.floor(max(rect.left(), self.extent.left()) / size)
+        right = math.floor(min(rect.right(), self.extent.right()) / size)
+        top = math.floor(max(rect.top(), self.extent.top()) / size)
+        bottom = math.floor(min(rect.bottom(), self.extent.bottom()) / size)
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                yield x, y
+
+    def insert(self, shape):
+        rect = shape_bounds(shape)
+        if rect is None:
+            return
+        self.bounds[id(shape)] = rect
+        self.shapes[id(shape)] = shape
+        self.order[id(shape)] = next(self._counter)
+        if self.extent is None:
+            self.extent = QtCore.QRectF(rect)
+        else:
+            self.extent = combined_rect((self.extent, rect))
+        for cell in self.cells_for_rect(rect):
+            self.cells[cell][id(shape)] = shape
+
+    def remove(self, shape):
+        rect = self.bounds.pop(id(shape), None)
+        if rect is None:
+            return
+        del self.shapes[id(shape)]
+        del self.order[id(shape)]
+        for cell in self.cells_for_rect(rect):
+            self.cells[cell].pop(id(shape), None)
+
+    def update(self, shape):
+        order = self.order.get(id(shape))
+        self.remove(shape)
+        self.insert(shape)
+        if order is not None and id(shape) in self.order:
+            self.order[id(shape)] = order
+
+    def intersecting(self, rect):
+        """
+        Return shapes which bounding rect intersect the given rect, in their
+        insertion order.
+        """
+        rect = rect.normalized()
+        if self.extent is None or not rects_overlap(rect, self.extent):
+            return []
+        candidates = {}
+        for cell in self.cells_for_rect(rect):
+            candidates.update(self.cells.get(cell, {}))
+        keys = [
+            key for key in candidates
+            if rects_overlap(self.bounds[key], rect)]
+        return [self.shapes[key] for key in sorted(keys, key=self.order.get)]
@@ -0,0 +1,100 @@
+from PySide2 import QtCore, QtGui
+
+
+class TabletSample:
+    """
+    Tablet move sample queued between two frames. Implements the part of the
+    QTabletEvent interface used by the tools (pos, pressure) so it can be
+    passed to the mouse and tablet tool events.
+    """
+    __slots__ = ('_pos', '_posf', '_pressure', 'timestamp', 'point')
+
+    def __init__(self, event):
+        self._pos = event.pos()
+        self._posf = event.posF()
+        self._pressure = event.pressure()
+        self.timestamp = event.timestamp()
+        # Units coordinates, set by TabletInput.flush.
+        self.point = None
+
+    def pos(self):
+        return self._pos
+
+    def posF(self):
+        return self._posf
+
+    def pressure(self):
+        return self._pressure
+
+
+class TabletBatch:
+    """
+    Samples received since the previous frame.
+    points: units coordinates of the samples.
+    predicted: units coordinates where the pen is expected to be after the
+        prediction horizon or None.
+    """
+
+    def __init__(self, samples, points, predicted=None):
+        self.samples = samples
+        self.points = points
+        self.pressures = [sample.pressure() for sample in samples]
+        self.predicted = predicted
+
+    def __iter__(self):
+        return iter(self.samples)
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class TabletInput:
+    """
+    Input pipeline stage between the canvas tablet events and the tools.
+    The move events are only queued, they are converted to units coordinates
+    in one pass and sent to the tool as a single batch per frame.
+    prediction: horizon in milliseconds of the stroke prediction. The pen
+        position is extrapolated from its velocity over the last samples. 0
+        disables the prediction.
+    """
+    PREDICTION_SAMPLES = 4
+    MAXIMUM_PREDICTION = 50
+
+    def __init__(self, prediction=0):
+        self.samples = []
+        self.prediction = prediction
+        # Last samples flushed, kept to predict from the velocity.
+        self.history = []
+
+    def push(self, event):
+        self.samples.append(TabletSample(event))
+
+    def clear(self):
+        self.samples = []
+        self.history = []
+
+    def flush(self, viewportmapper):
+        """
+        Return the queued samples as TabletBatch or None if empty.
+        """
+        if not self.samples:
+            return None
+        samples, self.samples = self.samples, []
+        transform, _ = viewportmapper.to_viewport_transform().inverted()
+        polygon = QtGui.QPolygonF([sample.posF() for sample in samples])
+        points = list(transform.map(polygon))
+        for sample, point in zip(samples, points):
+            sample.point = point
+        self.history = (self.history + samples)[-self.PREDICTION_SAMPLES:]
+        return TabletBatch(samples, points, self.predict())
+
+    def predict(self):
+        if not self.prediction or len(self.history) < 2:
+            return None
+        first, last = self.history[0], self.history[-1]
+        duration = last.timestamp - first.timestamp
+        if duration <= 0:
+            return None
+        horizon = min(self.prediction, self.MAXIMUM_PREDICTION)
+        velocity = (last.point - first.point) / duration
+        return QtCore.QPointF(last.point + velocity * horizon)
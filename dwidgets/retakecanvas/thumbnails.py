@@ -0,0 +1,150 @@
+import traceback
+from collections import OrderedDict
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.canvas import draw_layer
+from dwidgets.retakecanvas.imageloader import mapped_frame
+from dwidgets.retakecanvas.viewport import ViewportMapper
+
+
+class ThumbnailCache(QtCore.QObject):
+    """
+    Least recently used cache of thumbnails. The thumbnails are generated in
+    the global thread pool: request() returns None until the thumbnail is
+    ready, then thumbnailReady is emitted and the widgets have to repaint.
+    A failed generation is forgotten, so the next request retries it.
+    Images are keyed by their QImage.cacheKey() which changes as soon as the
+    image data is edited.
+    """
+    CAPACITY = 256
+    thumbnailReady = QtCore.Signal()
+    _generated = QtCore.Signal(object, QtGui.QImage)
+    _failed = QtCore.Signal(object)
+
+    def __init__(self, capacity=None, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity or self.CAPACITY
+        self.thumbnails = OrderedDict()
+        self.pending = set()
+        self.threadpool = QtCore.QThreadPool.globalInstance()
+        # Emitted from the worker threads, the slot is queued in the thread
+        # owning the cache.
+        self._generated.connect(self._store)
+        self._failed.connect(self.pending.discard)
+
+    def __len__(self):
+        return len(self.thumbnails)
+
+    def __contains__(self, key):
+        return key in self.thumbnails
+
+    def _store(self, key, thumbnail):
+        self.pending.discard(key)
+        self.thumbnails[key] = thumbnail
+        self.thumbnails.move_to_end(key)
+        while len(self.thumbnails) > self.capacity:
+            self.thumbnails.popitem(last=False)
+        self.thumbnailReady.emit()
+
+    def request(self, key, function, *args):
+        """
+        Return the thumbnail stored for the key or None. If the key is unknown,
+        function(*args) is called in a worker thread and has to return the
+        thumbnail QImage.
+        """
+        thumbnail = self.thumbnails.get(key)
+        if thumbnail is not None:
+            self.thumbnails.move_to_end(key)
+            return thumbnail
+        if key not in self.pending:
+            self.pending.add(key)
+            job = _ThumbnailJob(
+                self._generated, self._failed, key, function, args)
+            self.threadpool.start(job)
+
+    def image(self, image, size):
+        key = 'image', image.cacheKey(), size
+        return self.request(
+            key, scale_image, image, size, mapped_frame(image))
+
+    def layer(self, model, layer_id, size):
+        """
+        Thumbnail of the layer as saved in the current undo state. The undo
+        states are snapshots, so they can be safely read from the workers.
+        The thumbnail is kept until the layer revision changes, the edits of
+        the other layers don't render it again.
+        """
+        if not model.undostack:
+            return
+        layers = model.undostack[-1]['layers']
+        layer = next((s for s in layers if s.id == layer_id), None)
+        if layer is None:
+            return
+        key = 'layer', layer_id, layer.revision, layer.blend_mode, size
+        return self.request(
+            key, render_layer, layer.shapes, layer.blend_mode,
+            model.baseimage.size(), size)
+
+    def clear(self):
+        self.thumbnails.clear()
+
+
+class _ThumbnailJob(QtCore.QRunnable):
+    def __init__(self, signal, failed, key, function, args):
+        super().__init__()
+        self.signal = signal
+        self.failed = failed
+        self.key = key
+        self.function = function
+        self.args = args
+
+    def run(self):
+        try:
+            thumbnail = self.function(*self.args)
+        except Exception:
+            # Exceptions cannot leave the worker thread, log it and release
+            # the key.
+            traceback.print_exc()
+            self.failed.emit(self.key)
+            return
+        self.signal.emit(self.key, thumbnail)
+
+
+def scale_image(image, size, frame=None):
+    """
+    frame: MappedFrame of the image, referenced to keep it mapped while the
+    job runs.
+    """
+    return image.scaled(
+        size, size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+
+
+def render_layer(layer, blend_mode, frame_size, size):
+    width = frame_size.width() or size
+    height = frame_size.height() or size
+    viewportmapper = ViewportMapper()
+    viewportmapper.zoom = min(size / width, size / height)
+    viewportmapper.origin = QtCore.QPointF(
+        -(size - width * viewportmapper.zoom) / 2,
+        -(size - height * viewportmapper.zoom) / 2)
+    image = QtGui.QImage(size, size, QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.fill(QtCore.Qt.transparent)
+    painter = QtGui.QPainter(image)
+    painter.setRenderHint(QtGui.QPainter.Antialiasing)
+    try:
+        draw_layer(painter, layer, blend_mode, 255, viewportmapper)
+    finally:
+        painter.end()
+    return image
+
+
+_cache = None
+
+
+def thumbnail_cache():
+    """
+    Cache shared by all the widgets. Needs a QApplication.
+    """
+    global _cache
+    if _cache is None:
+        _cache = ThumbnailCache()
+    return _cache
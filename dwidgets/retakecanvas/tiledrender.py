@@ -0,0 +1,166 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.canvas import (
+    get_static_text, render_model, render_rect)
+from dwidgets.retakecanvas.imageloader import SIDECAR_EXTENSION
+from dwidgets.retakecanvas.shapes import Arrow, Stroke, Text
+from dwidgets.retakecanvas.spatial import ShapeIndex
+from dwidgets.retakecanvas.viewport import ViewportMapper
+
+
+TILE_SIZE = 1024
+
+
+def tile_rows(width, height, tile_size=TILE_SIZE):
+    """
+    Return the tiles rects (pixels) grouped by row.
+    """
+    return [
+        [
+            QtCore.QRect(
+                left, top,
+                min(tile_size, width - left), min(tile_size, height - top))
+            for left in range(0, width, tile_size)]
+        for top in range(0, height, tile_size)]
+
+
+def shape_margin(shape):
+    """
+    Units drawn outside the shape bounds by its pen or its arrow head.
+    """
+    if isinstance(shape, Stroke):
+        return max((size for _, size in shape), default=0)
+    if isinstance(shape, Arrow):
+        return max(shape.tailwidth, shape.headsize)
+    return getattr(shape, 'linewidth', 0)
+
+
+class TileCuller:
+    """
+    Spatial index of each layer shapes, built once for all the tiles. A tile
+    only draws the shapes whose bounds, grown by the widest pen of the
+    document, cross it. The texts can overflow their rect and are always
+    drawn.
+    """
+
+    def __init__(self, model):
+        self.indexes = {}
+        self.texts = {}
+        self.positions = {}
+        margin = 0
+        for layer in model.layerstack:
+            shapes = [s for s in layer.shapes if not isinstance(s, Text)]
+            self.indexes[layer.id] = ShapeIndex(shapes)
+            self.texts[layer.id] = [
+                s for s in layer.shapes if isinstance(s, Text)]
+            self.positions.update(
+                (id(shape), i) for i, shape in enumerate(layer.shapes))
+            margin = max([margin] + [shape_margin(s) for s in shapes])
+        self.margin = margin + 1
+
+    def shapes(self, layer, rect):
+        margin = self.margin
+        rect = rect.adjusted(-margin, -margin, margin, margin)
+        shapes = self.indexes[layer.id].intersecting(rect)
+        texts = self.texts[layer.id]
+        if not texts:
+            return shapes
+        return sorted(shapes + texts, key=lambda s: self.positions[id(s)])
+
+
+def render_tile(model, origin, tile, culler=None):
+    """
+    Render a tile of the document. Each tile uses its own image and painter
+    so the tiles can be rendered concurrently.
+    origin: document rect top left (units).
+    culler: TileCuller of the model, to draw only the shapes of the tile.
+    """
+    viewportmapper = ViewportMapper()
+    viewportmapper.origin = QtCore.QPointF(
+        origin.x() + tile.left(), origin.y() + tile.top())
+    layer_shapes = None
+    if culler is not None:
+        rect = QtCore.QRectF(viewportmapper.origin, QtCore.QSizeF(tile.size()))
+        layer_shapes = partial(culler.shapes, rect=rect)
+    image = QtGui.QImage(tile.size(), QtGui.QImage.Format_RGB32)
+    image.fill(QtCore.Qt.black)
+    painter = QtGui.QPainter(image)
+    try:
+        render_model(
+            model, painter, viewportmapper, layer_shapes=layer_shapes)
+    finally:
+        painter.end()
+    return image
+
+
+def prepare_shared_caches(model):
+    """
+    Build the drawing caches stored on the shapes before the tiles are
+    rendered by several threads, which then only read them. The texts
+    layouts are built for the zoom 1 of the tiles, the strokes don't use
+    levels of details at this zoom.
+    """
+    for text in model.layerstack.shapes_of_type(Text):
+        if text.is_valid:
+            get_static_text(text, 1)
+
+
+def render_tiles(model, tile_size=TILE_SIZE, workers=None):
+    """
+    Render the document tile per tile in a thread pool.
+    Yield (tiles row rects, tiles row images). The next row is rendered
+    while the current one is consumed, at most two rows are in memory.
+    """
+    rect = render_rect(model)
+    width, height = int(rect.width()), int(rect.height())
+    rows = tile_rows(width, height, tile_size)
+    origin = rect.topLeft()
+    prepare_shared_caches(model)
+    # The previewed selection transform can move the shapes out of their
+    # indexed bounds.
+    culler = TileCuller(model) if model.selection.transform is None else None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(row):
+            return [
+                executor.submit(render_tile, model, origin, tile, culler)
+                for tile in row]
+
+        pending = submit(rows[0]) if rows else []
+        for i, row in enumerate(rows):
+            futures = pending
+            pending = submit(rows[i + 1]) if i + 1 < len(rows) else []
+            yield row, [future.result() for future in futures]
+
+
+def write_tiles_row(stream, row, images, bytes_per_pixel):
+    buffers = [memoryview(image.constBits()) for image in images]
+    for y in range(row[0].height()):
+        for tile, image, buffer in zip(row, images, buffers):
+            start = y * image.bytesPerLine()
+            stream.write(buffer[start:start + tile.width() * bytes_per_pixel])
+
+
+def render_to_file(model, path, tile_size=TILE_SIZE, workers=None):
+    """
+    Render the document to a binary PPM (.ppm) or to a raw RGB32 buffer
+    with a json sidecar (any other extension) without allocating the whole
+    image. Both can be mapped back with imageloader.
+    """
+    rect = render_rect(model)
+    width, height = int(rect.width()), int(rect.height())
+    ppm = os.path.splitext(path)[-1].lower() == '.ppm'
+    with open(path, 'wb') as stream:
+        if ppm:
+            stream.write(f'P6\n{width} {height}\n255\n'.encode('ascii'))
+        for row, images in render_tiles(model, tile_size, workers):
+            if ppm:
+                images = [
+                    image.convertToFormat(QtGui.QImage.Format_RGB888)
+                    for image in images]
+            write_tiles_row(stream, row, images, 3 if ppm else 4)
+    if not ppm:
+        with open(path + SIDECAR_EXTENSION, 'w') as f:
+            json.dump({'width': width, 'height': height, 'format': 'RGB32'}, f)
@@ -1,6 +1,9 @@
 from dwidgets.retakecanvas.tools.basetool import NavigationTool
+from dwidgets.retakecanvas.tools.brushtool import RasterBrushTool
 from dwidgets.retakecanvas.tools.erasertool import EraserTool
-from dwidgets.retakecanvas.tools.movetool import SelectionTool, MoveTool
+from dwidgets.retakecanvas.tools.filltool import FillTool
+from dwidgets.retakecanvas.tools.movetool import (
+    LassoSelectionTool, SelectionTool, MoveTool)
 from dwidgets.retakecanvas.tools.painttool import DrawTool, SmoothDrawTool
 from dwidgets.retakecanvas.tools.shapetool import RectangleTool, ArrowTool, CircleTool, LineTool
 from dwidgets.retakecanvas.tools.texttool import TextTool
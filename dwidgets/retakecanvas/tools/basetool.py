@@ -1,4 +1,5 @@
 from PySide2 import QtCore
+from dwidgets.retakecanvas.snapping import SNAP_TOLERANCE
 from dwidgets.retakecanvas.viewport import zoom
 
 
@@ -36,6 +37,17 @@ class BaseTool:
     def set_model(self, model):
         self.model = model
 
+    def snap(self, point, exclude=()):
+        """
+        Return the units point snapped on the document if the snapping is
+        enabled. exclude: ids of the shapes to ignore.
+        """
+        if not self.drawcontext.snapping:
+            return point
+        self.model.snapindex.sync(self.model)
+        tolerance = self.viewportmapper.to_units(SNAP_TOLERANCE)
+        return self.model.snapindex.snap(point, tolerance, exclude)
+
     def keyPressEvent(self, event):
         ...
 
@@ -58,6 +70,14 @@ class BaseTool:
     def tabletMoveEvent(self, event):
         ...
 
+    def tabletBatchEvent(self, batch):
+        """
+        Receive the tablet samples of a frame (tabletinput.TabletBatch). By
+        default each sample is sent to tabletMoveEvent.
+        """
+        for sample in batch:
+            self.tabletMoveEvent(sample)
+
     def wheelEvent(self, event):
         ...
 
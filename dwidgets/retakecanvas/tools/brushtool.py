@@ -0,0 +1,86 @@
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.brush import Brush, BrushStroke
+from dwidgets.retakecanvas.shapes import Raster
+from dwidgets.retakecanvas.tools.basetool import NavigationTool
+
+
+class RasterBrushTool(NavigationTool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.brush = Brush()
+        self.pressure = 1
+        self.stroke = None
+
+    def current_raster(self):
+        """
+        The raster on top of the current layer is painted over, a new one is
+        added if shapes were drawn since, to keep the painting order.
+        """
+        shapes = self.layerstack.current
+        if shapes and isinstance(shapes[-1], Raster):
+            return shapes[-1]
+        raster = Raster()
+        shapes.append(raster)
+        return raster
+
+    def mousePressEvent(self, event):
+        super().mousePressEvent(event)
+        if self.layerstack.is_locked or self.navigator.space_pressed:
+            return
+        if event.button() != QtCore.Qt.LeftButton:
+            return
+        self.pressure = 1
+        if self.layerstack.current is None:
+            self.model.add_layer(undo=False, name='Paint')
+        self.selection.clear()
+        self.stroke = BrushStroke(
+            self.brush, self.current_raster(), self.drawcontext.color,
+            self.drawcontext.size)
+        self.add_point(event.pos())
+
+    def mouseMoveEvent(self, event):
+        if not super().mouseMoveEvent(event):
+            self.add_point(event.pos())
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if self.stroke is None:
+            return False
+        self.stroke = None
+        return True
+
+    def tabletMoveEvent(self, event):
+        self.pressure = event.pressure()
+        self.add_point(event.pos())
+        return True
+
+    def tabletBatchEvent(self, batch):
+        if self.stroke is not None:
+            self.stroke.add_points(batch.points, batch.pressures)
+            self.pressure = batch.pressures[-1]
+
+    def add_point(self, position):
+        if self.stroke is None:
+            return
+        point = self.viewportmapper.to_units_coords(position)
+        self.stroke.add_point(point, self.pressure)
+
+    def window_cursor_visible(self):
+        return self.navigator.space_pressed or self.layerstack.is_locked
+
+    def window_cursor_override(self):
+        cursor = super().window_cursor_override()
+        if cursor:
+            return cursor
+        if self.layerstack.is_locked:
+            return QtCore.Qt.ForbiddenCursor
+
+    def draw(self, painter):
+        if self.navigator.space_pressed:
+            return
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_Difference)
+        painter.setPen(QtCore.Qt.white)
+        painter.setBrush(QtCore.Qt.transparent)
+        radius = self.viewportmapper.to_viewport(self.drawcontext.size)
+        pos = self.canvas.mapFromGlobal(QtGui.QCursor.pos())
+        painter.drawEllipse(pos, max(radius / 2, 1), max(radius / 2, 1))
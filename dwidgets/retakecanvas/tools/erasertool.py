@@ -1,4 +1,3 @@
-import itertools
 from PySide2 import QtCore, QtGui
 from dwidgets.retakecanvas.shapes import Stroke
 from dwidgets.retakecanvas.mathutils import distance_qline_qpoint
@@ -62,11 +61,8 @@ class EraserTool(NavigationTool):
 
 
 def split_stroke_data(stroke, points):
-    all_points = [p for p, _ in stroke]
-    indexes = [
-        i for (i, p1), p2 in itertools.product(enumerate(all_points), points)
-        if p1 is p2]
-    indexes = [i for i in range(len(stroke)) if i not in indexes]
+    ids = {id(p) for p in points}
+    indexes = [i for i, (p, _) in enumerate(stroke) if id(p) not in ids]
     if not indexes:
         return []
     groups = []
@@ -95,8 +91,9 @@ def filter_point_to_erase_from_line(line, width, layer):
 
 
 def get_point_to_erase(points, layer):
+    ids = {id(p) for p in points}
     result = [
-        (s, i, [p for p, _ in s if p in points])
+        (s, i, [p for p, _ in s if id(p) in ids])
         for i, s in enumerate(layer) if isinstance(s, Stroke)]
     return [data for data in result if data[2]]
 
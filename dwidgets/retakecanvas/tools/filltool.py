@@ -0,0 +1,82 @@
+import math
+from PySide2 import QtCore
+from dwidgets.retakecanvas.floodfill import flood_fill, spans_to_bitmap
+from dwidgets.retakecanvas.tools.basetool import NavigationTool
+
+
+class FillTool(NavigationTool):
+    """
+    Bucket fill. The area around the click is filled in the rendered
+    document (or in the current layer only) and added to the current layer
+    as a Bitmap.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Maximum difference (0-255) per channel with the clicked color.
+        self.tolerance = 32
+        self.current_layer_only = False
+        self.filled = False
+        self._sample = None
+        self._sample_key = None
+
+    def sample(self):
+        """
+        Return the rendered image and its units origin. The render is kept
+        until the document, its images, the wash or the layers display
+        change.
+        """
+        model = self.model
+        layerstack = self.layerstack
+        layer = layerstack.current_layer if self.current_layer_only else None
+        images = [model.baseimage] + model.imagestack
+        key = (
+            model.uid, model.revision,
+            layer.id if layer is not None else None, layerstack.solo,
+            tuple(
+                (layer_.id, layer_.visible, layer_.opacity, layer_.blend_mode)
+                for layer_ in layerstack),
+            model.wash_color, model.wash_opacity, model.imagestack_layout,
+            tuple(image.cacheKey() for image in images),
+            tuple(
+                wipe.getRect()
+                for wipe in [model.baseimage_wipes] + model.imagestack_wipes))
+        if key != self._sample_key:
+            self._sample = self.canvas.render_document(layer)
+            self._sample_key = key
+        return self._sample
+
+    def mousePressEvent(self, event):
+        super().mousePressEvent(event)
+        wrong_button = event.button() != QtCore.Qt.LeftButton
+        if self.navigator.space_pressed or wrong_button:
+            return
+        if self.layerstack.is_locked:
+            return
+        if self.layerstack.current is None:
+            self.model.add_layer(undo=False, name='Fill')
+        image, origin = self.sample()
+        point = self.viewportmapper.to_units_coords(event.pos()) - origin
+        spans = flood_fill(
+            image, math.floor(point.x()), math.floor(point.y()),
+            self.tolerance)
+        bitmap = spans_to_bitmap(spans, self.drawcontext.color, origin)
+        if bitmap is None:
+            return
+        self.selection.clear()
+        self.layerstack.current.append(bitmap)
+        self.filled = True
+        return True
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        result, self.filled = self.filled, False
+        return result
+
+    def window_cursor_override(self):
+        cursor = super().window_cursor_override()
+        if cursor:
+            return cursor
+        if self.layerstack.is_locked:
+            return QtCore.Qt.ForbiddenCursor
+        return QtCore.Qt.CrossCursor
@@ -1,9 +1,12 @@
 from PySide2 import QtCore, QtGui
-from dwidgets.retakecanvas.geometry import get_shape_rect
+from dwidgets.retakecanvas.geometry import (
+    get_shape_rect, rect_contains_rect, shape_bounds, shape_points)
+from dwidgets.retakecanvas.mathutils import (
+    distance, numpy, points_in_polygon)
 from dwidgets.retakecanvas.tools.basetool import NavigationTool
-from dwidgets.retakecanvas.selection import selection_rect, Selection
-from dwidgets.retakecanvas.shapes import (
-    Arrow, Rectangle, Circle, Bitmap, Stroke, Text, Line)
+from dwidgets.retakecanvas.selection import (
+    selection_rect, Selection, SelectionTransform)
+from dwidgets.retakecanvas.spatial import ShapeIndex
 
 
 class MoveTool(NavigationTool):
@@ -12,6 +15,9 @@ class MoveTool(NavigationTool):
         super().__init__(*args, **kwargs)
         self._mouse_ghost = None
         self.element_hover = None
+        self.transform = None
+        self.snap_sources = []
+        self.snap_exclude = set()
 
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
@@ -21,15 +27,54 @@ class MoveTool(NavigationTool):
             self.layerstack.is_locked)
         if return_condition:
             return
-        self._mouse_ghost = event.pos()
-        if self.element_hover is self.selection:
-            return
-        if self.element_hover:
-            self.selection.set(self.element_hover)
+        self._mouse_ghost = self.viewportmapper.to_units_coords(event.pos())
+        if self.element_hover is not self.selection:
+            if self.element_hover:
+                self.selection.set(self.element_hover)
+            else:
+                self.selection.clear()
             self.canvas.selectionChanged.emit()
-            return
-        self.selection.clear()
-        self.canvas.selectionChanged.emit()
+        if self.selection.type:
+            self.transform = SelectionTransform(
+                self.selection, self.layerstack.current)
+            self.selection.transform = self.transform
+            self.set_snap_sources()
+
+    def set_snap_sources(self):
+        """
+        The dragged point snaps itself. A bigger selection snaps its
+        bounding rect corners and center. The shapes being edited are not
+        snap targets.
+        """
+        points = self.transform.points
+        if len(points) == 1 and not self.transform.bitmaps:
+            self.snap_sources = [QtCore.QPointF(points[0])]
+        else:
+            if self.selection.type == Selection.ELEMENT:
+                rect = shape_bounds(self.selection.element)
+            else:
+                rect = selection_rect(self.selection)
+            self.snap_sources = [] if rect is None else [
+                rect.topLeft(), rect.topRight(), rect.bottomRight(),
+                rect.bottomLeft(), rect.center()]
+        ids = {id(point) for point in points}
+        self.snap_exclude = set(self.transform.shapes) | {
+            id(shape) for shape in self.layerstack.current
+            if any(id(point) in ids for point in shape_points(shape))}
+
+    def snap_offset(self, offset):
+        if not self.drawcontext.snapping:
+            return offset
+        correction = None
+        for source in self.snap_sources:
+            point = source + offset
+            delta = self.snap(point, self.snap_exclude) - point
+            if delta.isNull():
+                continue
+            if correction is None or (
+                    delta.manhattanLength() < correction.manhattanLength()):
+                correction = delta
+        return offset if correction is None else offset + correction
 
     def set_hover_element(self, point):
         if self.selection.type:
@@ -47,21 +92,25 @@ class MoveTool(NavigationTool):
         if not self._mouse_ghost:
             self.set_hover_element(event.pos())
             return
-
-        point = event.pos()
-        x = self.viewportmapper.to_units(self._mouse_ghost.x() - point.x())
-        y = self.viewportmapper.to_units(self._mouse_ghost.y() - point.y())
-        offset = QtCore.QPoint(x, y)
-        self._mouse_ghost = event.pos()
-        if self.selection.type == Selection.SUBOBJECTS:
-            shift_selection_content(self.selection, offset)
-        elif self.selection.type == Selection.ELEMENT:
-            shift_element(self.selection.element, offset)
+        if self.transform is None:
+            return
+        point = self.viewportmapper.to_units_coords(event.pos())
+        offset = self.snap_offset(point - self._mouse_ghost)
+        matrix = QtGui.QTransform.fromTranslate(offset.x(), offset.y())
+        self.transform.set_matrix(matrix)
 
     def mouseReleaseEvent(self, event):
         super().mouseReleaseEvent(event)
-        result = bool(self._mouse_ghost) and bool(self.selection.type)
+        result = False
+        if self.transform is not None:
+            result = not self.transform.is_identity
+            self.transform.bake()
+            self.selection.transform = None
+            self.selection.invalidate()
+        self.transform = None
         self._mouse_ghost = None
+        self.snap_sources = []
+        self.snap_exclude = set()
         return result
 
     def tabletMoveEvent(self, event):
@@ -78,7 +127,7 @@ class MoveTool(NavigationTool):
             return QtCore.Qt.SizeAllCursor
 
     def draw(self, painter):
-        if self.element_hover is None:
+        if self.element_hover is None or self.transform is not None:
             return
         if self.selection.element == self.element_hover:
             return
@@ -110,30 +159,14 @@ class MoveTool(NavigationTool):
         painter.setOpacity(old_opacity)
 
 
-def shift_element(element, offset):
-    if isinstance(element, (QtCore.QPoint, QtCore.QPointF)):
-        element -= offset
-    elif isinstance(element, Stroke):
-        for point, _ in element.points:
-            point -= offset
-    elif isinstance(element, (Arrow, Rectangle, Circle, Text, Line)):
-        element.start -= offset
-        element.end -= offset
-    elif isinstance(element, Bitmap):
-        element.rect.moveCenter(element.rect.center() - offset)
-
-
-def shift_selection_content(selection, offset):
-    for element in selection:
-        shift_element(element, offset)
-
-
 class SelectionTool(NavigationTool):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.start = None
         self.end = None
+        self.query = None
+        self.elements = []
 
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
@@ -148,20 +181,32 @@ class SelectionTool(NavigationTool):
     def mouseMoveEvent(self, event):
         if super().mouseMoveEvent(event):
             return
+        if self.start is None:
+            return
         self.end = event.pos()
+        self.update_elements()
+
+    def update_elements(self):
+        if not self.layerstack.current:
+            self.elements = []
+            return
+        if self.query is None:
+            self.query = RectSelectionQuery(self.layerstack.current)
+        end = self.viewportmapper.to_units_coords(self.end)
+        self.elements = self.query.update(QtCore.QRectF(self.start, end))
 
     def mouseReleaseEvent(self, event):
         super().mouseReleaseEvent(event)
         if self.end is None or not self.layerstack.current:
             self.selection.clear()
-        else:
-            end = self.viewportmapper.to_units_coords(self.end)
-            rect = QtCore.QRectF(self.start, end)
-            elements = layer_elements_in_rect(self.layerstack.current, rect)
-            self.selection.set(elements)
+        elif self.start is not None:
+            self.update_elements()
+            self.selection.set(self.elements)
         self.canvas.selectionChanged.emit()
         self.start = None
         self.end = None
+        self.query = None
+        self.elements = []
         return False
 
     def tabletMoveEvent(self, event):
@@ -186,16 +231,165 @@ class SelectionTool(NavigationTool):
         painter.setBrush(color)
         start = self.viewportmapper.to_viewport_coords(self.start)
         painter.drawRect(QtCore.QRectF(start, self.end))
+        self.draw_elements(painter)
+
+    def draw_elements(self, painter):
+        if not self.elements:
+            return
+        # Preview the selected points in a single draw call.
+        transform = self.viewportmapper.to_viewport_transform()
+        points = transform.map(QtGui.QPolygonF(self.elements))
+        pen = QtGui.QPen(QtCore.Qt.yellow)
+        pen.setWidth(4)
+        pen.setCapStyle(QtCore.Qt.SquareCap)
+        painter.setPen(pen)
+        painter.drawPoints(points)
+
+
+class LassoSelectionTool(SelectionTool):
+    """
+    Select the points inside a free-form polygon drawn with the mouse.
+    """
+    # Minimum length in pixels of the lasso segments.
+    SEGMENT_LENGTH = 3
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lasso = []
+
+    def mousePressEvent(self, event):
+        super().mousePressEvent(event)
+        self.lasso = [] if self.start is None else [self.start]
+
+    def update_elements(self):
+        if not self.layerstack.current or not self.lasso:
+            self.elements = []
+            return
+        point = self.viewportmapper.to_units_coords(self.end)
+        length = self.viewportmapper.to_units(self.SEGMENT_LENGTH)
+        if distance(point, self.lasso[-1]) < length:
+            return
+        self.lasso.append(point)
+        if self.query is None:
+            self.query = LassoSelectionQuery(self.layerstack.current)
+        self.elements = self.query.update(QtGui.QPolygonF(self.lasso))
+
+    def mouseReleaseEvent(self, event):
+        result = super().mouseReleaseEvent(event)
+        self.lasso = []
+        return result
+
+    def draw(self, painter):
+        if self.navigator.space_pressed or not self.lasso or not self.end:
+            return
+        pen = QtGui.QPen(QtGui.QColor('blue'))
+        pen.setWidth(1)
+        painter.setPen(pen)
+        color = QtGui.QColor('blue')
+        color.setAlpha(33)
+        painter.setBrush(color)
+        transform = self.viewportmapper.to_viewport_transform()
+        polygon = transform.map(QtGui.QPolygonF(self.lasso))
+        polygon.append(QtCore.QPointF(self.end))
+        painter.drawPolygon(polygon)
+        self.draw_elements(painter)
+
+
+class LassoSelectionQuery:
+    """
+    Polygon query used while a lasso is drawn over a layer. The shapes are
+    prefiltered by their bounds with a spatial index, then the points of the
+    remaining shapes are tested against the polygon. With numpy, the points
+    of each shape are packed once in a coordinates array and all the points
+    are tested in a single vectorized pass. Otherwise the points are tested
+    one by one with QPolygonF.containsPoint.
+    """
+
+    def __init__(self, layer):
+        self.index = ShapeIndex(layer)
+        self.points = {}
+        self.coordinates = {}
+
+    def shape_points(self, shape):
+        try:
+            return self.points[id(shape)]
+        except KeyError:
+            points = shape_points(shape)
+            self.points[id(shape)] = points
+            return points
+
+    def shape_coordinates(self, shape):
+        try:
+            return self.coordinates[id(shape)]
+        except KeyError:
+            coordinates = numpy.array(
+                [(p.x(), p.y()) for p in self.shape_points(shape)],
+                dtype=float).reshape(-1, 2)
+            self.coordinates[id(shape)] = coordinates
+            return coordinates
+
+    def update(self, polygon):
+        if polygon.size() < 3:
+            return []
+        shapes = [
+            shape for shape in self.index.intersecting(polygon.boundingRect())
+            if self.shape_points(shape)]
+        if not shapes:
+            return []
+        if numpy is None:
+            return [
+                point for shape in shapes for point in self.shape_points(shape)
+                if polygon.containsPoint(point, QtCore.Qt.OddEvenFill)]
+        coordinates = numpy.concatenate(
+            [self.shape_coordinates(shape) for shape in shapes])
+        vertices = [(p.x(), p.y()) for p in polygon]
+        inside = points_in_polygon(coordinates, vertices)
+        points = [
+            point for shape in shapes for point in self.points[id(shape)]]
+        return [points[i] for i in numpy.flatnonzero(inside)]
+
+
+class RectSelectionQuery:
+    """
+    Incremental rectangle query used while a marquee is dragged over a layer.
+    The shapes bounds are computed once and stored in a spatial index, only
+    the shapes crossing the rectangle border get their points tested.
+    """
+
+    def __init__(self, layer):
+        self.index = ShapeIndex(layer)
+        self.points = {}
+        self.results = {}
+        self.rect = None
+
+    def shape_points(self, shape):
+        try:
+            return self.points[id(shape)]
+        except KeyError:
+            points = shape_points(shape)
+            self.points[id(shape)] = points
+            return points
+
+    def update(self, rect):
+        rect = rect.normalized()
+        shrinking = (
+            self.rect is not None and rect_contains_rect(self.rect, rect))
+        results = {}
+        for shape in self.index.intersecting(rect):
+            key = id(shape)
+            if rect_contains_rect(rect, self.index.bounds[key]):
+                results[key] = self.shape_points(shape)
+                continue
+            if shrinking:
+                # Points out of the previous rect can't be in the new one.
+                points = self.results.get(key, [])
+            else:
+                points = self.shape_points(shape)
+            results[key] = [p for p in points if rect.contains(p)]
+        self.results = results
+        self.rect = rect
+        return [point for points in results.values() for point in points]
 
 
 def layer_elements_in_rect(layer, rect):
-    result = []
-    for element in layer:
-        if isinstance(element, Stroke):
-            result.extend(p for p, _ in element if rect.contains(p))
-        elif isinstance(element, (Arrow, Rectangle, Circle, Text, Line)):
-            if rect.contains(element.start):
-                result.append(element.start)
-            if rect.contains(element.end):
-                result.append(element.end)
-    return result
+    return RectSelectionQuery(layer).update(rect)
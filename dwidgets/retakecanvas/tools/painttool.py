@@ -11,6 +11,7 @@ class DrawTool(NavigationTool):
         self.stroke = None
         self.old_time = None
         self.old_mouse_time = None
+        self.predicted = None
 
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
@@ -34,6 +35,7 @@ class DrawTool(NavigationTool):
         super().mouseReleaseEvent(event)
         if super().mouseMoveEvent(event):
             return
+        self.predicted = None
         if self.stroke:
             if not self.stroke.is_valid:
                 self.layerstack.current.remove(self.stroke)
@@ -46,8 +48,16 @@ class DrawTool(NavigationTool):
         self.pressure = event.pressure()
         self.add_point(event.pos())
 
+    def tabletBatchEvent(self, batch):
+        for point, pressure in zip(batch.points, batch.pressures):
+            self.pressure = pressure
+            self.add_units_point(point)
+        self.predicted = batch.predicted
+
     def add_point(self, position):
-        point = self.viewportmapper.to_units_coords(position)
+        self.add_units_point(self.viewportmapper.to_units_coords(position))
+
+    def add_units_point(self, point):
         width = self.pressure * self.drawcontext.size
         valid = self.drawcontext.size / 2
         if not self.stroke or distance(point, self.stroke[-1][0]) <= valid:
@@ -70,6 +80,9 @@ class DrawTool(NavigationTool):
         if self.navigator.space_pressed:
             return
 
+        if self.stroke and self.predicted is not None:
+            draw_prediction(
+                painter, self.stroke, self.predicted, self.viewportmapper)
         painter.setCompositionMode(QtGui.QPainter.CompositionMode_Difference)
         painter.setPen(QtCore.Qt.white)
         painter.setBrush(QtCore.Qt.transparent)
@@ -93,6 +106,7 @@ class SmoothDrawTool(NavigationTool):
         self.buffer = []
         self.width_buffer = []
         self.buffer_lenght = 20
+        self.predicted = None
 
     def mousePressEvent(self, event):
         if self.layerstack.is_locked or self.navigator.space_pressed:
@@ -113,7 +127,10 @@ class SmoothDrawTool(NavigationTool):
             self.add_point(event.pos())
 
     def add_point(self, point):
-        self.buffer.append(self.viewportmapper.to_units_coords(point))
+        self.add_units_point(self.viewportmapper.to_units_coords(point))
+
+    def add_units_point(self, point):
+        self.buffer.append(point)
         self.width_buffer.append(self.pressure * self.drawcontext.size)
         if self.stroke:
             x = sum(p.x() for p in self.buffer) / len(self.buffer)
@@ -127,6 +144,7 @@ class SmoothDrawTool(NavigationTool):
     def mouseReleaseEvent(self, event):
         self.buffer = []
         self.width_buffer = []
+        self.predicted = None
         if self.stroke:
             if not self.stroke.is_valid:
                 self.layerstack.current.remove(self.stroke)
@@ -140,6 +158,12 @@ class SmoothDrawTool(NavigationTool):
         self.add_point(event.pos())
         return True
 
+    def tabletBatchEvent(self, batch):
+        for point, pressure in zip(batch.points, batch.pressures):
+            self.pressure = pressure
+            self.add_units_point(point)
+        self.predicted = batch.predicted
+
     def window_cursor_visible(self):
         return self.navigator.space_pressed
 
@@ -153,6 +177,9 @@ class SmoothDrawTool(NavigationTool):
     def draw(self, painter):
         if self.navigator.space_pressed:
             return
+        if self.stroke and self.predicted is not None:
+            draw_prediction(
+                painter, self.stroke, self.predicted, self.viewportmapper)
         radius = self.viewportmapper.to_viewport(self.drawcontext.size)
         painter.setCompositionMode(QtGui.QPainter.CompositionMode_Difference)
         painter.setPen(QtCore.Qt.white)
@@ -164,3 +191,20 @@ class SmoothDrawTool(NavigationTool):
         point = self.stroke.points[-1][0]
         point = self.viewportmapper.to_viewport_coords(point)
         painter.drawLine(pos, point)
+
+
+def draw_prediction(painter, stroke, point, viewportmapper):
+    """
+    Draw the predicted continuation of the stroke. It is only a preview and
+    is replaced by the real samples on the next frame.
+    """
+    last, size = stroke[-1]
+    pen = QtGui.QPen(QtGui.QColor(stroke.color))
+    pen.setWidthF(viewportmapper.to_viewport(size))
+    pen.setCapStyle(QtCore.Qt.RoundCap)
+    painter.save()
+    painter.setPen(pen)
+    painter.drawLine(
+        viewportmapper.to_viewport_coords(last),
+        viewportmapper.to_viewport_coords(point))
+    painter.restore()
@@ -15,7 +15,8 @@ class ShapeTool(NavigationTool):
         if super().mouseMoveEvent(event):
             return
         if self.shape:
-            self.shape.handle(self.viewportmapper.to_units_coords(event.pos()))
+            point = self.viewportmapper.to_units_coords(event.pos())
+            self.shape.handle(self.snap(point, {id(self.shape)}))
 
     def mouseReleaseEvent(self, event):
         super().mouseReleaseEvent(event)
@@ -55,7 +56,7 @@ class LineTool(ShapeTool):
             self.model.add_layer(undo=False, name=self.layername)
         self.selection.clear()
         self.shape = Line(
-            start=self.viewportmapper.to_units_coords(event.pos()),
+            start=self.snap(self.viewportmapper.to_units_coords(event.pos())),
             color=self.drawcontext.color,
             linewidth=self.drawcontext.size)
         self.layerstack.current.append(self.shape)
@@ -79,7 +80,7 @@ class ArrowTool(ShapeTool):
             self.model.add_layer(undo=False, name=self.layername)
         self.selection.clear()
         self.shape = Arrow(
-            start=self.viewportmapper.to_units_coords(event.pos()),
+            start=self.snap(self.viewportmapper.to_units_coords(event.pos())),
             color=self.drawcontext.color,
             linewidth=self.drawcontext.size)
         self.layerstack.current.append(self.shape)
@@ -105,7 +106,7 @@ class RectangleTool(ShapeTool):
             self.model.add_layer(undo=False, name=self.layername)
         self.selection.clear()
         self.shape = Rectangle(
-            start=self.viewportmapper.to_units_coords(event.pos()),
+            start=self.snap(self.viewportmapper.to_units_coords(event.pos())),
             color=self.drawcontext.color,
             bgcolor=self.drawcontext.bgcolor,
             bgopacity=self.drawcontext.bgopacity,
@@ -130,7 +131,7 @@ class CircleTool(ShapeTool):
             self.model.add_layer(undo=False, name=self.layername)
         self.selection.clear()
         self.shape = Circle(
-            start=self.viewportmapper.to_units_coords(event.pos()),
+            start=self.snap(self.viewportmapper.to_units_coords(event.pos())),
             color=self.drawcontext.color,
             bgcolor=self.drawcontext.bgcolor,
             bgopacity=self.drawcontext.bgopacity,
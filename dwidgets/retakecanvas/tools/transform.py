@@ -1,14 +1,37 @@
+import math
 from PySide2 import QtCore, QtGui
 from dwidgets.retakecanvas.geometry import get_shape_rect
 from dwidgets.retakecanvas.tools.basetool import NavigationTool
-from dwidgets.retakecanvas.tools.movetool import shift_element, shift_selection_content
-from dwidgets.retakecanvas.selection import selection_rect, Selection
+from dwidgets.retakecanvas.selection import (
+    selection_rect, SelectionTransform)
 from dwidgets.retakecanvas.viewport import ViewportMapper
-from dwidgets.retakecanvas.shapes import (
-    Arrow, Rectangle, Circle, Bitmap, Stroke, Text, Line)
+
+
+CORNERS = 'topleft', 'topright', 'bottomleft', 'bottomright'
+EDGES = 'top', 'bottom', 'left', 'right'
+ROTATE_HANDLE_DISTANCE = 20
+CURSORS = {
+    'topleft': QtCore.Qt.SizeFDiagCursor,
+    'bottomleft': QtCore.Qt.SizeBDiagCursor,
+    'topright': QtCore.Qt.SizeBDiagCursor,
+    'bottomright': QtCore.Qt.SizeFDiagCursor,
+    'top': QtCore.Qt.SizeHorCursor,
+    'bottom': QtCore.Qt.SizeHorCursor,
+    'left': QtCore.Qt.SizeVerCursor,
+    'right': QtCore.Qt.SizeVerCursor,
+    'rotate': QtCore.Qt.PointingHandCursor,
+    'move': QtCore.Qt.SizeAllCursor,
+}
 
 
 class TransformTool(NavigationTool):
+    """
+    Corners: scale, edges middle: skew, top handle: rotate (shift to snap
+    the angle by 15 degrees steps).
+    The drag is expressed as one QTransform relative to the selection state
+    at mouse press. It is previewed by the canvas and baked on release.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.element_hover = None
@@ -16,6 +39,7 @@ class TransformTool(NavigationTool):
         self._mouse_ghost = None
         self.current_cusor_pos = None
         self.reference_rect = None
+        self.transform = None
 
     def mousePressEvent(self, event):
         super().mousePressEvent(event)
@@ -26,44 +50,32 @@ class TransformTool(NavigationTool):
         if return_condition:
             return
 
-        self._mouse_ghost = event.pos()
+        self._mouse_ghost = self.viewportmapper.to_units_coords(event.pos())
 
         if not self.current_cusor_pos:
             return
 
-        rects = self.corner_rects()
-        if rects:
-            self.reference_rect = self.selection_rect()
-            if rects[0].contains(event.pos()):
-                self.action = 'topleft'
-                return
-
-            if rects[2].contains(event.pos()):
-                self.action = 'bottomleft'
-                return
-
-            if rects[1].contains(event.pos()):
-                self.action = 'topright'
-                return
-
-            if rects[3].contains(event.pos()):
-                self.action = 'bottomright'
-                return
-
+        self.action = self.handle_at(event.pos())
         rect = self.selection_rect()
-        if rect and self.viewportmapper.to_viewport_rect(rect).contains(event.pos()):
-            self.action = 'move'
-            self.canvas.selectionChanged.emit()
-            return
+        if self.action is None and rect:
+            rect = self.viewportmapper.to_viewport_rect(rect)
+            if rect.contains(event.pos()):
+                self.action = 'move'
 
-        if self.element_hover:
+        if self.action is None and self.element_hover:
             self.selection.set(self.element_hover)
             self.action = 'move'
+
+        if self.action is None:
+            self.selection.clear()
             self.canvas.selectionChanged.emit()
             return
 
-        self.selection.clear()
         self.canvas.selectionChanged.emit()
+        self.reference_rect = self.selection_rect()
+        self.transform = SelectionTransform(
+            self.selection, self.layerstack.current)
+        self.selection.transform = self.transform
 
     def mouseMoveEvent(self, event):
         if super().mouseMoveEvent(event):
@@ -74,23 +86,29 @@ class TransformTool(NavigationTool):
             self.set_hover_element(event.pos())
             return
 
-        if self.action in ('topleft', 'topright', 'bottomleft', 'bottomright'):
-            rect = QtCore.QRectF(self.reference_rect)
-            point = self.viewportmapper.to_units_coords(event.pos())
-            set_corner(rect, point, corner=self.action)
-            resize_selection(self.selection, self.reference_rect, rect)
-            self.reference_rect = rect
+        if self.transform is None:
+            return
 
+        point = self.viewportmapper.to_units_coords(event.pos())
+        reference = self.reference_rect
         if self.action == 'move':
-            point = event.pos()
-            x = self.viewportmapper.to_units(self._mouse_ghost.x() - point.x())
-            y = self.viewportmapper.to_units(self._mouse_ghost.y() - point.y())
-            offset = QtCore.QPoint(x, y)
-            self._mouse_ghost = event.pos()
-            if self.selection.type == Selection.SUBOBJECTS:
-                shift_selection_content(self.selection, offset)
-            elif self.selection.type == Selection.ELEMENT:
-                shift_element(self.selection.element, offset)
+            offset = point - self._mouse_ghost
+            matrix = QtGui.QTransform.fromTranslate(offset.x(), offset.y())
+        elif self.action in CORNERS:
+            rect = QtCore.QRectF(reference)
+            set_corner(rect, point, corner=self.action)
+            matrix = rect_transform(reference, rect)
+        elif self.action == 'rotate':
+            angle = vector_angle(reference.center(), self._mouse_ghost, point)
+            if self.navigator.shift_pressed:
+                angle = round(angle / 15) * 15
+            matrix = rotate_transform(reference.center(), angle)
+        elif self.action in EDGES:
+            offset = point - self._mouse_ghost
+            matrix = skew_transform(reference, offset, edge=self.action)
+        else:
+            return
+        self.transform.set_matrix(matrix)
 
     def set_hover_element(self, point):
         if self.selection.type:
@@ -104,7 +122,13 @@ class TransformTool(NavigationTool):
 
     def mouseReleaseEvent(self, event):
         super().mouseReleaseEvent(event)
-        result = bool(self._mouse_ghost) and bool(self.selection.type)
+        result = False
+        if self.transform is not None:
+            result = not self.transform.is_identity
+            self.transform.bake()
+            self.selection.transform = None
+            self.selection.invalidate()
+        self.transform = None
         self._mouse_ghost = None
         self.action = None
         self.reference_rect = None
@@ -118,59 +142,85 @@ class TransformTool(NavigationTool):
             return QtCore.Qt.ForbiddenCursor
         if not self.current_cusor_pos:
             return
-
-        if self.action == 'topleft':
-            return QtCore.Qt.SizeFDiagCursor
-        if self.action == 'bottomleft':
-            return QtCore.Qt.SizeBDiagCursor
-        if self.action == 'topright':
-            return QtCore.Qt.SizeBDiagCursor
-        if self.action == 'bottomright':
-            return QtCore.Qt.SizeFDiagCursor
-        if self.action == 'move':
-            return QtCore.Qt.SizeAllCursor
-
-        rects = self.corner_rects()
-        if rects:
-            if rects[0].contains(self.current_cusor_pos):
-                return QtCore.Qt.SizeFDiagCursor
-            if rects[2].contains(self.current_cusor_pos):
-                return QtCore.Qt.SizeBDiagCursor
-            if rects[1].contains(self.current_cusor_pos):
-                return QtCore.Qt.SizeBDiagCursor
-            if rects[3].contains(self.current_cusor_pos):
-                return QtCore.Qt.SizeFDiagCursor
-
+        if self.action:
+            return CURSORS[self.action]
+        handle = self.handle_at(self.current_cusor_pos)
+        if handle:
+            return CURSORS[handle]
         if self.element_hover:
             return QtCore.Qt.SizeAllCursor
 
     def selection_rect(self):
+        if self.reference_rect is not None:
+            return self.reference_rect
         rect = selection_rect(self.selection)
         if not rect:
             rect = get_shape_rect(self.selection.element, ViewportMapper())
         return rect
 
-    def corner_rects(self):
+    def handles(self):
+        """
+        Return handles positions in viewport coordinates.
+        """
         rect = self.selection_rect()
         if not rect:
+            return {}
+        matrix = self.viewportmapper.to_viewport_transform()
+        if self.transform is not None:
+            matrix = self.transform.matrix * matrix
+        topleft = matrix.map(rect.topLeft())
+        topright = matrix.map(rect.topRight())
+        bottomleft = matrix.map(rect.bottomLeft())
+        bottomright = matrix.map(rect.bottomRight())
+        top = (topleft + topright) / 2
+        center = (topleft + bottomright) / 2
+        direction = QtCore.QLineF(center, top)
+        if direction.length() > 0:
+            direction.setLength(
+                direction.length() + ROTATE_HANDLE_DISTANCE)
+            rotate = direction.p2()
+        else:
+            rotate = top - QtCore.QPointF(0, ROTATE_HANDLE_DISTANCE)
+        return {
+            'topleft': topleft,
+            'topright': topright,
+            'bottomleft': bottomleft,
+            'bottomright': bottomright,
+            'top': top,
+            'bottom': (bottomleft + bottomright) / 2,
+            'left': (topleft + bottomleft) / 2,
+            'right': (topright + bottomright) / 2,
+            'rotate': rotate}
+
+    def handle_at(self, point):
+        for name, position in self.handles().items():
+            if get_rect_from_point(position, 4).contains(point):
+                return name
+
+    def corner_rects(self):
+        handles = self.handles()
+        if not handles:
             return
-        rect = self.viewportmapper.to_viewport_rect(rect)
-        return (
-            get_rect_from_point(rect.topLeft(), 4),
-            get_rect_from_point(rect.topRight(), 4),
-            get_rect_from_point(rect.bottomLeft(), 4),
-            get_rect_from_point(rect.bottomRight(), 4))
+        return [get_rect_from_point(handles[c], 4) for c in CORNERS]
 
     def draw(self, painter):
         if not self.selection:
             return
-
+        handles = self.handles()
+        if not handles:
+            return
         painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
         painter.setPen(QtCore.Qt.black)
+        painter.drawLine(handles['top'], handles['rotate'])
         painter.setBrush(QtCore.Qt.white)
-        for rect in self.corner_rects() or []:
-            painter.drawRect(rect)
+        for name in CORNERS:
+            painter.drawRect(get_rect_from_point(handles[name], 4))
+        painter.setBrush(QtCore.Qt.gray)
+        for name in EDGES:
+            painter.drawRect(get_rect_from_point(handles[name], 3))
         painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
+        painter.setBrush(QtCore.Qt.white)
+        painter.drawEllipse(handles['rotate'], 4, 4)
 
 
 def get_rect_from_point(point, size):
@@ -178,34 +228,59 @@ def get_rect_from_point(point, size):
         point.x() - size, point.y() - size, size * 2, size * 2)
 
 
-def resize_selection(selection, reference_rect, rect):
-    if selection.type == Selection.ELEMENT:
-        element = selection.element
-        if isinstance(element, Bitmap):
-            element.rect = rect
-            return
-        if isinstance(element, (Arrow, Rectangle, Circle, Bitmap, Text, Line)):
-            points = (element.start, element.end)
-        elif isinstance(element, Stroke):
-            points = [p[0] for p in element.points]
-    elif selection.type == Selection.SUBOBJECTS:
-        points = selection
-
-    for point in points:
-        x = relative(
-            point.x(),
-            in_min=reference_rect.left(),
-            in_max=reference_rect.right(),
-            out_min=rect.left(),
-            out_max=rect.right())
-        point.setX(x)
-        y = relative(
-            point.y(),
-            in_min=reference_rect.top(),
-            in_max=reference_rect.bottom(),
-            out_min=rect.top(),
-            out_max=rect.bottom())
-        point.setY(y)
+def rect_transform(source, target):
+    """
+    Return the QTransform mapping the source rect on the target rect.
+    """
+    sx = target.width() / source.width() if source.width() else 1
+    sy = target.height() / source.height() if source.height() else 1
+    matrix = QtGui.QTransform.fromTranslate(-source.left(), -source.top())
+    matrix *= QtGui.QTransform.fromScale(sx, sy)
+    matrix *= QtGui.QTransform.fromTranslate(target.left(), target.top())
+    return matrix
+
+
+def rotate_transform(center, angle):
+    matrix = QtGui.QTransform.fromTranslate(-center.x(), -center.y())
+    matrix *= QtGui.QTransform().rotate(angle)
+    matrix *= QtGui.QTransform.fromTranslate(center.x(), center.y())
+    return matrix
+
+
+def skew_transform(rect, offset, edge):
+    """
+    Shear the rect by moving the given edge, the opposite edge is the anchor.
+    """
+    if edge in ('top', 'bottom'):
+        if not rect.height():
+            return QtGui.QTransform()
+        anchor = rect.bottom() if edge == 'top' else rect.top()
+        factor = offset.x() / (rect.top() - rect.bottom())
+        if edge == 'bottom':
+            factor = -factor
+        matrix = QtGui.QTransform.fromTranslate(0, -anchor)
+        matrix *= QtGui.QTransform().shear(factor, 0)
+        matrix *= QtGui.QTransform.fromTranslate(0, anchor)
+        return matrix
+    if not rect.width():
+        return QtGui.QTransform()
+    anchor = rect.right() if edge == 'left' else rect.left()
+    factor = offset.y() / (rect.left() - rect.right())
+    if edge == 'right':
+        factor = -factor
+    matrix = QtGui.QTransform.fromTranslate(-anchor, 0)
+    matrix *= QtGui.QTransform().shear(0, factor)
+    matrix *= QtGui.QTransform.fromTranslate(anchor, 0)
+    return matrix
+
+
+def vector_angle(center, start, end):
+    """
+    Angle in degrees between the center -> start and center -> end vectors.
+    """
+    start = math.atan2(start.y() - center.y(), start.x() - center.x())
+    end = math.atan2(end.y() - center.y(), end.x() - center.x())
+    return math.degrees(end - start)
 
 
 def set_corner(rect, point, corner):
@@ -225,19 +300,3 @@ def set_corner(rect, point, corner):
         x = max((rect.left() + 0.5, point.x()))
         y = max((rect.top() + 0.5, point.y()))
         rect.setBottomRight(QtCore.QPointF(x, y))
-
-
-def relative(value, in_min, in_max, out_min, out_max):
-    """
-    this function resolve simple equation and return the unknown value
-    in between two values.
-    a, a" = in_min, out_min
-    b, b " = out_max, out_max
-    c = value
-    ? is the unknown processed by function.
-    a --------- c --------- b
-    a" --------------- ? ---------------- b"
-    """
-    factor = float((value - in_min)) / (in_max - in_min)
-    width = out_max - out_min
-    return out_min + (width * (factor))
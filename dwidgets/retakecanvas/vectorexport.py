@@ -0,0 +1,405 @@
+import base64
+from PySide2 import QtCore, QtGui
+from dwidgets.retakecanvas.canvas import draw_shape_element, render_rect
+from dwidgets.retakecanvas.mathutils import decimate_stroke_points
+from dwidgets.retakecanvas.model import RetakeCanvasModel
+from dwidgets.retakecanvas.shapes import (
+    Arrow, Bitmap, Circle, Line, Raster, Rectangle, Stroke, Text)
+from dwidgets.retakecanvas.viewport import ViewportMapper
+
+
+# Points closer than the tolerance (units) are dropped from the strokes.
+TOLERANCE = 0.25
+SVG_BLEND_MODES = {
+    QtGui.QPainter.CompositionMode_Multiply: 'multiply',
+    QtGui.QPainter.CompositionMode_Screen: 'screen',
+    QtGui.QPainter.CompositionMode_Overlay: 'overlay',
+    QtGui.QPainter.CompositionMode_Darken: 'darken',
+    QtGui.QPainter.CompositionMode_Lighten: 'lighten',
+    QtGui.QPainter.CompositionMode_ColorDodge: 'color-dodge',
+    QtGui.QPainter.CompositionMode_ColorBurn: 'color-burn',
+    QtGui.QPainter.CompositionMode_HardLight: 'hard-light',
+    QtGui.QPainter.CompositionMode_SoftLight: 'soft-light',
+    QtGui.QPainter.CompositionMode_Difference: 'difference',
+    QtGui.QPainter.CompositionMode_Exclusion: 'exclusion',
+}
+# By Text alignment.
+SVG_TEXT_ANCHORS = [
+    'start', 'end', 'middle',
+    'start', 'middle', 'end',
+    'start', 'middle', 'end']
+SVG_TEXT_BASELINES = (
+    ['hanging'] * 3 + ['central'] * 3 + ['text-after-edge'] * 3)
+
+
+def document_images(model):
+    """
+    Return the comparing images and the base image with their rects, in the
+    canvas drawing order. In the stacked layout, the images are cropped to
+    their wipes (the svg clip paths aren't supported by every reader).
+    """
+    rects = model.images_layout().rects()
+    if model.imagestack_layout != RetakeCanvasModel.STACKED:
+        images = model.imagestack + [model.baseimage]
+        return [
+            (image, rect) for image, rect in zip(images, rects)
+            if not image.isNull()]
+    images = list(reversed(model.imagestack)) + [model.baseimage]
+    wipes = model.imagestack_wipes + [model.baseimage_wipes]
+    result = []
+    for image, rect, wipe in zip(images, rects, wipes):
+        # The wipes are in the image units, like in canvas.draw_images.
+        wipe = QtCore.QRectF(wipe).intersected(rect)
+        if image.isNull() or wipe.isEmpty():
+            continue
+        if wipe != rect:
+            scale_x = image.width() / rect.width()
+            scale_y = image.height() / rect.height()
+            source = QtCore.QRectF(
+                (wipe.left() - rect.left()) * scale_x,
+                (wipe.top() - rect.top()) * scale_y,
+                wipe.width() * scale_x, wipe.height() * scale_y)
+            image = image.copy(source.toAlignedRect())
+        result.append((image, wipe))
+    return result
+
+
+def document_wash(model):
+    """
+    Return the wash (color, rect) drawn over the base image or None.
+    """
+    if not model.wash_opacity:
+        return None
+    color = QtGui.QColor(model.wash_color)
+    color.setAlpha(model.wash_opacity)
+    return color, model.images_layout().baseimage_rect
+
+
+def visible_layers(model):
+    layerstack = model.layerstack
+    if layerstack.solo is not None:
+        layers = [layerstack[layerstack.solo]]
+    else:
+        layers = [layer for layer in layerstack if layer.visible]
+    for layer in layers:
+        yield layer.shapes, layer.blend_mode, layer.opacity
+
+
+def stroke_runs(stroke, tolerance=TOLERANCE):
+    """
+    Split the stroke in polylines of constant width.
+    Return list of (width, [points]). A segment takes the width of its end
+    point, like on the canvas.
+    """
+    data = decimate_stroke_points(stroke.points, tolerance)
+    runs = []
+    for previous, (point, size) in zip(data, data[1:]):
+        if runs and runs[-1][0] == size:
+            runs[-1][1].append(point)
+        else:
+            runs.append((size, [previous[0], point]))
+    return runs
+
+
+def stroke_paths(stroke, tolerance=TOLERANCE):
+    paths = []
+    for width, points in stroke_runs(stroke, tolerance):
+        path = QtGui.QPainterPath()
+        path.addPolygon(QtGui.QPolygonF(points))
+        paths.append((width, path))
+    return paths
+
+
+def arrow_head(arrow):
+    center = arrow.end
+    offset = arrow.headsize
+    triangle = QtGui.QPolygonF([
+        QtCore.QPointF(center.x() - offset, center.y() - offset),
+        QtCore.QPointF(center.x() + offset, center.y()),
+        QtCore.QPointF(center.x() - offset, center.y() + offset)])
+    transform = QtGui.QTransform()
+    transform.translate(center.x(), center.y())
+    transform.rotate(-arrow.line.angle())
+    transform.translate(-center.x(), -center.y())
+    return transform.map(triangle)
+
+
+def _number(value):
+    text = ('%.2f' % value).rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def _color(color, opacity_attribute, alpha=None):
+    color = QtGui.QColor(color)
+    alpha = color.alpha() if alpha is None else alpha
+    attribute = f'"{color.name()}"'
+    if alpha != 255:
+        attribute += f' {opacity_attribute}="{_number(alpha / 255)}"'
+    return attribute
+
+
+def _escape(text):
+    return (
+        text.replace('&', '&amp;').replace('<', '&lt;')
+        .replace('>', '&gt;').replace('"', '&quot;'))
+
+
+class SvgWriter:
+    """
+    Write the svg element by element in the output file. The images are
+    embedded as PNG once, then referenced.
+    """
+
+    def __init__(self, stream, tolerance=TOLERANCE):
+        self.stream = stream
+        self.tolerance = tolerance
+        self.image_ids = {}
+
+    def write(self, text):
+        self.stream.write(text)
+
+    def begin(self, rect):
+        viewbox = ' '.join(_number(v) for v in (
+            rect.left(), rect.top(), rect.width(), rect.height()))
+        self.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{_number(rect.width())}" '
+            f'height="{_number(rect.height())}" viewBox="{viewbox}">\n')
+
+    def end(self):
+        self.write('</svg>\n')
+
+    def begin_layer(self, blend_mode, opacity):
+        style = ''
+        if blend_mode in SVG_BLEND_MODES:
+            style = f' style="mix-blend-mode:{SVG_BLEND_MODES[blend_mode]}"'
+        if opacity != 255:
+            style += f' opacity="{_number(opacity / 255)}"'
+        self.write(f'<g{style}>\n')
+
+    def end_layer(self):
+        self.write('</g>\n')
+
+    def image(self, image, rect):
+        if image.isNull():
+            return
+        key = image.cacheKey()
+        if key not in self.image_ids:
+            image_id = f'image{len(self.image_ids)}'
+            self.image_ids[key] = image_id
+            data = QtCore.QByteArray()
+            buffer = QtCore.QBuffer(data)
+            buffer.open(QtCore.QIODevice.WriteOnly)
+            image.save(buffer, 'PNG')
+            encoded = base64.b64encode(bytes(data)).decode('ascii')
+            self.write(
+                f'<defs><image id="{image_id}" '
+                f'width="{image.width()}" height="{image.height()}" '
+                'preserveAspectRatio="none" '
+                f'xlink:href="data:image/png;base64,{encoded}"/></defs>\n')
+        sx = rect.width() / image.width()
+        sy = rect.height() / image.height()
+        self.write(
+            f'<use xlink:href="#{self.image_ids[key]}" transform="'
+            f'translate({_number(rect.left())} {_number(rect.top())}) '
+            f'scale({sx} {sy})"/>\n')
+
+    def rect(self, rect):
+        """
+        Return an unclosed rect element, to complete with attributes.
+        """
+        return (
+            f'<rect x="{_number(rect.left())}" y="{_number(rect.top())}" '
+            f'width="{_number(rect.width())}" '
+            f'height="{_number(rect.height())}"')
+
+    def wash(self, color, rect):
+        fill = _color(color, 'fill-opacity')
+        self.write(f'{self.rect(rect)} fill={fill}/>\n')
+
+    def polyline(self, points):
+        # Relative coordinates computed from the rounded absolute coordinates
+        # to avoid error accumulation.
+        coordinates = [(round(p.x(), 2), round(p.y(), 2)) for p in points]
+        x, y = coordinates[0]
+        data = [f'M{_number(x)} {_number(y)}l']
+        for nx, ny in coordinates[1:]:
+            data.append(f'{_number(nx - x)} {_number(ny - y)}')
+            x, y = nx, ny
+        return ' '.join(data)
+
+    def shape(self, shape):
+        if isinstance(shape, Stroke):
+            return self.stroke(shape)
+        if isinstance(shape, Bitmap):
+            return self.image(shape.image, shape.rect)
+        if isinstance(shape, Raster):
+            for key, tile in shape.tiles.items():
+                self.image(tile, QtCore.QRectF(shape.tile_rect(key)))
+            return
+        if not shape.is_valid:
+            return
+        if isinstance(shape, Text):
+            return self.text(shape)
+        if isinstance(shape, Rectangle):
+            return self.rectangle(shape)
+        if isinstance(shape, Line):
+            return self.line(shape)
+        if isinstance(shape, Arrow):
+            return self.arrow(shape)
+
+    def stroke(self, stroke):
+        runs = stroke_runs(stroke, self.tolerance)
+        if not runs:
+            return
+        self.write(
+            f'<g fill="none" stroke={_color(stroke.color, "stroke-opacity")} '
+            'stroke-linecap="round" stroke-linejoin="round">')
+        for width, points in runs:
+            self.write(
+                f'<path stroke-width="{_number(width)}" '
+                f'd="{self.polyline(points)}"/>')
+        self.write('</g>\n')
+
+    def rectangle(self, shape):
+        rect = QtCore.QRectF(shape.start, shape.end).normalized()
+        fill = '"none"'
+        if shape.filled:
+            fill = _color(shape.bgcolor, 'fill-opacity', shape.bgopacity)
+        stroke = _color(shape.color, 'stroke-opacity')
+        width = _number(shape.linewidth)
+        if isinstance(shape, Circle):
+            self.write(
+                f'<ellipse cx="{_number(rect.center().x())}" '
+                f'cy="{_number(rect.center().y())}" '
+                f'rx="{_number(rect.width() / 2)}" '
+                f'ry="{_number(rect.height() / 2)}" fill={fill} '
+                f'stroke={stroke} stroke-width="{width}"/>\n')
+            return
+        self.write(
+            f'<rect x="{_number(rect.left())}" y="{_number(rect.top())}" '
+            f'width="{_number(rect.width())}" '
+            f'height="{_number(rect.height())}" fill={fill} '
+            f'stroke={stroke} stroke-width="{width}" '
+            'stroke-linejoin="miter"/>\n')
+
+    def line(self, shape):
+        stroke = _color(shape.color, 'stroke-opacity')
+        self.write(
+            f'<path fill="none" stroke={stroke} '
+            f'stroke-width="{_number(shape.linewidth)}" '
+            f'stroke-linecap="round" '
+            f'd="{self.polyline([shape.start, shape.end])}"/>\n')
+
+    def arrow(self, shape):
+        color = _color(shape.color, 'stroke-opacity')
+        fill = _color(shape.color, 'fill-opacity')
+        head = self.polyline(list(arrow_head(shape))) + 'z'
+        self.write(
+            f'<g stroke={color} fill={fill} '
+            f'stroke-width="{_number(shape.tailwidth)}" '
+            'stroke-linecap="round" stroke-linejoin="miter">'
+            f'<path d="{self.polyline([shape.start, shape.end])}"/>'
+            f'<path d="{head}"/></g>\n')
+
+    def text(self, shape):
+        rect = QtCore.QRectF(shape.start, shape.end).normalized()
+        if shape.filled:
+            fill = _color(shape.bgcolor, 'fill-opacity', shape.bgopacity)
+            self.write(
+                f'<rect x="{_number(rect.left())}" y="{_number(rect.top())}" '
+                f'width="{_number(rect.width())}" '
+                f'height="{_number(rect.height())}" fill={fill}/>\n')
+        anchor = SVG_TEXT_ANCHORS[shape.alignment]
+        baseline = SVG_TEXT_BASELINES[shape.alignment]
+        x = {
+            'start': rect.left(),
+            'middle': rect.center().x(),
+            'end': rect.right()}[anchor]
+        y = {
+            'hanging': rect.top(),
+            'central': rect.center().y(),
+            'text-after-edge': rect.bottom()}[baseline]
+        # Same point size as on the canvas, the text is not wrapped.
+        size = shape.text_size * 10 * 96 / 72
+        self.write(
+            f'<text x="{_number(x)}" y="{_number(y)}" '
+            f'font-size="{_number(size)}" text-anchor="{anchor}" '
+            f'dominant-baseline="{baseline}" '
+            f'fill={_color(shape.color, "fill-opacity")}>'
+            f'{_escape(shape.text)}</text>\n')
+
+
+def export_svg(model, path, images=True, tolerance=TOLERANCE):
+    """
+    images: include the base image, the comparing images and the wash.
+    """
+    with open(path, 'w', encoding='utf-8') as stream:
+        writer = SvgWriter(stream, tolerance)
+        writer.begin(render_rect(model))
+        wash = document_wash(model)
+        if images:
+            for image, rect in document_images(model):
+                writer.image(image, rect)
+            if wash is not None:
+                writer.wash(*wash)
+        for layer, blend_mode, opacity in visible_layers(model):
+            writer.begin_layer(blend_mode, opacity)
+            for shape in layer:
+                writer.shape(shape)
+            writer.end_layer()
+        writer.end()
+
+
+def draw_vector_stroke(painter, stroke, tolerance=TOLERANCE):
+    pen = QtGui.QPen(QtGui.QColor(stroke.color))
+    pen.setCapStyle(QtCore.Qt.RoundCap)
+    pen.setJoinStyle(QtCore.Qt.RoundJoin)
+    painter.setBrush(QtCore.Qt.NoBrush)
+    for width, path in stroke_paths(stroke, tolerance):
+        pen.setWidthF(width)
+        painter.setPen(pen)
+        painter.drawPath(path)
+
+
+def export_pdf(model, path, images=True, tolerance=TOLERANCE):
+    """
+    One PDF point per unit. Qt PDF engine embeds each image once and only
+    supports the normal blend mode.
+    images: include the base image, the comparing images and the wash.
+    """
+    rect = render_rect(model)
+    writer = QtGui.QPdfWriter(path)
+    writer.setResolution(72)
+    writer.setPageSize(QtGui.QPageSize(rect.size(), QtGui.QPageSize.Point))
+    writer.setPageMargins(QtCore.QMarginsF(0, 0, 0, 0))
+    viewportmapper = ViewportMapper()
+    viewportmapper.origin = rect.topLeft()
+    painter = QtGui.QPainter(writer)
+    painter.setRenderHint(QtGui.QPainter.Antialiasing)
+    try:
+        wash = document_wash(model)
+        if images:
+            for image, image_rect in document_images(model):
+                image_rect = viewportmapper.to_viewport_rect(image_rect)
+                painter.drawImage(image_rect, image)
+            if wash is not None:
+                color, wash_rect = wash
+                wash_rect = viewportmapper.to_viewport_rect(wash_rect)
+                painter.fillRect(wash_rect, color)
+        for layer, blend_mode, opacity in visible_layers(model):
+            painter.setOpacity(opacity / 255)
+            painter.setCompositionMode(blend_mode)
+            for shape in layer:
+                if not isinstance(shape, Stroke):
+                    draw_shape_element(painter, shape, viewportmapper)
+                    continue
+                painter.save()
+                painter.translate(-rect.left(), -rect.top())
+                draw_vector_stroke(painter, shape, tolerance)
+                painter.restore()
+        painter.setOpacity(1)
+    finally:
+        painter.end()
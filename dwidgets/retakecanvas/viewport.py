@@ -1,4 +1,4 @@
-from PySide2 import QtCore
+from PySide2 import QtCore, QtGui
 
 
 class ViewportMapper():
@@ -43,6 +43,14 @@ class ViewportMapper():
         height = self.to_units(pixels_rect.height())
         return QtCore.QRectF(top_left.x(), top_left.y(), width, height)
 
+    def to_viewport_transform(self):
+        """
+        QTransform version of to_viewport_coords. Useful to map big polygons
+        in one call.
+        """
+        return QtGui.QTransform(
+            self.zoom, 0, 0, self.zoom, -self.origin.x(), -self.origin.y())
+
     def zoomin(self, factor=10.0):
         self.zoom += self.zoom * factor
         self.zoom = min(self.zoom, 5.0)
@@ -0,0 +1,59 @@
+from PySide2 import QtCore
+from dwidgets.retakecanvas.shapes import (
+    Circle, Line, Rectangle, ShapeList, Stroke)
+
+
+def create_shapes():
+    point = QtCore.QPointF()
+    return [
+        Stroke(point, 'red', 1),
+        Rectangle(point, 'red', 'red', 255, 1, False),
+        Circle(point, 'red', 'red', 255, 1, False),
+        Line(point, 'red', 1),
+        Stroke(point, 'red', 1)]
+
+
+def assert_indexed(shapes):
+    for classes in ((Stroke, ), (Rectangle, ), (Circle, ), (Stroke, Line)):
+        expected = {
+            id(shape) for shape in shapes if isinstance(shape, classes)}
+        result = [id(shape) for shape in shapes.of_type(*classes)]
+        assert len(result) == len(expected)
+        assert set(result) == expected
+
+
+def test_of_type_follows_the_list_methods():
+    shapes = ShapeList(create_shapes())
+    assert_indexed(shapes)
+    shapes.append(Line(QtCore.QPointF(), 'red', 1))
+    assert_indexed(shapes)
+    shapes.extend(create_shapes())
+    assert_indexed(shapes)
+    shapes += create_shapes()
+    assert_indexed(shapes)
+    shapes.insert(0, Stroke(QtCore.QPointF(), 'red', 1))
+    assert_indexed(shapes)
+    shapes.remove(shapes[3])
+    assert_indexed(shapes)
+    shapes.pop()
+    shapes.pop(0)
+    assert_indexed(shapes)
+    shapes[1] = Circle(QtCore.QPointF(), 'red', 'red', 255, 1, False)
+    assert_indexed(shapes)
+    shapes[2:5] = create_shapes()
+    assert_indexed(shapes)
+    shapes[::4] = create_shapes()[:len(shapes[::4])]
+    assert_indexed(shapes)
+    del shapes[0]
+    assert_indexed(shapes)
+    del shapes[1:4]
+    assert_indexed(shapes)
+    shapes.clear()
+    assert_indexed(shapes)
+    assert not shapes.of_type(Stroke)
+
+
+def test_of_type_includes_subclasses():
+    shapes = ShapeList(create_shapes())
+    assert len(shapes.of_type(Rectangle)) == 2
+    assert len(shapes.of_type(Circle)) == 1